@@ -0,0 +1,33 @@
+import contextlib
+import os
+import sys
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+
+@contextlib.contextmanager
+def banco_de_teste(arquivo=None):
+    # Configura o Django e cria um banco descartável (o mesmo usado por `manage.py test`).
+    # `arquivo` grava o banco de teste em disco em vez de na memória, para que várias
+    # threads (servidor de carga) compartilhem o mesmo SQLite.
+    sys.path.insert(0, str(RAIZ))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gerador_provas.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('GROQ_API_KEY', 'benchmark')
+
+    import django
+    django.setup()
+
+    from django.db import connections
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+    if arquivo is not None:
+        connections['default'].settings_dict['TEST']['NAME'] = str(arquivo)
+    setup_test_environment()
+    configuracao = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(configuracao, verbosity=0)
+        teardown_test_environment()
@@ -0,0 +1,142 @@
+"""Vazão de escrita concorrente de provas em cada perfil de banco (DB_PERFIL).
+
+    python -m benchmarks.bench_escrita [--perfis sqlite,sqlite-padrao] [--threads 8] [--provas 25] [--json]
+
+Cada thread grava `--provas` provas de `--questoes` questões com persistir_questoes
+(a mesma transação de POST /api/gerar-prova/), todas ao mesmo tempo. Perfis:
+
+*   sqlite: WAL, synchronous=NORMAL, BEGIN IMMEDIATE e busy_timeout (o padrão de settings);
+*   sqlite-padrao: o SQLite sem ajustes (journal em rollback, BEGIN adiado, timeout de 5s);
+*   postgres: precisa de um servidor (POSTGRES_* no ambiente) e de permissão para criar o banco de teste.
+
+Cada perfil roda em um processo próprio, porque o banco é escolhido na leitura das settings.
+O resultado tem provas por segundo, latência p50/p95 de cada gravação e quantas falharam
+(ex.: "database is locked").
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from .ambiente import RAIZ, banco_de_teste
+from .bench_persistencia import questoes_falsas
+
+PERFIS = {
+    'sqlite': {'DB_PERFIL': 'sqlite', 'SQLITE_AJUSTES': 'true'},
+    'sqlite-padrao': {'DB_PERFIL': 'sqlite', 'SQLITE_AJUSTES': 'false'},
+    'postgres': {'DB_PERFIL': 'postgres'},
+}
+
+
+def gravar(provas, questoes, barreira, tempos, erros):
+    from django.db import connection
+    from provas.geracao import persistir_questoes
+    from provas.models import CriteriosProva
+
+    barreira.wait()
+    try:
+        for _ in range(provas):
+            criterios = CriteriosProva(tema='Teste', quantidade_questoes=len(questoes), tipos_questoes='multipla_escolha')
+            inicio = time.perf_counter()
+            try:
+                persistir_questoes(criterios, [], questoes)
+            except Exception as e:
+                erros.append(type(e).__name__ + ': ' + str(e))
+                continue
+            tempos.append(time.perf_counter() - inicio)
+    finally:
+        connection.close()
+
+
+def medir(args):
+    from django.db import connection
+    from provas.roteamento import percentil
+
+    questoes = questoes_falsas(args.questoes)
+    tempos, erros = [], []
+    barreira = threading.Barrier(args.threads)
+    threads = [
+        threading.Thread(target=gravar, args=(args.provas, questoes, barreira, tempos, erros))
+        for _ in range(args.threads)
+    ]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duracao = time.perf_counter() - inicio
+
+    resultado = {
+        'vendor': connection.vendor,
+        'provas_gravadas': len(tempos),
+        'falhas': len(erros),
+        'provas_por_segundo': round(len(tempos) / duracao, 1),
+        'p50_ms': round(statistics.median(tempos) * 1000, 1) if tempos else None,
+        'p95_ms': round(percentil(tempos, 95) * 1000, 1) if tempos else None,
+        'exemplo_falha': erros[0] if erros else None,
+    }
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            resultado['journal_mode'] = cursor.fetchone()[0]
+        connection.close()
+    return resultado
+
+
+def rodar_perfil(args):
+    # Processo filho: o ambiente já tem as variáveis do perfil
+    if os.environ['DB_PERFIL'] == 'sqlite':
+        with tempfile.TemporaryDirectory() as diretorio, banco_de_teste(Path(diretorio) / 'escrita.sqlite3'):
+            return medir(args)
+    with banco_de_teste():
+        return medir(args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--perfis', default='sqlite,sqlite-padrao', help="Separados por vírgula: " + ', '.join(PERFIS))
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--provas', type=int, default=25, help="Provas gravadas por thread")
+    parser.add_argument('--questoes', type=int, default=10, help="Questões por prova")
+    parser.add_argument('--json', action='store_true', help="Imprime o resultado em JSON")
+    parser.add_argument('--filho', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.environ['PROVAS_PDF_PRE_RENDERIZAR'] = 'false'  # Só o banco entra na medida
+
+    if args.filho:
+        print(json.dumps(rodar_perfil(args)))
+        return
+
+    resultados = {}
+    for perfil in args.perfis.split(','):
+        ambiente = {**os.environ, **PERFIS[perfil]}
+        comando = [
+            sys.executable, '-m', 'benchmarks.bench_escrita', '--filho', '--threads', str(args.threads),
+            '--provas', str(args.provas), '--questoes', str(args.questoes),
+        ]
+        processo = subprocess.run(comando, env=ambiente, cwd=RAIZ, capture_output=True, text=True)
+        if processo.returncode != 0:
+            resultados[perfil] = {'erro': processo.stderr.strip().splitlines()[-1:]}
+            continue
+        resultados[perfil] = json.loads(processo.stdout.strip().splitlines()[-1])
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+    print(f"{'perfil':>14} | {'provas/s':>9} | {'p50 ms':>8} | {'p95 ms':>8} | {'falhas':>6}")
+    for perfil, r in resultados.items():
+        if 'erro' in r:
+            print(f"{perfil:>14} | erro: {' '.join(r['erro'])}")
+            continue
+        print(f"{perfil:>14} | {r['provas_por_segundo']:>9} | {r['p50_ms']:>8} | {r['p95_ms']:>8} | {r['falhas']:>6}")
+
+
+if __name__ == '__main__':
+    main()
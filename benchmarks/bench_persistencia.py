@@ -0,0 +1,98 @@
+"""Compara a gravação de uma prova linha a linha com a gravação em lote.
+
+    python -m benchmarks.bench_persistencia [--repeticoes 20] [--json]
+
+Para 10, 50 e 200 questões mede a quantidade de comandos SQL e a latência
+(mediana) de gravar questões, itens e gabarito.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from .ambiente import banco_de_teste
+
+TAMANHOS = (10, 50, 200)
+
+
+def questoes_falsas(n):
+    return [
+        {
+            'tipo': 'multipla_escolha',
+            'enunciado': f'Enunciado da questão {i}',
+            'opcoes': ['A', 'B', 'C', 'D'],
+            'resposta': 'B',
+            'nivel_dificuldade': 'lembrar',
+        }
+        for i in range(n)
+    ]
+
+
+def persistir_linha_a_linha(criterios, questoes_geradas):
+    # Como GerarProvaView gravava antes: um INSERT por questão, sem transação,
+    # e o gabarito montado a partir de uma nova consulta
+    from provas.models import Gabarito, ItemProva, Questao
+
+    criterios.save()
+    for ordem, questao_data in enumerate(questoes_geradas):
+        questao = Questao.objects.create(tema='teste', **questao_data)
+        ItemProva.objects.create(prova=criterios, questao=questao, ordem=ordem)
+    respostas = {str(questao.id): questao.resposta for questao in criterios.questoes.all()}
+    Gabarito.objects.create(prova=criterios, respostas=respostas)
+
+
+def persistir_em_lote(criterios, questoes_geradas):
+    from provas.geracao import persistir_questoes
+
+    persistir_questoes(criterios, [], questoes_geradas)
+
+
+def medir(estrategia, n, repeticoes):
+    from django.db import connection, reset_queries
+    from django.test.utils import CaptureQueriesContext
+    from provas.models import CriteriosProva
+
+    questoes = questoes_falsas(n)
+    tempos = []
+    comandos = None
+    for _ in range(repeticoes):
+        criterios = CriteriosProva(tema='Teste', quantidade_questoes=n, tipos_questoes='multipla_escolha')
+        reset_queries()  # O log guarda no máximo 9000 comandos; cheio, a contagem daria zero
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            estrategia(criterios, questoes)
+            tempos.append(time.perf_counter() - inicio)
+        comandos = len(consultas)
+    return {'comandos_sql': comandos, 'latencia_ms': round(statistics.median(tempos) * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--json', action='store_true', help="Imprime o resultado em JSON")
+    args = parser.parse_args()
+
+    os.environ['PROVAS_PDF_PRE_RENDERIZAR'] = 'false'  # Só a gravação entra na medida
+    resultados = []
+    with banco_de_teste():
+        for n in TAMANHOS:
+            resultados.append({
+                'questoes': n,
+                'linha_a_linha': medir(persistir_linha_a_linha, n, args.repeticoes),
+                'em_lote': medir(persistir_em_lote, n, args.repeticoes),
+            })
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+    print(f"{'questões':>9} | {'SQL antes':>9} | {'SQL agora':>9} | {'ms antes':>9} | {'ms agora':>9}")
+    for r in resultados:
+        print(
+            f"{r['questoes']:>9} | {r['linha_a_linha']['comandos_sql']:>9} | {r['em_lote']['comandos_sql']:>9} | "
+            f"{r['linha_a_linha']['latencia_ms']:>9} | {r['em_lote']['latencia_ms']:>9}"
+        )
+
+
+if __name__ == '__main__':
+    main()
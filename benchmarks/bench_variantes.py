@@ -0,0 +1,63 @@
+"""Tempo para derivar variantes de uma prova (GET /api/provas/{id}/variantes/).
+
+    python -m benchmarks.bench_variantes [--variantes 1000] [--questoes 50] [--repeticoes 20] [--json]
+
+Mede, em mediana, o sorteio das permutações (NumPy) e a montagem das variantes com
+gabarito, para uma prova com metade das questões de múltipla escolha (4 opções).
+"""
+import argparse
+import json
+import statistics
+import time
+
+from .ambiente import banco_de_teste
+
+
+def questoes_falsas(n):
+    return [
+        {'id': i, 'tipo': 'multipla_escolha', 'enunciado': f'Questão {i}', 'opcoes': ['A', 'B', 'C', 'D'], 'resposta': 'B'}
+        if i % 2 == 0 else
+        {'id': i, 'tipo': 'verdadeiro_falso', 'enunciado': f'Questão {i}', 'opcoes': None, 'resposta': 'V'}
+        for i in range(n)
+    ]
+
+
+def mediana_ms(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return round(statistics.median(tempos) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--variantes', type=int, default=1000)
+    parser.add_argument('--questoes', type=int, default=50)
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--json', action='store_true', help="Imprime o resultado em JSON")
+    args = parser.parse_args()
+
+    with banco_de_teste():
+        from provas import variantes
+
+        questoes = questoes_falsas(args.questoes)
+        alternativas = [4 if q['opcoes'] else 0 for q in questoes]
+        corretas = [1 if q['opcoes'] else -1 for q in questoes]
+        resultado = {
+            'variantes': args.variantes,
+            'questoes': args.questoes,
+            'sorteio_ms': mediana_ms(lambda: variantes.sortear(args.variantes, alternativas, corretas, 1), args.repeticoes),
+            'total_ms': mediana_ms(lambda: variantes.gerar(questoes, {}, args.variantes, 1), args.repeticoes),
+        }
+
+    if args.json:
+        print(json.dumps(resultado, indent=2))
+        return
+    print(f"{resultado['variantes']} variantes de {resultado['questoes']} questões: "
+          f"sorteio {resultado['sorteio_ms']} ms, com montagem e gabaritos {resultado['total_ms']} ms")
+
+
+if __name__ == '__main__':
+    main()
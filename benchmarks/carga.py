@@ -0,0 +1,301 @@
+"""Teste de carga da API com um mix de requisições autenticadas por JWT.
+
+    python -m benchmarks.carga [--requisicoes 300] [--concorrencia 8] [--mix gerar=1,prova=6,gabarito=3]
+                               [--latencia-ms 300] [--tokens-por-segundo 500] [--taxa-erro 0.0]
+                               [--latencia-modelo NOME=MS ...]
+                               [--saida resultado.json]
+
+Sem `--url`, sobe tudo localmente: um banco de teste descartável, a aplicação
+num servidor WSGI com threads e o Groq falso (benchmarks.groq_falso). Cada
+resposta traz a quantidade de comandos SQL executados, contada no servidor.
+
+Com `--url http://host:8000 --usuario u --senha s`, mede um servidor já no ar
+(que precisa estar apontado para um Groq falso ou real); nesse caso as
+contagens de SQL não estão disponíveis.
+
+O resultado é um JSON com latências p50/p95/p99, requisições por segundo e
+consultas SQL por endpoint, para comparar entre commits.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import httpx
+
+from . import groq_falso
+from .ambiente import RAIZ, banco_de_teste
+
+CABECALHO_CONSULTAS = 'X-Consultas-SQL'
+TIPOS_QUESTOES = ['multipla_escolha', 'dissertativa', 'verdadeiro_falso']
+
+
+# --- Servidor local ---
+
+class ServidorWSGIComThreads(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class ManipuladorSilencioso(WSGIRequestHandler):
+    def log_message(self, formato, *args):
+        pass
+
+
+def contar_consultas(aplicacao):
+    # Envolve a aplicação WSGI e devolve no cabeçalho quantos comandos SQL a requisição executou
+    from django.db import connection
+
+    def aplicacao_contada(environ, start_response):
+        contador = [0]
+
+        def contar(execute, sql, params, many, context):
+            contador[0] += 1
+            return execute(sql, params, many, context)
+
+        def start_response_contado(status, cabecalhos, exc_info=None):
+            cabecalhos = [*cabecalhos, (CABECALHO_CONSULTAS, str(contador[0]))]
+            return start_response(status, cabecalhos, exc_info)
+
+        with connection.execute_wrapper(contar):
+            resposta = aplicacao(environ, start_response_contado)
+            # O corpo é consumido aqui para que streams também sejam contados
+            corpo = list(resposta)
+        if hasattr(resposta, 'close'):
+            resposta.close()
+        return corpo
+
+    return aplicacao_contada
+
+
+def iniciar_aplicacao():
+    from django.conf import settings
+    from django.core.wsgi import get_wsgi_application
+
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, '127.0.0.1']
+    servidor = make_server(
+        '127.0.0.1', 0, contar_consultas(get_wsgi_application()),
+        server_class=ServidorWSGIComThreads, handler_class=ManipuladorSilencioso,
+    )
+    threading.Thread(target=servidor.serve_forever, name='aplicacao', daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+def criar_usuario():
+    from django.contrib.auth.models import User
+
+    User.objects.create_user(username='carga', password='carga')
+    return 'carga', 'carga'
+
+
+# --- Cliente ---
+
+class Carga:
+    def __init__(self, url, usuario, senha, mix, quantidade_questoes, semente):
+        self.url = url.rstrip('/')
+        self.mix = mix
+        self.quantidade_questoes = quantidade_questoes
+        self.aleatorio = random.Random(semente)
+        self.lock = threading.Lock()
+        self.provas = []
+        self.amostras = []
+        self.sequencia = itertools.count()
+        resposta = httpx.post(f"{self.url}/api/token/", json={'username': usuario, 'password': senha})
+        resposta.raise_for_status()
+        self.cabecalhos = {'Authorization': f"Bearer {resposta.json()['access']}"}
+
+    def sortear(self):
+        with self.lock:
+            nome = self.aleatorio.choices(list(self.mix), weights=list(self.mix.values()))[0]
+            if nome != 'gerar' and not self.provas:
+                nome = 'gerar'
+            prova_id = self.aleatorio.choice(self.provas) if self.provas else None
+            numero = next(self.sequencia)
+        return nome, prova_id, numero
+
+    def executar(self, cliente, nome, prova_id, numero):
+        if nome == 'gerar':
+            dados = {
+                'tema': f"Tema de carga {numero}",  # Temas distintos: sem acertos no cache de gerações
+                'dificuldade': 'lembrar',
+                'quantidade_questoes': self.quantidade_questoes,
+                'tipos_questoes': TIPOS_QUESTOES[numero % len(TIPOS_QUESTOES)],
+            }
+            return cliente.post('/api/gerar-prova/', json=dados)
+        if nome == 'prova':
+            return cliente.get(f'/api/provas/{prova_id}/')
+        return cliente.get(f'/api/gabarito/{prova_id}/')
+
+    def registrar(self, nome, inicio, resposta):
+        duracao = time.perf_counter() - inicio
+        consultas = resposta.headers.get(CABECALHO_CONSULTAS) if resposta is not None else None
+        with self.lock:
+            self.amostras.append({
+                'endpoint': nome,
+                'status': resposta.status_code if resposta is not None else None,
+                'latencia': duracao,
+                'consultas': int(consultas) if consultas is not None else None,
+            })
+            if nome == 'gerar' and resposta is not None and resposta.status_code == 201:
+                self.provas.append(resposta.json()['id'])
+
+    def trabalhar(self, restantes):
+        with httpx.Client(base_url=self.url, headers=self.cabecalhos, timeout=120) as cliente:
+            while True:
+                with self.lock:
+                    if restantes[0] <= 0:
+                        return
+                    restantes[0] -= 1
+                nome, prova_id, numero = self.sortear()
+                inicio = time.perf_counter()
+                try:
+                    resposta = self.executar(cliente, nome, prova_id, numero)
+                except httpx.HTTPError:
+                    resposta = None
+                self.registrar(nome, inicio, resposta)
+
+    def rodar(self, requisicoes, concorrencia):
+        restantes = [requisicoes]
+        threads = [threading.Thread(target=self.trabalhar, args=(restantes,)) for _ in range(concorrencia)]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - inicio
+
+
+# --- Relatório ---
+
+def percentil(valores, p):
+    # Nearest-rank sobre os valores ordenados
+    ordenados = sorted(valores)
+    indice = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[indice]
+
+
+def resumir(amostras, duracao):
+    resumo = {}
+    for nome in sorted({a['endpoint'] for a in amostras}):
+        grupo = [a for a in amostras if a['endpoint'] == nome]
+        latencias = [a['latencia'] * 1000 for a in grupo]
+        consultas = [a['consultas'] for a in grupo if a['consultas'] is not None]
+        resumo[nome] = {
+            'requisicoes': len(grupo),
+            'erros': sum(1 for a in grupo if a['status'] is None or a['status'] >= 400),
+            'requisicoes_por_segundo': round(len(grupo) / duracao, 2),
+            'latencia_ms': {
+                'p50': round(percentil(latencias, 50), 2),
+                'p95': round(percentil(latencias, 95), 2),
+                'p99': round(percentil(latencias, 99), 2),
+                'media': round(statistics.mean(latencias), 2),
+            },
+            'consultas_sql': {
+                'media': round(statistics.mean(consultas), 2),
+                'max': max(consultas),
+            } if consultas else None,
+        }
+    return resumo
+
+
+def commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ler_mix(texto):
+    mix = {}
+    for parte in texto.split(','):
+        nome, peso = parte.split('=')
+        if nome not in ('gerar', 'prova', 'gabarito'):
+            raise argparse.ArgumentTypeError(f"endpoint desconhecido no mix: {nome}")
+        mix[nome] = float(peso)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requisicoes', type=int, default=300)
+    parser.add_argument('--concorrencia', type=int, default=8)
+    parser.add_argument('--mix', type=ler_mix, default=ler_mix('gerar=1,prova=6,gabarito=3'))
+    parser.add_argument('--quantidade-questoes', type=int, default=10, help="Questões por prova gerada")
+    parser.add_argument('--provas-iniciais', type=int, default=5, help="Provas geradas antes da medição")
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--latencia-ms', type=float, default=300, help="Groq falso: espera antes da resposta")
+    parser.add_argument('--tokens-por-segundo', type=float, default=500, help="Groq falso: ritmo de geração")
+    parser.add_argument('--taxa-erro', type=float, default=0.0, help="Groq falso: fração de respostas 500")
+    parser.add_argument('--latencia-modelo', action='append', default=[], metavar='NOME=MS',
+                        help="Groq falso: latência própria de um modelo (com LLM_MODELOS, para medir o hedge)")
+    parser.add_argument('--url', help="Servidor já no ar (sem isso, sobe um local)")
+    parser.add_argument('--usuario')
+    parser.add_argument('--senha')
+    parser.add_argument('--saida', help="Arquivo para o JSON (padrão: saída padrão)")
+    args = parser.parse_args()
+
+    configuracao_groq = None
+    if args.url:
+        resultado = medir(args, args.url, args.usuario, args.senha)
+    else:
+        latencia_por_modelo = {nome: float(ms) for nome, ms in (item.rsplit('=', 1) for item in args.latencia_modelo)}
+        configuracao_groq = groq_falso.Configuracao(args.latencia_ms, args.tokens_por_segundo, args.taxa_erro,
+                                                    args.semente, latencia_por_modelo=latencia_por_modelo)
+        servidor_groq = groq_falso.iniciar_em_thread(configuracao_groq)
+        os.environ['GROQ_BASE_URL'] = groq_falso.url_base(servidor_groq)  # Lido pelo SDK ao criar o cliente
+        with tempfile.TemporaryDirectory() as diretorio, banco_de_teste(Path(diretorio) / 'carga.sqlite3'):
+            servidor, url = iniciar_aplicacao()
+            try:
+                resultado = medir(args, url, *criar_usuario())
+            finally:
+                servidor.shutdown()
+        servidor_groq.shutdown()
+        resultado['groq_falso'] = {
+            'latencia_ms': args.latencia_ms,
+            'latencia_por_modelo': latencia_por_modelo,
+            'tokens_por_segundo': args.tokens_por_segundo,
+            'taxa_erro': args.taxa_erro,
+            'chamadas': configuracao_groq.chamadas,
+            'erros': configuracao_groq.erros,
+        }
+
+    saida = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.saida:
+        Path(args.saida).write_text(saida + '\n', encoding='utf-8')
+    else:
+        print(saida)
+
+
+def medir(args, url, usuario, senha):
+    carga = Carga(url, usuario, senha, args.mix, args.quantidade_questoes, args.semente)
+    if args.provas_iniciais:
+        # Aquecimento: só gerações, para haver provas a ler; não entra na medição
+        carga.mix = {'gerar': 1}
+        carga.rodar(args.provas_iniciais, min(args.provas_iniciais, args.concorrencia))
+        carga.mix = args.mix
+        carga.amostras = []
+    duracao = carga.rodar(args.requisicoes, args.concorrencia)
+    return {
+        'commit': commit_atual(),
+        'url': args.url or 'local',
+        'requisicoes': len(carga.amostras),
+        'concorrencia': args.concorrencia,
+        'mix': args.mix,
+        'duracao_s': round(duracao, 3),
+        'requisicoes_por_segundo': round(len(carga.amostras) / duracao, 2),
+        'endpoints': resumir(carga.amostras, duracao),
+    }
+
+
+if __name__ == '__main__':
+    main()
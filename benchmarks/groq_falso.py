@@ -0,0 +1,256 @@
+"""Servidor local que imita a API de chat completions do Groq.
+
+    python -m benchmarks.groq_falso [--porta 8765] [--latencia-ms 300] [--tokens-por-segundo 500]
+                                    [--taxa-erro 0.0] [--status-erro 500] [--retry-after S]
+                                    [--taxa-travamento 0.0] [--travamento-ms 30000] [--semente 0]
+                                    [--latencia-modelo NOME=MS ...]
+
+Aponte a aplicação para ele com GROQ_BASE_URL=http://127.0.0.1:8765 (o SDK do
+Groq lê essa variável). Responde POST /openai/v1/chat/completions com a
+quantidade e os tipos de questões pedidos no prompt, com ou sem streaming:
+
+*   latência: espera antes do primeiro byte (por modelo com --latencia-modelo, para
+    exercitar o roteamento e o hedge entre modelos);
+*   tokens por segundo: ritmo de geração do texto (no streaming, entre os pedaços);
+*   taxa de erro: fração das chamadas respondidas com erro (500, ou --status-erro),
+    com Retry-After se --retry-after for dado;
+*   taxa de travamento: fração das chamadas que não respondem por --travamento-ms
+    e então fecham a conexão, como um provedor pendurado.
+
+Nos testes, `Configuracao(roteiro=[...])` fixa a resposta das primeiras chamadas:
+'ok', 'travar' ou um status HTTP de erro.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CAMINHO = '/openai/v1/chat/completions'
+CARACTERES_POR_TOKEN = 4
+TIPOS_POR_ROTULO = {
+    'Múltipla Escolha': 'multipla_escolha',
+    'Dissertativa': 'dissertativa',
+    'Verdadeiro/Falso': 'verdadeiro_falso',
+}
+
+
+class Configuracao:
+    def __init__(self, latencia_ms=300, tokens_por_segundo=500, taxa_erro=0.0, semente=0, status_erro=500,
+                 retry_after=None, taxa_travamento=0.0, travamento_ms=30000, roteiro=(), latencia_por_modelo=None):
+        self.latencia_ms = latencia_ms
+        self.latencia_por_modelo = dict(latencia_por_modelo or {})
+        self.tokens_por_segundo = tokens_por_segundo
+        self.taxa_erro = taxa_erro
+        self.status_erro = status_erro
+        self.retry_after = retry_after
+        self.taxa_travamento = taxa_travamento
+        self.travamento_ms = travamento_ms
+        self.roteiro = list(roteiro)
+        self.aleatorio = random.Random(semente)
+        self.lock = threading.Lock()
+        self.chamadas = 0
+        self.erros = 0
+        self.travamentos = 0
+        self.conexoes = 0
+
+    def sortear_acao(self):
+        # 'ok', 'travar' ou o status HTTP do erro a devolver
+        with self.lock:
+            self.chamadas += 1
+            if self.roteiro:
+                acao = self.roteiro.pop(0)
+            elif self.aleatorio.random() < self.taxa_travamento:
+                acao = 'travar'
+            elif self.aleatorio.random() < self.taxa_erro:
+                acao = self.status_erro
+            else:
+                acao = 'ok'
+            self.travamentos += acao == 'travar'
+            self.erros += isinstance(acao, int)
+            return acao
+
+    def latencia(self, modelo):
+        return self.latencia_por_modelo.get(modelo, self.latencia_ms) / 1000
+
+    def nova_conexao(self):
+        with self.lock:
+            self.conexoes += 1
+
+
+def questoes_do_prompt(prompt):
+    quantidade = int(re.search(r'Gere (\d+) questões', prompt).group(1))
+    tema = re.search(r"tema '([^']*)'", prompt)
+    tema = tema.group(1) if tema else 'geral'
+    tipos = [tipo for rotulo, tipo in TIPOS_POR_ROTULO.items() if rotulo in prompt] or ['dissertativa']
+    questoes = []
+    for i in range(quantidade):
+        tipo = tipos[i % len(tipos)]
+        # Enunciados distintos, para não serem descartados como duplicatas
+        questao = {'tipo': tipo, 'enunciado': f"Questão {i + 1} sobre {tema} ({uuid.uuid4().hex[:8]})",
+                   'nivel_dificuldade': 'lembrar'}
+        if tipo == 'multipla_escolha':
+            questao.update(opcoes=['Alternativa A', 'Alternativa B', 'Alternativa C', 'Alternativa D'], resposta='A')
+        elif tipo == 'verdadeiro_falso':
+            questao['resposta'] = 'Verdadeiro'
+        else:
+            questao['resposta'] = f"Resposta esperada para a questão {i + 1}."
+        questoes.append(questao)
+    return questoes
+
+
+def tokens(texto):
+    return max(1, len(texto) // CARACTERES_POR_TOKEN)
+
+
+class Manipulador(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    configuracao = None  # Definido por `criar_servidor`
+
+    def setup(self):
+        super().setup()
+        self.configuracao.nova_conexao()  # Com keep-alive, várias chamadas por conexão
+
+    def log_message(self, formato, *args):
+        pass  # Silencioso durante a carga
+
+    def do_POST(self):
+        tamanho = int(self.headers.get('Content-Length', 0))
+        corpo = json.loads(self.rfile.read(tamanho) or b'{}')
+        if self.path.rstrip('/') != CAMINHO:
+            return self.responder_json(404, {'error': {'message': 'Not found'}})
+        try:
+            self.responder(corpo)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # O cliente desistiu (timeout, perdedor de um hedge)
+
+    def responder(self, corpo):
+        configuracao = self.configuracao
+        time.sleep(configuracao.latencia(corpo.get('model')))
+        acao = configuracao.sortear_acao()
+        if acao == 'travar':
+            time.sleep(configuracao.travamento_ms / 1000)
+            self.close_connection = True  # Fecha sem responder
+            return
+        if acao != 'ok':
+            cabecalhos = {'Retry-After': str(configuracao.retry_after)} if configuracao.retry_after is not None else {}
+            return self.responder_json(acao, {'error': {'message': 'Erro simulado', 'type': 'erro_simulado'}},
+                                       cabecalhos)
+
+        prompt = '\n'.join(m.get('content', '') for m in corpo.get('messages', []))
+        conteudo = json.dumps({'questoes': questoes_do_prompt(prompt)}, ensure_ascii=False)
+        uso = {'prompt_tokens': tokens(prompt), 'completion_tokens': tokens(conteudo)}
+        uso['total_tokens'] = uso['prompt_tokens'] + uso['completion_tokens']
+        identificador = f"chatcmpl-{uuid.uuid4().hex}"
+        modelo = corpo.get('model', 'modelo-falso')
+
+        if corpo.get('stream'):
+            return self.responder_stream(identificador, modelo, conteudo, uso)
+
+        time.sleep(uso['completion_tokens'] / configuracao.tokens_por_segundo)
+        self.responder_json(200, {
+            'id': identificador,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': modelo,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': conteudo}, 'finish_reason': 'stop'}],
+            'usage': uso,
+        })
+
+    def responder_json(self, status, dados, cabecalhos=None):
+        corpo = json.dumps(dados, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def responder_stream(self, identificador, modelo, conteudo, uso):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        passo = CARACTERES_POR_TOKEN * 8  # ~8 tokens por pedaço
+        for inicio in range(0, len(conteudo), passo):
+            pedaco = conteudo[inicio:inicio + passo]
+            time.sleep(tokens(pedaco) / self.configuracao.tokens_por_segundo)
+            self.enviar_evento({
+                'id': identificador, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': modelo,
+                'choices': [{'index': 0, 'delta': {'content': pedaco}, 'finish_reason': None}],
+            })
+        self.enviar_evento({
+            'id': identificador, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': modelo,
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+            'x_groq': {'usage': uso},
+        })
+        self.enviar_pedaco(b'data: [DONE]\n\n')
+        self.enviar_pedaco(b'')
+
+    def enviar_evento(self, dados):
+        self.enviar_pedaco(f"data: {json.dumps(dados, ensure_ascii=False)}\n\n".encode())
+
+    def enviar_pedaco(self, dados):
+        self.wfile.write(f"{len(dados):x}\r\n".encode() + dados + b"\r\n")
+        self.wfile.flush()
+
+
+class Servidor(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return  # Cliente que fechou a conexão (timeout, perdedor de um hedge): não é erro do servidor
+        super().handle_error(request, client_address)
+
+
+def criar_servidor(configuracao, porta=0, host='127.0.0.1'):
+    # porta=0 escolhe uma porta livre; a URL base fica em `url_base(servidor)`
+    manipulador = type('ManipuladorConfigurado', (Manipulador,), {'configuracao': configuracao})
+    return Servidor((host, porta), manipulador)
+
+
+def url_base(servidor):
+    host, porta = servidor.server_address[:2]
+    return f"http://{host}:{porta}"
+
+
+def iniciar_em_thread(configuracao, porta=0):
+    servidor = criar_servidor(configuracao, porta)
+    threading.Thread(target=servidor.serve_forever, name='groq-falso', daemon=True).start()
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--latencia-ms', type=float, default=300)
+    parser.add_argument('--tokens-por-segundo', type=float, default=500)
+    parser.add_argument('--taxa-erro', type=float, default=0.0)
+    parser.add_argument('--status-erro', type=int, default=500)
+    parser.add_argument('--retry-after', type=int)
+    parser.add_argument('--taxa-travamento', type=float, default=0.0)
+    parser.add_argument('--travamento-ms', type=float, default=30000)
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--latencia-modelo', action='append', default=[], metavar='NOME=MS')
+    args = parser.parse_args()
+
+    latencia_por_modelo = {nome: float(ms) for nome, ms in (item.rsplit('=', 1) for item in args.latencia_modelo)}
+    configuracao = Configuracao(args.latencia_ms, args.tokens_por_segundo, args.taxa_erro, args.semente,
+                                args.status_erro, args.retry_after, args.taxa_travamento, args.travamento_ms,
+                                latencia_por_modelo=latencia_por_modelo)
+    servidor = criar_servidor(configuracao, args.porta)
+    print(f"Groq falso em {url_base(servidor)} (GROQ_BASE_URL)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -9,7 +9,9 @@ https://docs.djangoproject.com/en/5.1/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
+import json
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 from pathlib import Path
 from datetime import timedelta
@@ -27,9 +29,11 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.environ.get('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Desligado por padrão (tracebacks, settings e connection.queries crescendo a cada consulta);
+# em desenvolvimento, DEBUG=true no .env
+DEBUG = os.environ.get('DEBUG', 'false').lower() in ('1', 'true', 'sim')
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host for host in os.environ.get('ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',') if host]
 
 
 # Application definition
@@ -48,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'provas.metricas.MetricasMiddleware',  # Primeiro, para medir a requisição inteira (Server-Timing e /metrics)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,15 +86,49 @@ WSGI_APPLICATION = 'gerador_provas.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-   
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_PERFIL escolhe o banco:
+# *   'sqlite' (padrão): um único nó. WAL deixa as leituras correrem junto com a escrita,
+#     synchronous=NORMAL só sincroniza o disco nos checkpoints, e as transações começam com
+#     BEGIN IMMEDIATE: escritores concorrentes esperam a vez (até SQLITE_TIMEOUT segundos)
+#     em vez de falharem com "database is locked" ao tentar promover a trava.
+# *   'postgres': vários nós ou muitos escritores simultâneos.
+# Nos dois, a conexão é reaproveitada entre requisições por DB_CONN_MAX_AGE segundos e
+# testada antes do reuso (CONN_HEALTH_CHECKS).
+DB_PERFIL = os.environ.get('DB_PERFIL', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+if DB_PERFIL == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'provas'),
+            'USER': os.environ.get('POSTGRES_USER', 'provas'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('POSTGRES_CONNECT_TIMEOUT', 5)),
+            },
+        }
     }
-   
-    
-}   
+elif DB_PERFIL == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_NOME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': float(os.environ.get('SQLITE_TIMEOUT', 20)),  # busy_timeout
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            } if os.environ.get('SQLITE_AJUSTES', 'true').lower() in ('1', 'true', 'sim') else {},
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"DB_PERFIL desconhecido: {DB_PERFIL!r} (use 'sqlite' ou 'postgres')")
     
 
 # Password validation
@@ -150,6 +189,130 @@ REST_FRAMEWORK = {
 
 
 
+# Jobs de geração assíncrona (POST /api/gerar-prova/?assincrono=true)
+# BACKEND: 'thread' (pool no próprio processo), 'banco' (worker `manage.py processar_jobs`)
+# ou 'sincrono' (executa dentro da requisição)
+GERACAO_JOBS = {
+    'BACKEND': os.environ.get('GERACAO_JOBS_BACKEND', 'thread'),
+    'WORKERS': int(os.environ.get('GERACAO_JOBS_WORKERS', 4)),  # gerações simultâneas no processo
+    'MAX_LINHAS_LOTE': int(os.environ.get('GERACAO_MAX_LINHAS_LOTE', 1000)),  # POST /api/gerar-prova/lote/
+}
+
+# Cache de gerações da LLM, indexado pelos critérios normalizados
+# BACKEND: 'memoria' (LRU local ao processo), 'banco' (tabela provas_entradacachegeracao),
+# 'django' (settings.CACHES[ALIAS]) ou o caminho de uma classe própria
+GERACAO_CACHE = {
+    'BACKEND': os.environ.get('GERACAO_CACHE_BACKEND', 'memoria'),
+    'TTL': int(os.environ.get('GERACAO_CACHE_TTL', 60 * 60 * 24)),  # segundos
+    'MAX_ENTRADAS': int(os.environ.get('GERACAO_CACHE_MAX_ENTRADAS', 1000)),
+    'ALIAS': 'default',
+}
+
+# Provas grandes são divididas em lotes gerados em paralelo
+GERACAO_LOTES = {
+    'TAMANHO': int(os.environ.get('GERACAO_LOTE_TAMANHO', 10)),  # questões por chamada à LLM
+    'MAX_PARALELO': int(os.environ.get('GERACAO_LOTE_MAX_PARALELO', 4)),  # chamadas simultâneas por prova
+    'TENTATIVAS': int(os.environ.get('GERACAO_LOTE_TENTATIVAS', 2)),  # novas tentativas dos lotes que falharem
+    'LIMIAR_DUPLICATA': float(os.environ.get('GERACAO_LIMIAR_DUPLICATA', 0.85)),  # similaridade entre enunciados
+}
+
+# Índice em memória das questões do banco usado contra duplicatas (provas.deduplicacao):
+# as assinaturas mais recentes de cada tema e os temas usados por último. 0 desliga o limite.
+DEDUPLICACAO = {
+    'POR_TEMA': int(os.environ.get('DEDUPLICACAO_POR_TEMA', 5000)),
+    'TEMAS': int(os.environ.get('DEDUPLICACAO_TEMAS', 50)),
+}
+
+# Governador das chamadas à LLM (provas.governador). Com o backend 'arquivo', os limites valem
+# para todos os workers da máquina que usam o mesmo DIRETORIO; 'memoria' vale por processo.
+# Limites por minuto iguais a 0 desligam o balde correspondente.
+LLM_LIMITES = {
+    'BACKEND': os.environ.get('LLM_LIMITES_BACKEND', 'arquivo'),
+    'DIRETORIO': Path(os.environ.get('LLM_LIMITES_DIRETORIO', BASE_DIR / 'llm_estado')),
+    'REQUISICOES_POR_MINUTO': int(os.environ.get('LLM_REQUISICOES_POR_MINUTO', 0)),
+    'TOKENS_POR_MINUTO': int(os.environ.get('LLM_TOKENS_POR_MINUTO', 0)),
+    'MAX_EM_VOO': int(os.environ.get('LLM_MAX_EM_VOO', 8)),  # chamadas simultâneas ao provedor
+    'ESPERA_MAXIMA': float(os.environ.get('LLM_ESPERA_MAXIMA', 30)),  # segundos na fila antes do 503
+    'TOKENS_RESPOSTA_ESTIMADOS': int(os.environ.get('LLM_TOKENS_RESPOSTA_ESTIMADOS', 1500)),
+}
+
+# Transporte HTTP do cliente do Groq (provas/transporte.py)
+LLM_TRANSPORTE = {
+    'TIMEOUT_CONEXAO': float(os.environ.get('LLM_TIMEOUT_CONEXAO', 5)),
+    'TIMEOUT_LEITURA': float(os.environ.get('LLM_TIMEOUT_LEITURA', 60)),  # segundos sem receber nada do provedor
+    'MAX_CONEXOES': int(os.environ.get('LLM_MAX_CONEXOES', 20)),
+    'MAX_CONEXOES_OCIOSAS': int(os.environ.get('LLM_MAX_CONEXOES_OCIOSAS', 10)),  # mantidas abertas (keep-alive)
+    'KEEPALIVE': float(os.environ.get('LLM_KEEPALIVE', 30)),
+    'TENTATIVAS': int(os.environ.get('LLM_TENTATIVAS', 3)),  # 1 = sem novas tentativas
+    'RECUO_BASE': float(os.environ.get('LLM_RECUO_BASE', 0.5)),
+    'RECUO_MAXIMO': float(os.environ.get('LLM_RECUO_MAXIMO', 10)),
+    'DISJUNTOR_FALHAS': int(os.environ.get('LLM_DISJUNTOR_FALHAS', 5)),  # 0 desliga o disjuntor
+    'DISJUNTOR_PAUSA': float(os.environ.get('LLM_DISJUNTOR_PAUSA', 30)),
+}
+
+# Modelos da LLM e roteamento (provas/roteamento.py). LLM_MODELOS é uma lista JSON, em ordem de
+# preferência; cada modelo pode limitar as questões por chamada ("max_questoes") e os tipos que
+# atende ("tipos"). Com dois ou mais modelos, o primário que demorar mais que o percentil
+# PERCENTIL_HEDGE do seu tempo até o primeiro token ganha uma cópia no secundário (hedge).
+LLM_ROTEAMENTO = {
+    'MODELOS': json.loads(os.environ.get('LLM_MODELOS', '["mixtral-8x7b-32768"]')),
+    'HEDGE': os.environ.get('LLM_HEDGE', 'true').lower() in ('1', 'true', 'sim'),
+    'PERCENTIL_HEDGE': float(os.environ.get('LLM_PERCENTIL_HEDGE', 95)),
+    'HEDGE_INICIAL': float(os.environ.get('LLM_HEDGE_INICIAL', 2)),  # segundos, até haver amostras suficientes
+    'HEDGE_MINIMO': float(os.environ.get('LLM_HEDGE_MINIMO', 0.3)),
+    'ALFA_EWMA': float(os.environ.get('LLM_ALFA_EWMA', 0.2)),  # peso de cada nova medição na média
+}
+
+# Currículos longos vão para o prompt como um resumo em tópicos, feito uma vez por conteúdo.
+# METODO: 'extrativo' (local, sem custo) ou 'llm' (chamada de resumo; cai no extrativo se falhar).
+# ORCAMENTO_TOKENS: tamanho máximo do currículo no prompt; abaixo disso vai o texto inteiro.
+GERACAO_CURRICULO = {
+    'METODO': os.environ.get('GERACAO_CURRICULO_METODO', 'extrativo'),
+    'ORCAMENTO_TOKENS': int(os.environ.get('GERACAO_CURRICULO_ORCAMENTO_TOKENS', 400)),
+}
+
+# Cache das leituras de provas e gabaritos (GET /api/provas/{id}/ e /api/gabarito/{id}/)
+# As respostas levam ETag forte e "Vary: Authorization"; CACHE_CONTROL define quem pode guardá-las.
+# As rotas exigem JWT: o padrão "private" só deixa o navegador do próprio usuário guardar a resposta.
+# "public" (um proxy compartilhado entregaria a prova sem repetir a autenticação) nunca vale
+# para o gabarito, que sai sempre como private.
+PROVAS_CACHE_LEITURA = {
+    'ALIAS': 'default',
+    'TTL': int(os.environ.get('PROVAS_CACHE_LEITURA_TTL', 60 * 60)),  # segundos
+    'CACHE_CONTROL': os.environ.get('PROVAS_CACHE_CONTROL', 'private, max-age=60'),
+}
+
+# PDFs das provas e gabaritos (GET /api/provas/{id}/pdf/ e /api/gabarito/{id}/pdf/)
+# Gerados com reportlab e guardados em DIRETORIO. PRE_RENDERIZAR gera os dois PDFs em
+# segundo plano assim que a prova é criada. Com X_ACCEL_REDIRECT (ex.: '/pdf-interno/'),
+# o nginx entrega o arquivo e o Django só responde com o cabeçalho.
+PROVAS_PDF = {
+    'DIRETORIO': Path(os.environ.get('PROVAS_PDF_DIRETORIO', BASE_DIR / 'pdf_cache')),
+    'PRE_RENDERIZAR': os.environ.get('PROVAS_PDF_PRE_RENDERIZAR', 'true').lower() in ('1', 'true', 'sim'),
+    'WORKERS': int(os.environ.get('PROVAS_PDF_WORKERS', 2)),  # pré-renderizações simultâneas no processo
+    'X_ACCEL_REDIRECT': os.environ.get('PROVAS_PDF_X_ACCEL_REDIRECT', ''),
+}
+
+# GET /metrics (formato Prometheus): exige "Authorization: Bearer <TOKEN>"; sem TOKEN, só abre com DEBUG.
+METRICAS = {
+    'TOKEN': os.environ.get('METRICAS_TOKEN', ''),
+}
+
+# Erros e avisos da aplicação vão para o console (stderr), com o módulo de origem
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simples': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simples'},
+    },
+    'loggers': {
+        'provas': {'handlers': ['console'], 'level': os.environ.get('PROVAS_LOG_LEVEL', 'INFO')},
+    },
+}
+
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
         'Bearer': {
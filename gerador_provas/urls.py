@@ -24,6 +24,7 @@ from rest_framework_simplejwt.views import ( # Importando as views do Simple JWT
     TokenRefreshView,
 )
 from rest_framework_simplejwt.views import TokenVerifyView
+from provas.metricas import view_metricas
 
 # Configuração do Swagger
 schema_view = get_schema_view(
@@ -43,6 +44,7 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('provas.urls')),
+    path('metrics', view_metricas, name='metricas'),  # Prometheus
 
     # URLs do Swagger e Redoc
     path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
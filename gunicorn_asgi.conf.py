@@ -0,0 +1,22 @@
+# Perfil de implantação ASGI: gunicorn gerenciando workers uvicorn.
+#
+#   gunicorn -c gunicorn_asgi.conf.py gerador_provas.asgi:application
+#
+# Cada worker é um processo com um event loop; as rotas /api/async/ esperam a
+# LLM sem ocupar threads, então poucos workers sustentam centenas de gerações
+# simultâneas. As rotas síncronas continuam funcionando (rodam em thread pool).
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+# Gerações grandes podem levar minutos; o worker não deve ser reiniciado no meio
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 180))
+graceful_timeout = 30
+keepalive = 5
+
+# Recicla workers periodicamente para limitar crescimento de memória
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = 200
@@ -1,3 +1,78 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import (CriteriosProva, DocumentoCurriculo, EntradaCacheGeracao, Gabarito, ItemProva, JobGeracao, LoteGeracao, Questao,
+                     SnapshotProva)
+
+# Todas as listagens e páginas de edição fazem um número fixo de consultas,
+# independente da quantidade de questões de cada prova.
+
+
+class ItemProvaInline(admin.TabularInline):
+    model = ItemProva
+    fields = ['ordem', 'questao']
+    readonly_fields = ['questao']  # Evita um <select> com todas as questões do banco
+    extra = 0
+    can_delete = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('questao')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(CriteriosProva)
+class CriteriosProvaAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tema', 'dificuldade', 'quantidade_questoes', 'tipos_questoes', 'criado_por']
+    list_filter = ['dificuldade']
+    list_select_related = ['criado_por']
+    search_fields = ['tema']
+    raw_id_fields = ['criado_por']
+    inlines = [ItemProvaInline]
+
+
+@admin.register(Questao)
+class QuestaoAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tema', 'tipo', 'nivel_dificuldade', 'enunciado']
+    list_filter = ['tipo', 'nivel_dificuldade']
+    search_fields = ['enunciado']
+
+
+@admin.register(Gabarito)
+class GabaritoAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'prova']
+    list_select_related = ['prova']
+    raw_id_fields = ['prova']
+
+
+@admin.register(JobGeracao)
+class JobGeracaoAdmin(admin.ModelAdmin):
+    list_display = ['id', 'estado', 'prova', 'lote', 'criado_em', 'iniciado_em', 'finalizado_em']
+    list_filter = ['estado']
+    list_select_related = ['prova', 'lote']
+    raw_id_fields = ['prova', 'lote', 'lider']
+
+
+@admin.register(LoteGeracao)
+class LoteGeracaoAdmin(admin.ModelAdmin):
+    list_display = ['id', 'total', 'criado_por', 'criado_em']
+    list_select_related = ['criado_por']
+    raw_id_fields = ['criado_por']
+
+
+@admin.register(SnapshotProva)
+class SnapshotProvaAdmin(admin.ModelAdmin):
+    list_display = ['prova', 'versao', 'atualizado_em']
+    list_select_related = ['prova']
+    raw_id_fields = ['prova']
+
+
+@admin.register(EntradaCacheGeracao)
+class EntradaCacheGeracaoAdmin(admin.ModelAdmin):
+    list_display = ['chave', 'criado_em', 'acessado_em']
+
+
+@admin.register(DocumentoCurriculo)
+class DocumentoCurriculoAdmin(admin.ModelAdmin):
+    list_display = ['hash', 'metodo', 'tokens_texto', 'tokens_resumo', 'criado_em']
+    readonly_fields = ['hash']
@@ -0,0 +1,54 @@
+from django.db.models import Count
+
+from .models import Questao
+
+
+def normalizar_tema(tema):
+    # "  Revolução  Francesa" e "revolução francesa" caem no mesmo tema do banco
+    return ' '.join(tema.split()).casefold()
+
+
+def tipos_da_prova(criterios):
+    return [t.strip() for t in (criterios.tipos_questoes or '').split(',') if t.strip()]
+
+
+def normalizar_enunciado(enunciado):
+    return ' '.join(enunciado.split()).casefold()
+
+
+def selecionar(criterios, quantidade=None, tamanho_pagina=100):
+    # Busca no banco questões já geradas para o mesmo tema, tipos e nível.
+    # Regra de não repetição: nada que já tenha aparecido em provas do mesmo usuário,
+    # nem duas questões com o mesmo enunciado (o banco pode ter cópias de gerações antigas).
+    if quantidade is None:
+        quantidade = criterios.quantidade_questoes
+    tema = normalizar_tema(criterios.tema)
+    questoes = Questao.objects.filter(
+        tema=tema,
+        tipo__in=tipos_da_prova(criterios),
+        nivel_dificuldade=criterios.dificuldade,
+    )
+    vistos = set()
+    if criterios.criado_por_id is not None:
+        questoes = questoes.exclude(provas__criado_por=criterios.criado_por_id)
+        vistos.update(
+            normalizar_enunciado(enunciado) for enunciado in
+            Questao.objects.filter(tema=tema, provas__criado_por=criterios.criado_por_id).values_list('enunciado', flat=True)
+        )
+    # As menos usadas primeiro, para distribuir o banco entre as provas
+    candidatas = questoes.annotate(usos=Count('itens')).order_by('usos', 'id')
+    selecionadas = []
+    inicio = 0
+    while quantidade > 0:
+        pagina = list(candidatas[inicio:inicio + tamanho_pagina])
+        for questao in pagina:
+            enunciado = normalizar_enunciado(questao.enunciado)
+            if enunciado not in vistos:
+                vistos.add(enunciado)
+                selecionadas.append(questao)
+                if len(selecionadas) == quantidade:
+                    return selecionadas
+        if len(pagina) < tamanho_pagina:
+            break
+        inicio += tamanho_pagina
+    return selecionadas
@@ -0,0 +1,227 @@
+import base64
+import binascii
+import json
+import re
+import unicodedata
+
+from django.core import checks
+from django.db import connection
+from django.db.models import Q
+
+# Busca textual nas questões com índice invertido do próprio banco:
+#   SQLite     -> tabela virtual FTS5 `provas_questao_fts` (rowid = id da questão)
+#   PostgreSQL -> tabela `provas_questao_busca` com tsvector e índice GIN
+# O texto é normalizado em Python (sem acentos, minúsculas, sem stopwords e com
+# um radicalizador leve de português), então os dois bancos indexam os mesmos termos.
+
+PALAVRAS = re.compile(r'\w+')
+BANCOS_COM_INDICE = ('sqlite', 'postgresql')  # Nos outros, `buscar` cai em `buscar_sem_indice`
+
+STOPWORDS = frozenset('''
+a ao aos aquela aquelas aquele aqueles aquilo as ate com como da das de dela delas dele deles
+depois do dos e ela elas ele eles em entre era essa essas esse esses esta estas este estes eu
+foi ha isso isto ja lhe lhes mais mas me mesmo meu meus minha minhas muito na nas nem no nos
+nossa nossas nosso nossos num numa o os ou para pela pelas pelo pelos por qual quando que quem
+se sem ser seu seus so sua suas tambem te tem teu teus tu tua tuas um uma voce voces vos
+'''.split())
+
+# Sufixos removidos em ordem (já sem acento); cada regra guarda um radical mínimo
+SUFIXOS_PLURAL = [('oes', 'ao'), ('aes', 'ao'), ('ais', 'al'), ('eis', 'el'), ('ois', 'ol'), ('ns', 'm'),
+                  ('res', 'r'), ('ses', 's'), ('s', '')]
+SUFIXOS_NOMINAIS = ['amentos', 'amento', 'imento', 'amente', 'mente', 'acao', 'icao', 'ucao', 'idade', 'ismo',
+                    'ista', 'avel', 'ivel', 'encia', 'ancia', 'osa', 'oso', 'ico', 'ica', 'ador', 'edor']
+SUFIXOS_VERBAIS = ['aram', 'eram', 'iram', 'ando', 'endo', 'indo', 'ado', 'ido', 'ada', 'ida', 'ar', 'er', 'ir',
+                   'ou', 'am', 'em']
+RADICAL_MINIMO = 3
+
+
+def sem_acentos(texto):
+    decomposto = unicodedata.normalize('NFKD', texto)
+    return ''.join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def radical(palavra):
+    for sufixo, troca in SUFIXOS_PLURAL:
+        if palavra.endswith(sufixo) and len(palavra) - len(sufixo) >= RADICAL_MINIMO:
+            palavra = palavra[:-len(sufixo)] + troca
+            break
+    for sufixos in (SUFIXOS_NOMINAIS, SUFIXOS_VERBAIS):
+        for sufixo in sufixos:
+            if palavra.endswith(sufixo) and len(palavra) - len(sufixo) >= RADICAL_MINIMO:
+                return palavra[:-len(sufixo)]
+    if palavra[-1] in 'aeo' and len(palavra) - 1 >= RADICAL_MINIMO:
+        return palavra[:-1]
+    return palavra
+
+
+def termos(texto):
+    palavras = PALAVRAS.findall(sem_acentos(texto).casefold())
+    return [radical(p) for p in palavras if p not in STOPWORDS]
+
+
+def documento(questao):
+    return ' '.join(termos(f"{questao.enunciado} {questao.tema}"))
+
+
+# --- Índice ---
+
+def indexar(questoes):
+    # Inclui ou atualiza as questões no índice (chamado a cada criação/alteração)
+    linhas = [(questao.id, documento(questao)) for questao in questoes]
+    if not linhas:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.executemany(
+                'INSERT OR REPLACE INTO provas_questao_fts (rowid, conteudo) VALUES (%s, %s)', linhas
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.executemany(
+                "INSERT INTO provas_questao_busca (questao_id, documento) VALUES (%s, to_tsvector('simple', %s)) "
+                "ON CONFLICT (questao_id) DO UPDATE SET documento = EXCLUDED.documento",
+                linhas,
+            )
+
+
+def limpar_indice():
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('DELETE FROM provas_questao_fts')
+        elif connection.vendor == 'postgresql':
+            cursor.execute('TRUNCATE provas_questao_busca')
+
+
+def criar_indice(schema_editor):
+    # Usado pela migração: a estrutura depende do banco
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE provas_questao_fts USING fts5(conteudo, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        # Questões apagadas saem do índice
+        schema_editor.execute(
+            'CREATE TRIGGER provas_questao_fts_delete AFTER DELETE ON provas_questao '
+            'BEGIN DELETE FROM provas_questao_fts WHERE rowid = old.id; END'
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE provas_questao_busca ('
+            'questao_id bigint PRIMARY KEY REFERENCES provas_questao (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'documento tsvector NOT NULL)'
+        )
+        schema_editor.execute('CREATE INDEX provas_questao_busca_gin ON provas_questao_busca USING GIN (documento)')
+
+
+def remover_indice(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TRIGGER IF EXISTS provas_questao_fts_delete')
+        schema_editor.execute('DROP TABLE IF EXISTS provas_questao_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE IF EXISTS provas_questao_busca')
+
+
+# --- Consulta ---
+
+def codificar_cursor(posicao):
+    return base64.urlsafe_b64encode(json.dumps(posicao).encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    # Posição [rank, id] da última questão da página anterior; ValueError se inválido
+    try:
+        rank, questao_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank), int(questao_id)
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError) as e:
+        raise ValueError('Cursor inválido') from e
+
+
+def buscar(consulta, tipo=None, nivel_dificuldade=None, depois=None, limite=20):
+    # Devolve [(questao_id, rank)] ordenados por relevância (menor rank = mais relevante)
+    # e, em empate, pelo id. `depois` é a posição (rank, id) onde a página anterior parou.
+    palavras = termos(consulta)
+    if not palavras:
+        return []
+
+    if connection.vendor == 'sqlite':
+        expressao = ' '.join(f'"{p}"*' for p in palavras)
+        sql = (
+            'SELECT r.id, r.rank FROM ('
+            '  SELECT rowid AS id, bm25(provas_questao_fts) AS rank'
+            '  FROM provas_questao_fts WHERE provas_questao_fts MATCH %s'
+            ') r JOIN provas_questao q ON q.id = r.id'
+        )
+    elif connection.vendor == 'postgresql':
+        expressao = ' & '.join(f'{p}:*' for p in palavras)
+        sql = (
+            'SELECT r.id, r.rank FROM ('
+            "  SELECT questao_id AS id, -ts_rank(documento, to_tsquery('simple', %s)) AS rank"
+            "  FROM provas_questao_busca WHERE documento @@ to_tsquery('simple', %s)"
+            ') r JOIN provas_questao q ON q.id = r.id'
+        )
+    else:
+        return buscar_sem_indice(palavras, tipo, nivel_dificuldade, depois, limite)
+
+    parametros = [expressao] if connection.vendor == 'sqlite' else [expressao, expressao]
+    condicoes = []
+    if tipo:
+        condicoes.append('q.tipo = %s')
+        parametros.append(tipo)
+    if nivel_dificuldade:
+        condicoes.append('q.nivel_dificuldade = %s')
+        parametros.append(nivel_dificuldade)
+    if depois is not None:
+        condicoes.append('(r.rank > %s OR (r.rank = %s AND r.id > %s))')
+        parametros.extend([depois[0], depois[0], depois[1]])
+    if condicoes:
+        sql += ' WHERE ' + ' AND '.join(condicoes)
+    sql += ' ORDER BY r.rank, r.id LIMIT %s'
+    parametros.append(limite)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return cursor.fetchall()
+
+
+def buscar_sem_indice(palavras, tipo, nivel_dificuldade, depois, limite):
+    # Outros bancos não têm índice: filtra por trecho dos radicais (icontains), sem
+    # relevância (rank 0, ordem por id). Mais lento e sem ignorar acentos; avisado no `check`.
+    from .models import Questao
+
+    questoes = Questao.objects.all()
+    for palavra in palavras:
+        questoes = questoes.filter(Q(enunciado__icontains=palavra) | Q(tema__icontains=palavra))
+    if tipo:
+        questoes = questoes.filter(tipo=tipo)
+    if nivel_dificuldade:
+        questoes = questoes.filter(nivel_dificuldade=nivel_dificuldade)
+    if depois is not None:
+        questoes = questoes.filter(id__gt=depois[1])
+    return [(questao_id, 0.0) for questao_id in questoes.order_by('id').values_list('id', flat=True)[:limite]]
+
+
+@checks.register()
+def verificar_banco(app_configs, **kwargs):
+    if connection.vendor in BANCOS_COM_INDICE:
+        return []
+    return [checks.Warning(
+        f'Busca textual sem índice no banco {connection.vendor}',
+        hint='Só SQLite (FTS5) e PostgreSQL têm índice; nos outros, a busca filtra as questões com icontains.',
+        id='provas.W001',
+    )]
+
+
+def reconstruir(tamanho_lote=500):
+    from .models import Questao
+
+    limpar_indice()
+    lote = []
+    total = 0
+    for questao in Questao.objects.only('id', 'enunciado', 'tema').iterator(chunk_size=tamanho_lote):
+        lote.append(questao)
+        if len(lote) >= tamanho_lote:
+            indexar(lote)
+            total += len(lote)
+            lote = []
+    indexar(lote)
+    return total + len(lote)
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import metricas
+from .banco_questoes import normalizar_tema, tipos_da_prova
+from .models import EntradaCacheGeracao, Questao
+
+BACKENDS = {
+    'memoria': 'provas.cache_geracao.CacheMemoria',
+    'banco': 'provas.cache_geracao.CacheBanco',
+    'django': 'provas.cache_geracao.CacheDjango',
+}
+
+_cache = None
+_cache_lock = threading.Lock()
+_contadores = {'acertos': 0, 'falhas': 0}
+_contadores_lock = threading.Lock()
+
+
+def chave_criterios(criterios, modelo, versao_prompt, quantidade=None):
+    # Mesma prova pedida com diferenças de caixa/espaços/ordem dos tipos gera a mesma chave
+    if quantidade is None:
+        quantidade = criterios.quantidade_questoes
+    normalizado = {
+        'tema': normalizar_tema(criterios.tema),
+        'dificuldade': criterios.dificuldade,
+        'tipos_questoes': sorted(set(tipos_da_prova(criterios))),
+        'quantidade_questoes': quantidade,
+        'curriculo': ' '.join((criterios.curriculo or '').split()),
+        'modelo': modelo,
+        'versao_prompt': versao_prompt,
+    }
+    dados = json.dumps(normalizado, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(dados).hexdigest()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config = settings.GERACAO_CACHE
+            backend = BACKENDS.get(config['BACKEND'], config['BACKEND'])
+            _cache = import_string(backend)(config)
+    return _cache
+
+
+def obter(chave):
+    # Questões já gravadas da geração com a mesma chave, na ordem, ou None.
+    # O cache guarda só os ids: um acerto liga as mesmas linhas de Questao à nova prova
+    # (ItemProva) em vez de copiá-las, para o banco de questões não ficar com enunciados repetidos.
+    ids = get_cache().obter(chave)
+    questoes = carregar_questoes(ids) if ids is not None else None
+    with _contadores_lock:
+        _contadores['acertos' if questoes is not None else 'falhas'] += 1
+    metricas.registrar_cache('geracao', questoes is not None)
+    return questoes
+
+
+def carregar_questoes(ids):
+    if not isinstance(ids, list) or not all(isinstance(questao_id, int) for questao_id in ids):
+        return None  # Entrada antiga, com os dados das questões em vez dos ids
+    encontradas = Questao.objects.in_bulk(ids)
+    if len(encontradas) != len(set(ids)):
+        return None  # Alguma questão foi apagada
+    return [encontradas[questao_id] for questao_id in ids]
+
+
+def salvar(chave, questoes):
+    # `questoes`: instâncias de Questao já gravadas
+    get_cache().salvar(chave, [questao.id for questao in questoes])
+
+
+def estatisticas():
+    with _contadores_lock:
+        return dict(_contadores)
+
+
+@receiver(setting_changed)
+def _recarregar(setting, **kwargs):
+    # Permite trocar o backend com override_settings nos testes
+    global _cache
+    if setting == 'GERACAO_CACHE':
+        with _cache_lock:
+            _cache = None
+
+
+class CacheMemoria:
+    # LRU local ao processo, com TTL e limite de entradas
+    def __init__(self, config):
+        self.ttl = config['TTL']
+        self.max_entradas = config['MAX_ENTRADAS']
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return None
+            expira_em, questoes = entrada
+            if expira_em < time.monotonic():
+                del self._entradas[chave]
+                return None
+            self._entradas.move_to_end(chave)
+            return questoes
+
+    def salvar(self, chave, questoes):
+        with self._lock:
+            self._entradas[chave] = (time.monotonic() + self.ttl, questoes)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+
+class CacheBanco:
+    # Compartilhado entre processos; LRU pela coluna acessado_em
+    def __init__(self, config):
+        self.ttl = config['TTL']
+        self.max_entradas = config['MAX_ENTRADAS']
+
+    def obter(self, chave):
+        agora = timezone.now()
+        entrada = EntradaCacheGeracao.objects.filter(
+            chave=chave, criado_em__gte=agora - timedelta(seconds=self.ttl)
+        ).first()
+        if entrada is None:
+            return None
+        EntradaCacheGeracao.objects.filter(id=entrada.id).update(acessado_em=agora)
+        return entrada.questoes
+
+    def salvar(self, chave, questoes):
+        agora = timezone.now()
+        EntradaCacheGeracao.objects.update_or_create(
+            chave=chave,
+            defaults={'questoes': questoes, 'criado_em': agora, 'acessado_em': agora},
+        )
+        excedentes = EntradaCacheGeracao.objects.order_by('-acessado_em').values_list('id', flat=True)[self.max_entradas:]
+        EntradaCacheGeracao.objects.filter(id__in=list(excedentes)).delete()
+
+
+class CacheDjango:
+    # Usa um cache do Django (settings.CACHES); a política de descarte é a do backend
+    def __init__(self, config):
+        self.ttl = config['TTL']
+        self.cache = caches[config.get('ALIAS', 'default')]
+
+    def obter(self, chave):
+        return self.cache.get(f'geracao:{chave}')
+
+    def salvar(self, chave, questoes):
+        self.cache.set(f'geracao:{chave}', questoes, timeout=self.ttl)
@@ -0,0 +1,86 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from . import metricas, snapshots
+
+# Cache das respostas de leitura (prova e gabarito), já renderizadas em JSON.
+# As provas não mudam depois de geradas; qualquer escrita invalida as entradas da prova.
+
+TIPOS = ('prova', 'gabarito')
+
+
+def _cache():
+    return caches[settings.PROVAS_CACHE_LEITURA['ALIAS']]
+
+
+def _chave(tipo, prova_id):
+    return f'leitura:{tipo}:{prova_id}'
+
+
+def calcular_etag(conteudo):
+    return '"%s"' % hashlib.sha256(conteudo).hexdigest()[:32]
+
+
+def obter(tipo, prova_id):
+    # (conteudo, etag) ou None
+    return _cache().get(_chave(tipo, prova_id))
+
+
+def salvar(tipo, prova_id, conteudo):
+    entrada = (conteudo, calcular_etag(conteudo))
+    _cache().set(_chave(tipo, prova_id), entrada, timeout=settings.PROVAS_CACHE_LEITURA['TTL'])
+    return entrada
+
+
+def invalidar(*provas_ids):
+    _cache().delete_many([_chave(tipo, prova_id) for prova_id in provas_ids for tipo in TIPOS])
+
+
+def cache_control(compartilhavel=True):
+    # Cabeçalho Cache-Control de PROVAS_CACHE_LEITURA; sem `compartilhavel`, tira o que
+    # permitiria a um cache compartilhado guardar a resposta (public, s-maxage)
+    valor = settings.PROVAS_CACHE_LEITURA['CACHE_CONTROL']
+    if compartilhavel:
+        return valor
+    diretivas = [d.strip() for d in valor.split(',') if d.strip()]
+    diretivas = [d for d in diretivas if d.lower() != 'public' and not d.lower().startswith('s-maxage')]
+    if not any(d.lower() in ('private', 'no-store') for d in diretivas):
+        diretivas.insert(0, 'private')
+    return ', '.join(diretivas)
+
+
+class RespostaCacheadaMixin:
+    # Para RetrieveAPIView de objetos de uma prova: serve o JSON do cache, com ETag
+    # forte e 304 para If-None-Match. Sem cache, usa o snapshot gravado na criação
+    # da prova; só serializa de novo quando não há snapshot na versão atual.
+    tipo_cache = None
+    compartilhavel = True  # False: nunca "public" (gabarito)
+
+    def retrieve(self, request, *args, **kwargs):
+        prova_id = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        entrada = obter(self.tipo_cache, prova_id)
+        metricas.registrar_cache('leitura', entrada is not None)
+        if entrada is None:
+            conteudo = snapshots.obter(self.tipo_cache, prova_id)
+            if conteudo is None:
+                objeto = self.get_object()
+                with metricas.fase('renderizar'):
+                    conteudo = JSONRenderer().render(self.get_serializer(objeto).data)
+            entrada = salvar(self.tipo_cache, prova_id, conteudo)
+        conteudo, etag = entrada
+
+        etags = parse_etags(request.headers.get('If-None-Match', ''))
+        if '*' in etags or etag in etags or f'W/{etag}' in etags:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(conteudo, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control(self.compartilhavel)
+        patch_vary_headers(response, ['Authorization'])
+        return response
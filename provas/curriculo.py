@@ -0,0 +1,171 @@
+import hashlib
+import logging
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError
+
+from . import busca, llm, metricas, roteamento
+from .models import DocumentoCurriculo
+
+logger = logging.getLogger(__name__)
+
+# Currículos longos entram no prompt como um resumo em tópicos, calculado uma vez por
+# conteúdo e guardado em DocumentoCurriculo. Currículos que já cabem no orçamento
+# (GERACAO_CURRICULO['ORCAMENTO_TOKENS']) vão inteiros.
+
+CARACTERES_POR_TOKEN = 4  # Estimativa grosseira, suficiente para o orçamento
+PALAVRAS_POR_TRECHO = 40
+SEPARADOR_FRASES = re.compile(r'(?<=[.!?;])\s+')
+MARCADOR_LISTA = re.compile(r'^\s*(?:[-*•]+|\d+[.)]|[a-z][.)])\s*', re.IGNORECASE)
+MAX_MEMORIA = 256
+
+_memoria = OrderedDict()  # hash -> resumo, evita ir ao banco a cada prompt
+_memoria_lock = threading.Lock()
+
+
+def normalizar(texto):
+    return '\n'.join(' '.join(linha.split()) for linha in (texto or '').strip().splitlines() if linha.strip())
+
+
+def calcular_hash(texto):
+    return hashlib.sha256(normalizar(texto).encode('utf-8')).hexdigest()
+
+
+def estimar_tokens(texto):
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+
+def carregar(criterios):
+    # Resolve o currículo da prova uma vez e guarda no próprio objeto. Chamado antes de
+    # abrir threads (ou fora do loop de eventos), para que os prompts não consultem o banco.
+    if not hasattr(criterios, '_curriculo_prompt'):
+        criterios._curriculo_prompt = preparar(criterios.curriculo)
+    return criterios._curriculo_prompt
+
+
+def para_prompt(criterios):
+    # Texto do currículo para o prompt; cada uso conta os tokens economizados
+    texto, economizados = carregar(criterios)
+    if economizados:
+        metricas.CURRICULO_TOKENS_ECONOMIZADOS.inc(economizados)
+    return texto
+
+
+def preparar(curriculo):
+    # (texto para o prompt, tokens economizados em relação ao currículo inteiro)
+    texto = normalizar(curriculo)
+    if not texto:
+        return '', 0
+    orcamento = settings.GERACAO_CURRICULO['ORCAMENTO_TOKENS']
+    if estimar_tokens(texto) <= orcamento:
+        return texto, 0
+    resumo = obter_resumo(texto, orcamento)
+    return resumo, max(0, estimar_tokens(texto) - estimar_tokens(resumo))
+
+
+def obter_resumo(texto, orcamento):
+    metodo = settings.GERACAO_CURRICULO['METODO']
+    chave = calcular_hash(texto)
+    with _memoria_lock:
+        if (chave, metodo, orcamento) in _memoria:
+            _memoria.move_to_end((chave, metodo, orcamento))
+            return _memoria[(chave, metodo, orcamento)]
+
+    documento = DocumentoCurriculo.objects.filter(hash=chave).first()
+    if documento is None or documento.metodo != metodo or documento.orcamento_tokens != orcamento:
+        documento = salvar_resumo(documento, chave, texto, metodo, orcamento)
+
+    with _memoria_lock:
+        _memoria[(chave, metodo, orcamento)] = documento.resumo
+        while len(_memoria) > MAX_MEMORIA:
+            _memoria.popitem(last=False)
+    return documento.resumo
+
+
+def salvar_resumo(documento, chave, texto, metodo, orcamento):
+    resumo, metodo_usado = resumir(texto, orcamento, metodo)
+    campos = {
+        'texto': texto, 'resumo': resumo, 'metodo': metodo_usado, 'orcamento_tokens': orcamento,
+        'tokens_texto': estimar_tokens(texto), 'tokens_resumo': estimar_tokens(resumo),
+    }
+    if documento is not None:
+        DocumentoCurriculo.objects.filter(id=documento.id).update(**campos)
+        return DocumentoCurriculo(id=documento.id, hash=chave, **campos)
+    try:
+        return DocumentoCurriculo.objects.create(hash=chave, **campos)
+    except IntegrityError:
+        # Outro processo resumiu o mesmo currículo ao mesmo tempo
+        return DocumentoCurriculo.objects.get(hash=chave)
+
+
+def resumir(texto, orcamento, metodo='extrativo'):
+    # (resumo, método efetivamente usado); se a LLM falhar, cai no extrativo
+    if metodo == 'llm':
+        try:
+            return resumir_com_llm(texto, orcamento), 'llm'
+        except Exception as e:
+            logger.warning("Falha ao resumir o currículo com a LLM, usando o resumo extrativo: %s", e)
+    return resumir_extrativo(texto, orcamento), 'extrativo'
+
+
+def resumir_com_llm(texto, orcamento):
+    prompt = (
+        f"Resuma o currículo abaixo em uma lista de tópicos curtos (um por linha, começando com '- '), "
+        f"com no máximo {orcamento * CARACTERES_POR_TOKEN} caracteres no total. "
+        f"Mantenha os conteúdos e competências; omita texto administrativo.\n\n{texto}"
+    )
+    with metricas.fase('llm'):
+        chat_completion = llm.criar(
+            messages=[{"role": "user", "content": prompt}],
+            model=roteamento.obter().modelo_padrao(),
+        )
+    metricas.registrar_uso_llm(chat_completion)
+    resumo = normalizar(chat_completion.choices[0].message.content)
+    if not resumo:
+        raise ValueError("resumo vazio")
+    # O orçamento vale mesmo que a LLM o ignore
+    return resumo[:orcamento * CARACTERES_POR_TOKEN]
+
+
+def resumir_extrativo(texto, orcamento):
+    # Escolhe os trechos com os termos mais frequentes do currículo até preencher o
+    # orçamento e os devolve como tópicos, na ordem original. Títulos curtos valem mais.
+    trechos = dividir_em_trechos(texto)
+    frequencias = Counter(termo for trecho in trechos for termo in set(busca.termos(trecho)))
+    pontuados = []
+    for posicao, trecho in enumerate(trechos):
+        termos = set(busca.termos(trecho))
+        if not termos:
+            continue
+        pontuacao = sum(frequencias[t] for t in termos) / math.sqrt(len(termos))
+        if eh_titulo(trecho):
+            pontuacao *= 1.5
+        pontuados.append((pontuacao, posicao, trecho))
+
+    escolhidos = []
+    restante = orcamento
+    for pontuacao, posicao, trecho in sorted(pontuados, key=lambda p: (-p[0], p[1])):
+        custo = estimar_tokens(trecho) + 1  # "- " e quebra de linha
+        if custo <= restante:
+            escolhidos.append((posicao, trecho))
+            restante -= custo
+    return '\n'.join(f"- {trecho}" for _, trecho in sorted(escolhidos))
+
+
+def dividir_em_trechos(texto):
+    trechos = []
+    for linha in texto.splitlines():
+        linha = MARCADOR_LISTA.sub('', linha).strip()
+        for frase in SEPARADOR_FRASES.split(linha):
+            palavras = frase.split()
+            if palavras:
+                trechos.append(' '.join(palavras[:PALAVRAS_POR_TRECHO]))
+    return trechos
+
+
+def eh_titulo(trecho):
+    return len(trecho.split()) <= 8 and not trecho.endswith(('.', ';', '!', '?'))
@@ -0,0 +1,265 @@
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from . import busca, metricas
+
+# Detecção de questões quase idênticas por MinHash: cada enunciado vira uma assinatura de
+# NUM_PERMUTACOES inteiros, e a fração de posições iguais entre duas assinaturas estima a
+# similaridade de Jaccard entre os conjuntos de palavras (sem acentos nem stopwords, reduzidas ao radical).
+# As assinaturas das questões do banco ficam em AssinaturaQuestao e, por tema, num índice em
+# memória carregado de forma incremental e limitado (as mais recentes de cada tema, os temas
+# usados por último). O índice usa LSH (faixas da assinatura ordenadas com NumPy): só as
+# questões que coincidem em alguma faixa inteira são comparadas, então o custo por questão
+# nova quase não cresce com o tamanho do banco.
+
+PALAVRAS = re.compile(r'\w+')
+NUM_PERMUTACOES = 128
+PRIMO = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64(0xFFFFFFFF)
+FAIXAS = 16  # LSH: 16 faixas de 8 posições; pares com similaridade 0.85 coincidem em alguma com ~99% de chance
+TAMANHO_FAIXA = NUM_PERMUTACOES // FAIXAS
+
+_aleatorio = np.random.RandomState(20240601)  # Fixo: as assinaturas guardadas precisam continuar válidas
+_A = _aleatorio.randint(1, 1 << 31, size=NUM_PERMUTACOES).astype(np.uint64)
+_B = _aleatorio.randint(0, 1 << 31, size=NUM_PERMUTACOES).astype(np.uint64)
+_MULTIPLICADORES_FAIXA = _aleatorio.randint(1, 1 << 62, size=TAMANHO_FAIXA, dtype=np.int64).astype(np.uint64)
+VAZIO = np.empty((0, NUM_PERMUTACOES), dtype=np.uint32)
+
+
+def palavras(enunciado):
+    # Radicais sem stopwords, como na busca; enunciado só de stopwords usa todas as palavras
+    return set(busca.termos(enunciado)) or {p.casefold() for p in PALAVRAS.findall(enunciado)}
+
+
+def assinaturas(enunciados):
+    # Matriz (len(enunciados), NUM_PERMUTACOES), calculada de uma vez para o lote
+    if not enunciados:
+        return VAZIO
+    hashes, inicios = [], []
+    for enunciado in enunciados:
+        inicios.append(len(hashes))
+        # Enunciado sem palavras ainda tem uma assinatura (a do conjunto vazio)
+        hashes.extend(zlib.crc32(p.encode()) for p in palavras(enunciado) or {''})
+    valores = np.array(hashes, dtype=np.uint64)
+    permutados = ((valores[:, None] * _A + _B) % PRIMO) & MAX_HASH  # (palavras, permutações)
+    return np.minimum.reduceat(permutados, inicios, axis=0).astype(np.uint32)
+
+
+def similaridades(a, b):
+    # Similaridade estimada entre cada linha de `a` e cada linha de `b`: matriz (len(a), len(b))
+    return (a[:, None, :] == b[None, :, :]).mean(axis=2)
+
+
+def chaves_das_faixas(matriz):
+    # (linhas, FAIXAS): um hash de cada faixa da assinatura
+    faixas = matriz.astype(np.uint64).reshape(len(matriz), FAIXAS, TAMANHO_FAIXA)
+    return (faixas * _MULTIPLICADORES_FAIXA).sum(axis=2)
+
+
+class IndiceLSH:
+    # Assinaturas num buffer circular de até `capacidade` linhas (0: sem limite); cheio, as
+    # novas ocupam o lugar das mais antigas. Por faixa, as chaves ficam ordenadas junto com a
+    # linha do buffer: cada inserção só encaixa as chaves novas (searchsorted) e tira as das
+    # linhas sobrescritas, sem reordenar o índice inteiro.
+    def __init__(self, capacidade=0):
+        self.capacidade = capacidade
+        self.lock = threading.Lock()
+        self.matriz = VAZIO
+        self.chaves_linhas = np.empty((0, FAIXAS), dtype=np.uint64)  # Para tirar as chaves de uma linha
+        self.ocupadas = 0
+        self.proxima = 0  # Linha mais antiga, a próxima a ser sobrescrita com o buffer cheio
+        self.chaves = [np.empty(0, dtype=np.uint64) for _ in range(FAIXAS)]
+        self.linhas = [np.empty(0, dtype=np.intp) for _ in range(FAIXAS)]
+
+    def __len__(self):
+        return self.ocupadas
+
+    def reservar(self, quantidade):
+        # Cresce o buffer dobrando de tamanho, como uma lista
+        if self.ocupadas + quantidade <= len(self.matriz):
+            return
+        tamanho = max(self.ocupadas + quantidade, 2 * len(self.matriz))
+        if self.capacidade:
+            tamanho = min(tamanho, self.capacidade)
+        matriz = np.empty((tamanho, NUM_PERMUTACOES), dtype=np.uint32)
+        chaves = np.empty((tamanho, FAIXAS), dtype=np.uint64)
+        matriz[:self.ocupadas] = self.matriz[:self.ocupadas]
+        chaves[:self.ocupadas] = self.chaves_linhas[:self.ocupadas]
+        self.matriz, self.chaves_linhas = matriz, chaves
+
+    def adicionar(self, novas):
+        if self.capacidade:
+            novas = novas[-self.capacidade:]
+        if not len(novas):
+            return
+        chaves_novas = chaves_das_faixas(novas)
+        with self.lock:
+            livres = self.capacidade - self.ocupadas if self.capacidade else len(novas)
+            no_fim = min(len(novas), livres)
+            self.reservar(no_fim)
+            linhas = np.arange(self.ocupadas, self.ocupadas + no_fim, dtype=np.intp)
+            self.ocupadas += no_fim
+            sobrescritas = (self.proxima + np.arange(len(novas) - no_fim, dtype=np.intp)) % max(self.capacidade, 1)
+            if len(sobrescritas):
+                self.proxima = (self.proxima + len(sobrescritas)) % self.capacidade
+                removidas = np.zeros(self.ocupadas, dtype=bool)
+                removidas[sobrescritas] = True
+                for f in range(FAIXAS):
+                    manter = ~removidas[self.linhas[f]]
+                    self.chaves[f], self.linhas[f] = self.chaves[f][manter], self.linhas[f][manter]
+                linhas = np.concatenate([linhas, sobrescritas])
+            self.matriz[linhas] = novas
+            self.chaves_linhas[linhas] = chaves_novas
+            for f in range(FAIXAS):
+                ordem = np.argsort(chaves_novas[:, f], kind='stable')
+                onde = np.searchsorted(self.chaves[f], chaves_novas[ordem, f], 'right')
+                self.chaves[f] = np.insert(self.chaves[f], onde, chaves_novas[ordem, f])
+                self.linhas[f] = np.insert(self.linhas[f], onde, linhas[ordem])
+
+    def similaridade_maxima(self, novas):
+        # Maior similaridade de cada linha de `novas` com as assinaturas do índice
+        resultado = np.zeros(len(novas), dtype=np.float64)
+        consultas = chaves_das_faixas(novas)
+        with self.lock:
+            if not self.ocupadas:
+                return resultado
+            inicios = np.stack([np.searchsorted(self.chaves[f], consultas[:, f], 'left') for f in range(FAIXAS)], axis=1)
+            fins = np.stack([np.searchsorted(self.chaves[f], consultas[:, f], 'right') for f in range(FAIXAS)], axis=1)
+            for i in range(len(novas)):
+                candidatas = [self.linhas[f][inicios[i, f]:fins[i, f]] for f in range(FAIXAS) if fins[i, f] > inicios[i, f]]
+                if candidatas:
+                    linhas = np.unique(np.concatenate(candidatas))
+                    resultado[i] = (self.matriz[linhas] == novas[i]).mean(axis=1).max()
+        return resultado
+
+
+# --- Índice persistente por tema ---
+
+class IndiceTema(IndiceLSH):
+    def __init__(self, capacidade=0):
+        super().__init__(capacidade)
+        self.carga = threading.Lock()
+        self.ultimo_id = 0
+
+
+_indices = OrderedDict()  # Temas usados mais recentemente no fim
+_indices_lock = threading.Lock()
+
+
+def indice_do_tema(tema):
+    # Assinaturas das questões do tema; só as criadas desde a última carga vêm do banco.
+    # Ficam as DEDUPLICACAO['POR_TEMA'] mais recentes de cada tema e os DEDUPLICACAO['TEMAS']
+    # temas usados por último; um tema que sai da memória é recarregado do banco.
+    # Questões apagadas continuam no índice até o processo reiniciar (ou `limpar_memoria`).
+    from .models import AssinaturaQuestao
+
+    limites = settings.DEDUPLICACAO
+    with _indices_lock:
+        indice = _indices.get(tema)
+        if indice is None:
+            indice = _indices[tema] = IndiceTema(limites['POR_TEMA'])
+        _indices.move_to_end(tema)
+        while limites['TEMAS'] and len(_indices) > limites['TEMAS']:
+            _indices.popitem(last=False)
+    with indice.carga:
+        consulta = (
+            AssinaturaQuestao.objects.filter(tema=tema, questao_id__gt=indice.ultimo_id)
+            .order_by('-questao_id').values_list('questao_id', 'assinatura')
+        )
+        novas = list(consulta[:indice.capacidade] if indice.capacidade else consulta)[::-1]
+        if novas:
+            matriz = np.frombuffer(b''.join(bytes(a) for _, a in novas), dtype=np.uint32)
+            indice.adicionar(matriz.reshape(-1, NUM_PERMUTACOES))
+            indice.ultimo_id = novas[-1][0]
+    return indice
+
+
+def limpar_memoria():
+    with _indices_lock:
+        _indices.clear()
+
+
+def registrar(questoes):
+    # Grava (ou atualiza) a assinatura das questões; chamado junto com a indexação da busca
+    from .models import AssinaturaQuestao
+
+    questoes = [q for q in questoes if q.pk is not None]
+    if not questoes:
+        return
+    matriz = assinaturas([q.enunciado for q in questoes])
+    AssinaturaQuestao.objects.bulk_create(
+        [AssinaturaQuestao(questao_id=q.pk, tema=q.tema, assinatura=linha.tobytes())
+         for q, linha in zip(questoes, matriz)],
+        update_conflicts=True, unique_fields=['questao'], update_fields=['tema', 'assinatura'],
+    )
+
+
+def reconstruir(tamanho_lote=500):
+    from .models import AssinaturaQuestao, Questao
+
+    AssinaturaQuestao.objects.all().delete()
+    limpar_memoria()
+    total = 0
+    lote = []
+    for questao in Questao.objects.only('id', 'tema', 'enunciado').iterator(chunk_size=tamanho_lote):
+        lote.append(questao)
+        if len(lote) >= tamanho_lote:
+            registrar(lote)
+            total += len(lote)
+            lote = []
+    registrar(lote)
+    return total + len(lote)
+
+
+class Deduplicador:
+    # Acumula as questões aceitas e descarta as quase idênticas a alguma delas. Com `tema`,
+    # descarta também as quase idênticas a questões do banco com o mesmo tema; estas ficam
+    # em `repetidas_do_banco`, como reserva caso a LLM não consiga gerar outras.
+    def __init__(self, limiar, tema=None):
+        self.limiar = limiar
+        self.tema = tema
+        self.existentes = IndiceLSH()
+        self._assinaturas = VAZIO
+        self.repetidas_do_banco = []
+
+    def carregar(self):
+        # Consulta o banco: chamar fora de threads e do loop de eventos, como curriculo.carregar
+        if self.tema is not None:
+            self.existentes = indice_do_tema(self.tema)
+
+    def filtrar(self, questoes):
+        if not questoes:
+            return []
+        novas = assinaturas([questao['enunciado'] for questao in questoes])
+        no_banco = self.existentes.similaridade_maxima(novas) >= self.limiar
+        # As aceitas nesta geração são poucas: comparação direta com todas
+        comparaveis = np.vstack([self._assinaturas, novas])
+        repetidas = similaridades(novas, comparaveis) >= self.limiar
+        anteriores = len(self._assinaturas)
+
+        aceitas, linhas = [], list(range(anteriores))
+        for i, questao in enumerate(questoes):
+            if no_banco[i]:
+                metricas.DUPLICATAS.inc(origem='banco')
+                self.repetidas_do_banco.append(questao)
+            elif repetidas[i, linhas].any():
+                metricas.DUPLICATAS.inc(origem='prova')
+            else:
+                aceitas.append(questao)
+                linhas.append(anteriores + i)
+        self._assinaturas = comparaveis[linhas]
+        return aceitas
+
+    def reserva(self, quantidade):
+        # Repetidas do banco ainda distintas entre si e das aceitas, para completar a prova
+        candidatas, self.repetidas_do_banco = self.repetidas_do_banco, []
+        existentes, self.existentes = self.existentes, IndiceLSH()
+        try:
+            return self.filtrar(candidatas)[:quantidade]
+        finally:
+            self.existentes = existentes
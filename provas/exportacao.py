@@ -0,0 +1,80 @@
+import zipfile
+
+from .models import CriteriosProva, SnapshotProva, prefetch_questoes
+from . import pdf, snapshots
+
+# Exportação em massa: um ZIP montado entrada a entrada e entregue em pedaços,
+# sem nunca ter a exportação inteira em memória
+
+FORMATOS = ('json', 'pdf')
+TAMANHO_BLOCO = 64 * 1024
+
+
+class SaidaEmPartes:
+    # Destino do ZipFile: acumula os bytes escritos até o gerador entregá-los.
+    # Sem tell()/seek(), o zipfile escreve as entradas em modo de fluxo (data descriptor).
+    def __init__(self):
+        self.partes = []
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = b''.join(self.partes)
+        self.partes = []
+        return dados
+
+
+def gerar_zip(provas, formatos=FORMATOS, tamanho_lote=100):
+    saida = SaidaEmPartes()
+    with zipfile.ZipFile(saida, 'w', compression=zipfile.ZIP_DEFLATED) as arquivo_zip:
+        for prova in provas.select_related('snapshot').order_by('id').iterator(chunk_size=tamanho_lote):
+            for nome, blocos, compressao in entradas(prova, formatos):
+                informacoes = zipfile.ZipInfo(nome)
+                informacoes.compress_type = compressao
+                with arquivo_zip.open(informacoes, 'w') as destino:
+                    for bloco in blocos:
+                        destino.write(bloco)
+                        dados = saida.esvaziar()
+                        if dados:
+                            yield dados
+            dados = saida.esvaziar()
+            if dados:
+                yield dados
+    yield saida.esvaziar()  # Diretório central do ZIP
+
+
+def entradas(prova, formatos):
+    pasta = f"prova-{prova.id}"
+    if 'json' in formatos:
+        prova_json, gabarito_json = json_da_prova(prova)
+        yield f"{pasta}/prova.json", [prova_json], zipfile.ZIP_DEFLATED
+        if gabarito_json is not None:
+            yield f"{pasta}/gabarito.json", [gabarito_json], zipfile.ZIP_DEFLATED
+    if 'pdf' in formatos:
+        for tipo in pdf.TIPOS:
+            # PDF já vem comprimido; guardado sem nova compressão
+            yield f"{pasta}/{tipo}.pdf", ler_em_blocos(pdf.obter(tipo, prova.id)), zipfile.ZIP_STORED
+
+
+def json_da_prova(prova):
+    # Usa o snapshot quando está na versão atual; senão serializa a prova na hora
+    try:
+        snapshot = prova.snapshot
+    except SnapshotProva.DoesNotExist:
+        snapshot = None
+    if snapshot is not None and snapshot.versao == snapshots.VERSAO:
+        gabarito_json = snapshot.gabarito_json
+        return bytes(snapshot.prova_json), bytes(gabarito_json) if gabarito_json is not None else None
+    completa = CriteriosProva.objects.select_related('gabarito').prefetch_related(prefetch_questoes()).get(id=prova.id)
+    return snapshots.renderizar(completa)
+
+
+def ler_em_blocos(caminho):
+    with open(caminho, 'rb') as arquivo:
+        while bloco := arquivo.read(TAMANHO_BLOCO):
+            yield bloco
@@ -0,0 +1,472 @@
+import asyncio
+import contextvars
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from . import (banco_questoes, busca, cache_geracao, curriculo, deduplicacao, governador, llm, metricas, pdf,
+               roteamento, snapshots, transporte)
+from .deduplicacao import Deduplicador
+from .models import Questao, ItemProva, Gabarito, NivelDificuldade, TipoQuestao
+from .resposta_llm import ParserQuestoesIncremental, extrair_objetos
+
+logger = logging.getLogger(__name__)
+
+PROMPT_VERSAO = 2  # Incrementar ao mudar o texto de criar_prompt (invalida o cache de gerações)
+MAX_EVITAR = 20  # Enunciados já recebidos citados no pedido de complemento
+
+
+def gerar_questoes(criterios, usar_cache=True, usar_banco=False):
+    # Gera as questões e o gabarito. `criterios` pode ainda não estar salvo:
+    # nesse caso é gravado na mesma transação das questões.
+    # Com `usar_banco`, reaproveita questões já pagas e só pede à LLM o que faltar.
+    reaproveitadas = banco_questoes.selecionar(criterios) if usar_banco else []
+    faltantes = criterios.quantidade_questoes - len(reaproveitadas)
+    questoes_geradas = []
+    if faltantes > 0:
+        chave = chave_cache(criterios, faltantes)
+        em_cache = questoes_em_cache(chave, reaproveitadas) if usar_cache else None
+        if em_cache is not None:
+            reaproveitadas = reaproveitadas + em_cache
+        else:
+            questoes_geradas = gerar_em_lotes(criterios, faltantes)
+
+    # --- Criar as questões no banco de dados ---
+    questoes = persistir_questoes(criterios, reaproveitadas, questoes_geradas)
+    if questoes_geradas:
+        cache_geracao.salvar(chave, questoes[len(reaproveitadas):])
+    return criterios
+
+
+def chave_cache(criterios, quantidade):
+    return cache_geracao.chave_criterios(criterios, roteamento.obter().chave_modelos(), PROMPT_VERSAO, quantidade)
+
+
+def questoes_em_cache(chave, reaproveitadas):
+    # Questões da geração em cache, ou None. Se alguma já veio do banco para esta prova,
+    # o acerto não serve (a prova ficaria com uma questão a menos).
+    questoes = cache_geracao.obter(chave)
+    if questoes is not None and {q.id for q in questoes} & {q.id for q in reaproveitadas}:
+        return None
+    return questoes
+
+
+def gerar_em_lotes(criterios, quantidade):
+    # Divide a prova em lotes pequenos e chama a LLM para todos ao mesmo tempo.
+    # Lotes que falharem ou vierem incompletos são pedidos de novo, só no que faltou.
+    plano = PlanoLotes(criterios, quantidade)
+    # Antes das threads: o resumo do currículo e o índice de duplicatas consultam o banco
+    curriculo.carregar(criterios)
+    plano.deduplicador.carregar()
+    while plano.pendentes:
+        with ThreadPoolExecutor(max_workers=min(plano.max_paralelo, len(plano.pendentes))) as executor:
+            # copy_context: as threads continuam somando no Server-Timing da requisição
+            futuros = [executor.submit(contextvars.copy_context().run, gerar_lote, criterios, *lote)
+                       for lote in plano.lotes()]
+        plano.registrar([futuro.exception() or futuro.result() for futuro in futuros])
+    return plano.resultado()
+
+
+class PlanoLotes:
+    # Estado da geração em lotes, compartilhado pelos caminhos com threads e com asyncio
+    def __init__(self, criterios, quantidade):
+        config = settings.GERACAO_LOTES
+        self.max_paralelo = config['MAX_PARALELO']
+        # (quantidade, tipos, enunciados a não repetir)
+        self.pendentes = [(qtd, tipos, []) for qtd, tipos in
+                          dividir_em_lotes(quantidade, banco_questoes.tipos_da_prova(criterios), config['TAMANHO'])]
+        self.rodadas_restantes = config['TENTATIVAS']
+        self.quantidade = quantidade
+        self.deduplicador = Deduplicador(config['LIMIAR_DUPLICATA'], banco_questoes.normalizar_tema(criterios.tema))
+        self.questoes = []
+        self.ultimo_erro = None
+
+    def lotes(self):
+        # Pendentes com a réplica: lotes iguais na mesma rodada devem gerar questões
+        # diferentes, então não podem ser coalescidos pelo governador numa só chamada
+        vistos = Counter()
+        for qtd, tipos, evitar in self.pendentes:
+            chave = (qtd, tuple(tipos), tuple(evitar))
+            yield qtd, tipos, evitar, vistos[chave]
+            vistos[chave] += 1
+
+    def registrar(self, resultados):
+        # `resultados` segue a ordem de `pendentes`: lista de questões ou a exceção do lote.
+        # O complemento pede só o que faltou e cita o que já chegou, para não vir repetido.
+        faltando = []
+        for (qtd, tipos, evitar), geradas in zip(self.pendentes, resultados):
+            if isinstance(geradas, (governador.LimiteLLMExcedido, transporte.LLMIndisponivel)):
+                # O governador já esperou o que podia, ou o disjuntor está aberto: nova tentativa
+                # só esperaria (ou falharia) de novo
+                self.ultimo_erro = geradas
+                continue
+            if isinstance(geradas, Exception):
+                logger.warning("Falha em um lote de %s questões: %s", qtd, geradas)
+                self.ultimo_erro = geradas
+                geradas = []
+            aceitas = self.deduplicador.filtrar(geradas[:qtd])
+            self.questoes.extend(aceitas)
+            if len(aceitas) < qtd:
+                evitar = [*evitar, *(q['enunciado'] for q in aceitas)][-MAX_EVITAR:]
+                faltando.append((qtd - len(aceitas), tipos, evitar))
+
+        if self.rodadas_restantes > 0:
+            self.rodadas_restantes -= 1
+            self.pendentes = faltando
+        else:
+            self.pendentes = []
+
+    def resultado(self):
+        faltam = self.quantidade - len(self.questoes)
+        if faltam > 0:
+            # Melhor uma questão parecida com outra do banco do que uma prova incompleta
+            self.questoes.extend(self.deduplicador.reserva(faltam))
+        if not self.questoes and self.ultimo_erro is not None:
+            raise self.ultimo_erro
+        return self.questoes
+
+
+def dividir_em_lotes(quantidade, tipos, tamanho):
+    # Prova pequena: um único pedido com todos os tipos, como sempre foi.
+    # Prova grande: a quantidade é repartida entre os tipos e cada tipo em lotes de até `tamanho`.
+    if quantidade <= tamanho or len(tipos) == 0:
+        return [(quantidade, tipos)]
+    lotes = []
+    for i, tipo in enumerate(tipos):
+        restante = quantidade // len(tipos) + (1 if i < quantidade % len(tipos) else 0)
+        while restante > 0:
+            lotes.append((min(tamanho, restante), [tipo]))
+            restante -= tamanho
+    return lotes
+
+
+def gerar_lote(criterios, quantidade, tipos, evitar=(), replica=0):
+    prompt = criar_prompt(criterios, quantidade, tipos, evitar)
+    with chamada_llm():
+        # O roteamento escolhe o modelo pela quantidade e pelos tipos do lote
+        chat_completion = roteamento.criar(
+            quantidade, tipos,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt,
+                }
+            ],
+            replica=replica,
+        )
+    metricas.registrar_uso_llm(chat_completion)
+
+    # --- Processar a resposta do Groq ---
+    return processar_resposta_groq(chat_completion, criterios)
+
+
+@contextmanager
+def chamada_llm():
+    # Tempo da chamada (fase "llm") e contagem de sucessos/falhas
+    with metricas.fase('llm'):
+        try:
+            yield
+        except Exception:
+            metricas.CHAMADAS_LLM.inc(resultado='erro')
+            raise
+    metricas.CHAMADAS_LLM.inc(resultado='ok')
+
+
+# --- Caminho assíncrono (ASGI): mesma lógica, com AsyncGroq e o ORM assíncrono ---
+
+async def agerar_questoes(criterios, usar_cache=True, usar_banco=False):
+    reaproveitadas = await sync_to_async(banco_questoes.selecionar)(criterios) if usar_banco else []
+    faltantes = criterios.quantidade_questoes - len(reaproveitadas)
+    questoes_geradas = []
+    if faltantes > 0:
+        chave = chave_cache(criterios, faltantes)
+        em_cache = await sync_to_async(questoes_em_cache)(chave, reaproveitadas) if usar_cache else None
+        if em_cache is not None:
+            reaproveitadas = reaproveitadas + em_cache
+        else:
+            questoes_geradas = await agerar_em_lotes(criterios, faltantes)
+
+    questoes = await sync_to_async(persistir_questoes)(criterios, reaproveitadas, questoes_geradas)
+    if questoes_geradas:
+        await sync_to_async(cache_geracao.salvar)(chave, questoes[len(reaproveitadas):])
+    return criterios
+
+
+async def agerar_em_lotes(criterios, quantidade):
+    plano = PlanoLotes(criterios, quantidade)
+    limite = asyncio.Semaphore(plano.max_paralelo)
+    await sync_to_async(curriculo.carregar)(criterios)
+    await sync_to_async(plano.deduplicador.carregar)()
+
+    async def lote_limitado(qtd, tipos, evitar, replica):
+        async with limite:
+            return await agerar_lote(criterios, qtd, tipos, evitar, replica)
+
+    while plano.pendentes:
+        plano.registrar(await asyncio.gather(
+            *(lote_limitado(*lote) for lote in plano.lotes()),
+            return_exceptions=True,
+        ))
+    return plano.resultado()
+
+
+async def agerar_lote(criterios, quantidade, tipos, evitar=(), replica=0):
+    prompt = criar_prompt(criterios, quantidade, tipos, evitar)
+    with chamada_llm():
+        chat_completion = await roteamento.acriar(
+            quantidade, tipos,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt,
+                }
+            ],
+            replica=replica,
+        )
+    metricas.registrar_uso_llm(chat_completion)
+    return processar_resposta_groq(chat_completion, criterios)
+
+
+def persistir_questoes(criterios, reaproveitadas, questoes_geradas):
+    # Toda a escrita da prova em uma transação: critérios (se ainda não salvos),
+    # questões novas, itens e gabarito, com bulk_create e sem reconsultar o banco.
+    # Questões do banco entram primeiro, seguidas das geradas agora.
+    tema = banco_questoes.normalizar_tema(criterios.tema)
+    with metricas.fase('persistir'), transaction.atomic():
+        if criterios.pk is None:
+            criterios.save()
+        novas = Questao.objects.bulk_create(
+            [Questao(tema=tema, **questao_data) for questao_data in questoes_geradas]
+        )
+        busca.indexar(novas)
+        deduplicacao.registrar(novas)
+        questoes = list(reaproveitadas) + novas
+        ItemProva.objects.bulk_create(
+            [ItemProva(prova=criterios, questao=questao, ordem=ordem) for ordem, questao in enumerate(questoes)]
+        )
+
+        finalizar_prova(criterios, questoes)
+    return questoes
+
+
+def finalizar_prova(criterios, questoes):
+    # --- Criar o gabarito ---
+    respostas = {str(questao.id): questao.resposta for questao in questoes}
+    Gabarito.objects.create(prova=criterios, respostas=respostas)
+
+    # Snapshot JSON para as leituras, renderizado a partir das questões em memória
+    guardar_questoes_carregadas(criterios, questoes)
+    snapshots.salvar(criterios)
+    pdf.agendar(criterios.id)
+
+
+def guardar_questoes_carregadas(criterios, questoes):
+    # Preenche o cache de prefetch com as questões em memória, para que a
+    # serialização da resposta não precise consultar as questões de novo
+    queryset = criterios.questoes.all()
+    queryset._result_cache = list(questoes)
+    queryset._prefetch_done = True
+    criterios._prefetched_objects_cache = {'questoes': queryset}
+
+
+def criar_questao(criterios, questao_data):
+    # Toda questão nova entra no banco indexada pelo tema normalizado da prova
+    return Questao.objects.create(tema=banco_questoes.normalizar_tema(criterios.tema), **questao_data)
+
+
+def gerar_questoes_em_fluxo(criterios, usar_cache=True):
+    # Variante com streaming: salva e devolve cada questão assim que o objeto
+    # correspondente termina de chegar da LLM. O gabarito é criado ao final.
+    roteador = roteamento.obter()
+    chave = cache_geracao.chave_criterios(criterios, roteador.chave_modelos(), PROMPT_VERSAO)
+    questoes_cache = cache_geracao.obter(chave) if usar_cache else None
+    salvas = []
+    if questoes_cache is not None:
+        for ordem, questao in enumerate(questoes_cache):
+            ItemProva.objects.create(prova=criterios, questao=questao, ordem=ordem)
+            salvas.append(questao)
+            yield questao
+        finalizar_prova(criterios, salvas)
+        return
+
+    prompt = criar_prompt(criterios)
+    # O stream vai direto ao cliente: sem hedge, só o modelo mais indicado para a prova
+    modelo = roteador.candidatos(criterios.quantidade_questoes, banco_questoes.tipos_da_prova(criterios))[0]
+    # Como na geração em lotes: fora as quase idênticas entre si e às do banco com o mesmo tema
+    deduplicador = Deduplicador(settings.GERACAO_LOTES['LIMIAR_DUPLICATA'], banco_questoes.normalizar_tema(criterios.tema))
+    deduplicador.carregar()
+    parser = ParserQuestoesIncremental()
+    questoes_geradas = []
+    try:
+        with chamada_llm():  # Até o início do stream
+            stream = llm.criar(
+                messages=[
+                    {
+                        "role": "user",
+                        "content": prompt,
+                    }
+                ],
+                model=modelo,
+                stream=True,
+            )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            for questao in parser.alimentar(chunk.choices[0].delta.content or ""):
+                questao_data = formatar_questao(questao)
+                if questao_data is None or not deduplicador.filtrar([questao_data]):
+                    continue
+                questao = criar_questao(criterios, questao_data)
+                ItemProva.objects.create(prova=criterios, questao=questao, ordem=len(salvas))
+                questoes_geradas.append(questao_data)
+                salvas.append(questao)
+                yield questao
+        if not parser.finalizado:
+            logger.warning("Stream do Groq incompleto para a prova %s: %s questões recebidas",
+                           criterios.id, len(questoes_geradas))
+        faltantes = criterios.quantidade_questoes - len(salvas)
+        if faltantes > 0:
+            # Resposta truncada ou com itens inválidos: uma chamada só para o que faltou
+            complemento = complementar(criterios, faltantes, questoes_geradas, deduplicador)
+            # Melhor uma questão parecida com outra do banco do que uma prova incompleta
+            complemento += deduplicador.reserva(faltantes - len(complemento))
+            for questao_data in complemento:
+                questao = criar_questao(criterios, questao_data)
+                ItemProva.objects.create(prova=criterios, questao=questao, ordem=len(salvas))
+                questoes_geradas.append(questao_data)
+                salvas.append(questao)
+                yield questao
+        if questoes_geradas and len(salvas) == criterios.quantidade_questoes:
+            # Só entra no cache uma prova completa
+            cache_geracao.salvar(chave, salvas)
+    finally:
+        # Mesmo se a chamada falhar ou o stream for interrompido, a prova fica com o gabarito do que foi salvo
+        finalizar_prova(criterios, salvas)
+
+
+def complementar(criterios, quantidade, recebidas, deduplicador):
+    # `deduplicador` já viu as recebidas: descarta as repetidas delas e do banco
+    evitar = [q['enunciado'] for q in recebidas][-MAX_EVITAR:]
+    try:
+        geradas = gerar_lote(criterios, quantidade, banco_questoes.tipos_da_prova(criterios), evitar)
+    except Exception as e:
+        logger.warning("Falha ao complementar a prova %s: %s", criterios.id, e)
+        return []
+    return deduplicador.filtrar(geradas)[:quantidade]
+
+
+def criar_prompt(criterios, quantidade=None, tipos=None, evitar=()):
+    # Constrói o prompt para o Groq
+    if quantidade is None:
+        quantidade = criterios.quantidade_questoes
+    if tipos is None:
+        tipos_display = criterios.get_tipos_questoes_display()
+    else:
+        tipos_display = ', '.join(str(TipoQuestao(t).label) if t in TipoQuestao.values else t for t in tipos)
+    prompt = f"""
+    Gere {quantidade} questões sobre o tema '{criterios.tema}',
+    com nível de dificuldade '{criterios.get_dificuldade_display()}'
+    e com os seguintes tipos: {tipos_display}.
+    """
+    # Currículos longos entram como resumo em tópicos (provas.curriculo)
+    texto_curriculo = curriculo.para_prompt(criterios)
+    if texto_curriculo:
+        prompt += f" Considere o seguinte currículo: {texto_curriculo}."
+    if evitar:
+        # Complemento de uma resposta incompleta
+        enunciados = '\n'.join(f"    - {enunciado[:150]}" for enunciado in evitar)
+        prompt += f"\n    Estas questões já foram geradas; não as repita:\n{enunciados}\n"
+
+    prompt += """
+    Retorne as questões e respostas no seguinte formato JSON:
+    {
+      "questoes": [
+        {
+          "tipo": "multipla_escolha",
+          "enunciado": "...",
+          "opcoes": ["...", "..."],
+          "resposta": "...",
+          "nivel_dificuldade": "..."
+        },
+        {
+          "tipo": "dissertativa",
+          "enunciado": "...",
+          "resposta": "...",
+          "nivel_dificuldade": "..."
+        }
+      ]
+    }
+    """
+    return prompt
+
+
+def processar_resposta_groq(chat_completion, criterios):
+    # Extrai as questões e respostas do JSON retornado pelo Groq
+    with metricas.fase('parse'):
+        return extrair_questoes(chat_completion)
+
+
+def extrair_questoes(chat_completion):
+    # Aproveita tudo o que der: JSON em cercas de markdown, com texto em volta ou truncado.
+    # O que faltar é pedido de novo pelo PlanoLotes, só na quantidade que faltou.
+    try:
+        escolha = chat_completion.choices[0]
+        texto = escolha.message.content or ""
+    except (AttributeError, IndexError, TypeError) as e:
+        logger.warning("Erro ao processar a resposta do Groq: %s", e)
+        return []
+
+    objetos, completa = extrair_objetos(texto)
+    if not completa:
+        if not objetos:
+            logger.warning("Erro ao processar a resposta do Groq: nenhuma questão em %r", texto[:200])
+            return []
+        logger.warning("Resposta do Groq incompleta (finish_reason=%s): %s questões recuperadas",
+                       getattr(escolha, 'finish_reason', None), len(objetos))
+
+    questoes_formatadas = [q for q in map(formatar_questao, objetos) if q is not None]
+    if len(questoes_formatadas) < len(objetos):
+        logger.warning("%s questões inválidas descartadas da resposta do Groq",
+                       len(objetos) - len(questoes_formatadas))
+    return questoes_formatadas
+
+
+def normalizar_escolha(valor, escolhas):
+    # Aceita o valor ou o rótulo, sem acentos nem caixa ("Múltipla Escolha" -> multipla_escolha)
+    if not isinstance(valor, str):
+        return None
+    chave = busca.sem_acentos(valor.strip().lower()).replace(' ', '_').replace('/', '_')
+    return chave if chave in escolhas.values else None
+
+
+def formatar_questao(questao):
+    # Normaliza e valida um objeto de questão vindo da LLM; None se for inválido
+    if not isinstance(questao, dict):
+        return None
+    tipo = normalizar_escolha(questao.get("tipo"), TipoQuestao)
+    enunciado = questao.get("enunciado")
+    resposta_questao = questao.get("resposta")
+    opcoes = questao.get("opcoes", None)
+
+    if tipo is None or not isinstance(enunciado, str) or not enunciado.strip():
+        return None
+    if resposta_questao is None or isinstance(resposta_questao, (dict, list)) or str(resposta_questao).strip() == "":
+        return None
+    if not isinstance(opcoes, list) or not all(isinstance(o, str) and o.strip() for o in opcoes):
+        opcoes = None
+    if tipo == TipoQuestao.MULTIPLA_ESCOLHA and (opcoes is None or len(opcoes) < 2):
+        return None
+
+    return {
+        "tipo": tipo,
+        "enunciado": enunciado.strip(),
+        "resposta": resposta_questao if isinstance(resposta_questao, str) else str(resposta_questao),
+        # Nível fora da escala fica em branco em vez de descartar a questão
+        "nivel_dificuldade": normalizar_escolha(questao.get("nivel_dificuldade"), NivelDificuldade),
+        "opcoes": opcoes
+    }
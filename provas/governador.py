@@ -0,0 +1,535 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from pydantic import BaseModel
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from . import metricas
+
+logger = logging.getLogger(__name__)
+
+# Governador das chamadas à LLM: todas passam por aqui (provas.llm.criar/acriar).
+#
+# *   baldes de fichas para requisições e tokens por minuto (o balde de tokens é debitado
+#     pela estimativa do prompt mais TOKENS_RESPOSTA_ESTIMADOS e acertado pelo `usage` real);
+# *   limite de chamadas em andamento (MAX_EM_VOO), com o tempo de fila em
+#     provas_llm_espera_segundos;
+# *   coalescência: chamadas idênticas simultâneas (mesmo modelo e mensagens) fazem uma só
+#     chamada ao provedor e todas recebem a mesma resposta.
+#
+# Com o backend 'arquivo', o estado fica num arquivo travado com flock, compartilhado pelos
+# workers do gunicorn da mesma máquina, e as respostas coalescidas entre workers passam por
+# arquivos no mesmo diretório. O backend 'memoria' vale só para o processo atual.
+# No caminho assíncrono, as operações do backend 'arquivo' rodam em threads (asyncio.to_thread):
+# esperar o flock não para as outras corrotinas do worker ASGI.
+
+BACKENDS = {
+    'memoria': 'provas.governador.EstadoMemoria',
+    'arquivo': 'provas.governador.EstadoArquivo',
+}
+
+INTERVALO_ESPERA = 0.05  # Segundos entre novas tentativas de entrar
+DURACAO_MAXIMA = 300  # Vaga de quem não a devolveu nesse tempo (processo morto, travado) é liberada
+VALIDADE_RESULTADO = 60  # Segundos que a resposta de uma chamada fica disponível a outros workers
+CARACTERES_POR_TOKEN = 4
+ESPERA_429_PADRAO = 5  # Sem Retry-After no 429 do provedor
+
+
+class LimiteLLMExcedido(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Limite de chamadas à LLM atingido. Tente novamente em instantes."
+    default_code = 'limite_llm'
+
+    def __init__(self, espera):
+        super().__init__()
+        self.wait = max(1, round(espera))  # O DRF devolve como Retry-After
+
+
+# --- Estado compartilhado ---
+
+class EstadoMemoria:
+    def __init__(self, config):
+        self.lock = threading.Lock()
+        self.dados = {}
+
+    @contextmanager
+    def transacao(self):
+        with self.lock:
+            yield self.dados
+
+    def gravar_resultado(self, chave, texto):
+        pass  # No mesmo processo, a coalescência já entrega o objeto
+
+    def ler_resultado(self, chave, desde):
+        return None
+
+
+class EstadoArquivo:
+    def __init__(self, config):
+        self.diretorio = Path(config['DIRETORIO'])
+        (self.diretorio / 'voos').mkdir(parents=True, exist_ok=True)
+        self.caminho = self.diretorio / 'estado.json'
+        self.lock = threading.Lock()  # Threads do mesmo processo esperam aqui, não no flock
+
+    @contextmanager
+    def transacao(self):
+        with self.lock:
+            descritor = os.open(self.caminho, os.O_RDWR | os.O_CREAT, 0o644)
+            with os.fdopen(descritor, 'r+b') as arquivo:
+                fcntl.flock(arquivo, fcntl.LOCK_EX)
+                try:
+                    try:
+                        dados = json.loads(arquivo.read() or b'{}')
+                    except ValueError:
+                        dados = {}  # Arquivo corrompido: recomeça sem histórico
+                    yield dados
+                    arquivo.seek(0)
+                    arquivo.truncate()
+                    arquivo.write(json.dumps(dados).encode())
+                    arquivo.flush()
+                finally:
+                    fcntl.flock(arquivo, fcntl.LOCK_UN)
+
+    def caminho_resultado(self, chave):
+        return self.diretorio / 'voos' / f'{chave}.json'
+
+    def gravar_resultado(self, chave, texto):
+        temporario = self.caminho_resultado(chave).with_suffix(f'.{os.getpid()}.tmp')
+        temporario.write_text(texto, encoding='utf-8')
+        os.replace(temporario, self.caminho_resultado(chave))
+        limite = time.time() - VALIDADE_RESULTADO
+        for antigo in self.diretorio.joinpath('voos').glob('*.json'):
+            try:
+                if antigo.stat().st_mtime < limite:
+                    antigo.unlink()
+            except FileNotFoundError:
+                pass
+
+    def ler_resultado(self, chave, desde):
+        # Só vale a resposta gravada depois que começamos a esperar por ela
+        try:
+            caminho = self.caminho_resultado(chave)
+            if caminho.stat().st_mtime >= desde:
+                return caminho.read_text(encoding='utf-8')
+        except FileNotFoundError:
+            pass
+        return None
+
+
+def processo_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# --- Governador ---
+
+def chave_voo(kwargs, replica=0):
+    # Chamadas com a mesma chave são coalescidas. `replica` separa pedidos iguais que devem
+    # gerar respostas diferentes (lotes idênticos da mesma prova).
+    dados = json.dumps([kwargs.get('model'), kwargs.get('messages'), replica], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(dados.encode('utf-8')).hexdigest()
+
+
+def estimar_tokens(kwargs, resposta):
+    texto = ''.join(str(m.get('content', '')) for m in kwargs.get('messages', []))
+    return len(texto) // CARACTERES_POR_TOKEN + resposta
+
+
+def tokens_usados(resultado):
+    total = getattr(getattr(resultado, 'usage', None), 'total_tokens', None)
+    return total if isinstance(total, int) else None
+
+
+def espera_do_429(erro):
+    try:
+        return float(erro.response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return ESPERA_429_PADRAO
+
+
+class Governador:
+    def __init__(self, config):
+        self.estado = import_string(BACKENDS.get(config['BACKEND'], config['BACKEND']))(config)
+        self.requisicoes_por_minuto = config['REQUISICOES_POR_MINUTO']
+        self.tokens_por_minuto = config['TOKENS_POR_MINUTO']
+        self.max_em_voo = config['MAX_EM_VOO']
+        self.espera_maxima = config['ESPERA_MAXIMA']
+        self.tokens_resposta = config['TOKENS_RESPOSTA_ESTIMADOS']
+        self.compartilhar_respostas = not isinstance(self.estado, EstadoMemoria)
+        self.estado_bloqueante = not isinstance(self.estado, EstadoMemoria)
+        self._voos = {}  # chave -> Future, coalescência dentro do processo
+        self._voos_lock = threading.Lock()
+
+    # Baldes e vagas; `dados` é o estado dentro de uma transação
+
+    def reabastecer(self, dados, nome, capacidade, agora):
+        balde = dados.setdefault('baldes', {}).setdefault(nome, {'nivel': capacidade, 'atualizado': agora})
+        decorrido = max(0.0, agora - balde['atualizado'])
+        balde['nivel'] = min(capacidade, balde['nivel'] + decorrido * capacidade / 60)
+        balde['atualizado'] = agora
+        return balde
+
+    def tentar_entrar(self, dados, tokens, agora):
+        # (vaga, 0) ao conseguir; (None, segundos até valer a pena tentar de novo) se não
+        em_voo = {vaga: info for vaga, info in dados.get('em_voo', {}).items()
+                  if info['expira'] > agora and processo_vivo(info['pid'])}
+        dados['em_voo'] = em_voo
+        bloqueio = dados.get('bloqueado_ate', 0) - agora
+        if bloqueio > 0:
+            return None, bloqueio
+        if self.max_em_voo and len(em_voo) >= self.max_em_voo:
+            return None, INTERVALO_ESPERA
+
+        custos = [('requisicoes', self.requisicoes_por_minuto, 1),
+                  ('tokens', self.tokens_por_minuto, min(tokens, self.tokens_por_minuto))]
+        baldes = []
+        espera = 0.0
+        for nome, capacidade, custo in custos:
+            if capacidade:
+                balde = self.reabastecer(dados, nome, capacidade, agora)
+                baldes.append((balde, custo))
+                if balde['nivel'] < custo:
+                    espera = max(espera, (custo - balde['nivel']) * 60 / capacidade)
+        if espera > 0:
+            return None, espera
+
+        for balde, custo in baldes:
+            balde['nivel'] -= custo
+        vaga = uuid.uuid4().hex
+        em_voo[vaga] = {'pid': os.getpid(), 'expira': agora + DURACAO_MAXIMA}
+        return vaga, 0
+
+    def sair(self, vaga, estimados, usados):
+        with self.estado.transacao() as dados:
+            dados.get('em_voo', {}).pop(vaga, None)
+            if self.tokens_por_minuto and usados is not None:
+                # Acerta o balde de tokens pela diferença entre a estimativa e o consumo real
+                balde = self.reabastecer(dados, 'tokens', self.tokens_por_minuto, time.time())
+                balde['nivel'] = min(self.tokens_por_minuto, balde['nivel'] + estimados - usados)
+
+    def bloquear(self, segundos):
+        # O provedor respondeu 429: ninguém chama até passar o Retry-After
+        with self.estado.transacao() as dados:
+            dados['bloqueado_ate'] = max(dados.get('bloqueado_ate', 0), time.time() + segundos)
+
+    def proxima_tentativa(self, inicio, tokens):
+        # (vaga, espera): espera > 0 quando ainda não entrou; estoura se passar de ESPERA_MAXIMA
+        with self.estado.transacao() as dados:
+            vaga, espera = self.tentar_entrar(dados, tokens, time.time())
+        decorrido = time.monotonic() - inicio
+        if vaga is not None:
+            metricas.ESPERA_LLM.observar(decorrido)
+        elif decorrido + espera > self.espera_maxima:
+            metricas.ESPERA_LLM.observar(decorrido)
+            raise LimiteLLMExcedido(espera)
+        return vaga, min(espera, 1.0)
+
+    def entrar(self, tokens):
+        inicio = time.monotonic()
+        while True:
+            vaga, espera = self.proxima_tentativa(inicio, tokens)
+            if vaga is not None:
+                return vaga
+            time.sleep(espera)
+
+    async def aentrar(self, tokens):
+        inicio = time.monotonic()
+        while True:
+            vaga, espera = await self.em_thread(
+                self.proxima_tentativa, inicio, tokens,
+                desfazer=lambda resultado: resultado[0] is not None and self.sair(resultado[0], tokens, None),
+            )
+            if vaga is not None:
+                return vaga
+            await asyncio.sleep(espera)
+
+    async def em_thread(self, funcao, *args, desfazer=None):
+        # Operação no estado a partir do caminho assíncrono. Com estado bloqueante (flock, arquivo),
+        # roda numa thread; o cancelamento de quem espera não a interrompe, e `desfazer(resultado)`
+        # devolve o que ela tiver reservado (vaga, voo) para ninguém ficar esperando por isso.
+        if not self.estado_bloqueante:
+            return funcao(*args)
+        operacao = asyncio.ensure_future(asyncio.to_thread(funcao, *args))
+        try:
+            return await asyncio.shield(operacao)
+        except asyncio.CancelledError:
+            if desfazer is not None:
+                operacao.add_done_callback(lambda feita: desfazer_em_thread(feita, desfazer))
+            raise
+
+    # Chamadas
+
+    def chamar(self, funcao, kwargs, replica=0):
+        if kwargs.get('stream'):
+            return self.chamar_stream(funcao, kwargs)
+        chave = chave_voo(kwargs, replica)
+        voo, lider = self.embarcar(chave)
+        if not lider:
+            return voo.result()
+        try:
+            resultado = self.chamar_entre_processos(chave, funcao, kwargs)
+        except BaseException as e:
+            voo.set_exception(e)
+            raise
+        else:
+            voo.set_result(resultado)
+            return resultado
+        finally:
+            self.desembarcar(chave)
+
+    async def achamar(self, funcao, kwargs, replica=0):
+        if kwargs.get('stream'):
+            return await self.achamar_stream(funcao, kwargs)
+        chave = chave_voo(kwargs, replica)
+        voo, lider = self.embarcar(chave)
+        if not lider:
+            return await asyncio.wrap_future(voo)
+        try:
+            resultado = await self.achamar_entre_processos(chave, funcao, kwargs)
+        except BaseException as e:
+            voo.set_exception(e)
+            raise
+        else:
+            voo.set_result(resultado)
+            return resultado
+        finally:
+            self.desembarcar(chave)
+
+    def embarcar(self, chave):
+        with self._voos_lock:
+            voo = self._voos.get(chave)
+            if voo is not None:
+                metricas.LLM_COALESCIDAS.inc()
+                return voo, False
+            voo = self._voos[chave] = Future()
+            return voo, True
+
+    def desembarcar(self, chave):
+        with self._voos_lock:
+            self._voos.pop(chave, None)
+
+    def reservar_voo(self, chave, desde):
+        # Entre processos: (True, None) se esta chamada deve ir ao provedor, (False, resposta)
+        # se outro worker já respondeu, (False, None) se ainda está chamando
+        with self.estado.transacao() as dados:
+            agora = time.time()
+            voos = {c: info for c, info in dados.get('voos', {}).items()
+                    if info['expira'] > agora and processo_vivo(info['pid'])}
+            dados['voos'] = voos
+            if chave in voos:
+                return False, None
+            texto = self.estado.ler_resultado(chave, desde)
+            if texto is not None:
+                return False, texto
+            voos[chave] = {'pid': os.getpid(), 'expira': agora + DURACAO_MAXIMA}
+            return True, None
+
+    def liberar_voo(self, chave, resultado):
+        try:
+            if isinstance(resultado, BaseModel):  # ChatCompletion do SDK
+                self.estado.gravar_resultado(chave, resultado.model_dump_json())
+        except OSError as e:
+            logger.warning("Não foi possível compartilhar a resposta da LLM com os outros workers: %s", e)
+        finally:
+            with self.estado.transacao() as dados:
+                dados.get('voos', {}).pop(chave, None)
+
+    def chamar_entre_processos(self, chave, funcao, kwargs):
+        if not self.compartilhar_respostas:
+            return self.chamar_limitado(funcao, kwargs)
+        desde = time.time()
+        while True:
+            lider, texto = self.reservar_voo(chave, desde)
+            if lider:
+                break
+            if texto is not None:
+                metricas.LLM_COALESCIDAS.inc()
+                return desserializar(texto)
+            time.sleep(INTERVALO_ESPERA)
+        resultado = None
+        try:
+            resultado = self.chamar_limitado(funcao, kwargs)
+            return resultado
+        finally:
+            self.liberar_voo(chave, resultado)
+
+    async def achamar_entre_processos(self, chave, funcao, kwargs):
+        if not self.compartilhar_respostas:
+            return await self.achamar_limitado(funcao, kwargs)
+        desde = time.time()
+        while True:
+            lider, texto = await self.em_thread(
+                self.reservar_voo, chave, desde,
+                desfazer=lambda resultado: resultado[0] and self.liberar_voo(chave, None),
+            )
+            if lider:
+                break
+            if texto is not None:
+                metricas.LLM_COALESCIDAS.inc()
+                return desserializar(texto)
+            await asyncio.sleep(INTERVALO_ESPERA)
+        resultado = None
+        try:
+            resultado = await self.achamar_limitado(funcao, kwargs)
+            return resultado
+        finally:
+            await self.em_thread(self.liberar_voo, chave, resultado)
+
+    def chamar_limitado(self, funcao, kwargs):
+        estimados = estimar_tokens(kwargs, self.tokens_resposta)
+        vaga = self.entrar(estimados)
+        resultado = None
+        try:
+            resultado = funcao(**kwargs)
+            return resultado
+        except Exception as e:
+            self.tratar_erro(e)
+            raise
+        finally:
+            self.sair(vaga, estimados, tokens_usados(resultado))
+
+    async def achamar_limitado(self, funcao, kwargs):
+        estimados = estimar_tokens(kwargs, self.tokens_resposta)
+        vaga = await self.aentrar(estimados)
+        resultado = None
+        try:
+            resultado = await funcao(**kwargs)
+            return resultado
+        except Exception as e:
+            await self.em_thread(self.tratar_erro, e)
+            raise
+        finally:
+            await self.em_thread(self.sair, vaga, estimados, tokens_usados(resultado))
+
+    def chamar_stream(self, funcao, kwargs):
+        # Stream: sem coalescência; a vaga fica ocupada até o stream terminar ou ser fechado
+        estimados = estimar_tokens(kwargs, self.tokens_resposta)
+        vaga = self.entrar(estimados)
+        try:
+            stream = funcao(**kwargs)
+        except Exception as e:
+            self.sair(vaga, estimados, None)
+            self.tratar_erro(e)
+            raise
+        return FluxoLimitado(stream, lambda: self.sair(vaga, estimados, None))
+
+    async def achamar_stream(self, funcao, kwargs):
+        estimados = estimar_tokens(kwargs, self.tokens_resposta)
+        vaga = await self.aentrar(estimados)
+        try:
+            stream = await funcao(**kwargs)
+        except BaseException as e:  # Inclui o cancelamento da tarefa (ex.: perdedor de um hedge)
+            await self.em_thread(self.sair, vaga, estimados, None)
+            if isinstance(e, Exception):
+                await self.em_thread(self.tratar_erro, e)
+            raise
+        return FluxoLimitadoAsync(stream, lambda: self.em_thread(self.sair, vaga, estimados, None))
+
+    def tratar_erro(self, erro):
+        if getattr(erro, 'status_code', None) == 429:
+            segundos = espera_do_429(erro)
+            logger.warning("LLM respondeu 429; novas chamadas suspensas por %ss", segundos)
+            self.bloquear(segundos)
+
+
+class FluxoLimitado:
+    # Stream do provedor que devolve a vaga ao terminar, ao falhar ou ao ser fechado. `close`
+    # pode vir de outra thread (ex.: o perdedor de um hedge em provas.roteamento).
+    def __init__(self, stream, liberar):
+        self.stream = stream
+        self._liberar = liberar
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        try:
+            yield from self.stream
+        finally:
+            self.liberar()
+
+    def liberar(self):
+        with self._lock:
+            liberar, self._liberar = self._liberar, None
+        if liberar is not None:
+            liberar()
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.liberar()
+
+
+class FluxoLimitadoAsync(FluxoLimitado):
+    # `liberar` devolve uma corrotina (a vaga é devolvida fora do event loop)
+    async def __aiter__(self):
+        try:
+            async for chunk in self.stream:
+                yield chunk
+        finally:
+            await self.aliberar()
+
+    async def aliberar(self):
+        with self._lock:
+            liberar, self._liberar = self._liberar, None
+        if liberar is not None:
+            await liberar()
+
+    async def close(self):
+        try:
+            await self.stream.close()
+        finally:
+            await self.aliberar()
+
+
+def desfazer_em_thread(operacao, desfazer):
+    # Callback de uma operação em thread cujo solicitante foi cancelado
+    if operacao.cancelled() or operacao.exception() is not None:
+        return
+    asyncio.get_running_loop().run_in_executor(None, desfazer, operacao.result())
+
+
+def desserializar(texto):
+    from groq.types.chat import ChatCompletion
+
+    return ChatCompletion.model_validate_json(texto)
+
+
+_governador = None
+_governador_lock = threading.Lock()
+
+
+def obter():
+    global _governador
+    with _governador_lock:
+        if _governador is None:
+            _governador = Governador(settings.LLM_LIMITES)
+    return _governador
+
+
+@receiver(setting_changed)
+def _recarregar(setting, **kwargs):
+    # Permite trocar limites e backend com override_settings nos testes
+    global _governador
+    if setting == 'LLM_LIMITES':
+        with _governador_lock:
+            _governador = None
@@ -0,0 +1,126 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import cache_geracao, roteamento
+from .geracao import PROMPT_VERSAO, gerar_questoes, persistir_questoes
+from .models import CriteriosProva, EstadoJob, JobGeracao, LoteGeracao
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    # Pool de workers do processo, criado sob demanda no primeiro job
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.GERACAO_JOBS['WORKERS'],
+                thread_name_prefix='geracao-prova',
+            )
+    return _executor
+
+
+def enfileirar(job):
+    # Agenda a geração conforme o backend configurado:
+    # 'thread'   -> pool de threads do próprio processo (após o commit da transação)
+    # 'banco'    -> apenas persiste; o comando `processar_jobs` executa
+    # 'sincrono' -> executa na hora (útil para testes e depuração)
+    backend = settings.GERACAO_JOBS['BACKEND']
+    if backend == 'sincrono':
+        executar_job(job.id)
+    elif backend == 'thread':
+        transaction.on_commit(lambda: get_executor().submit(executar_em_thread, job.id))
+
+
+def criar_lote(usuario, linhas, usar_cache=True, usar_banco=False):
+    # Grava o lote, os critérios e os jobs com bulk_create e devolve (lote, jobs a enfileirar).
+    # Linhas com os mesmos critérios normalizados ficam presas ao primeiro job com eles (líder)
+    # e recebem as questões dele ao final, com uma única chamada à LLM.
+    with transaction.atomic():
+        lote = LoteGeracao.objects.create(criado_por=usuario, total=len(linhas))
+        provas = CriteriosProva.objects.bulk_create(
+            [CriteriosProva(criado_por=usuario, **dados) for dados in linhas]
+        )
+        lideres = {}
+        seguidores = []
+        modelos = roteamento.obter().chave_modelos()
+        for linha, prova in enumerate(provas, start=1):
+            job = JobGeracao(prova=prova, lote=lote, linha=linha, usar_cache=usar_cache, usar_banco=usar_banco)
+            chave = cache_geracao.chave_criterios(prova, modelos, PROMPT_VERSAO)
+            if chave in lideres:
+                seguidores.append((job, chave))
+            else:
+                lideres[chave] = job
+        JobGeracao.objects.bulk_create(lideres.values())
+        for job, chave in seguidores:
+            job.lider = lideres[chave]
+        JobGeracao.objects.bulk_create(job for job, _ in seguidores)
+    return lote, list(lideres.values())
+
+
+def executar_em_thread(job_id):
+    # Cada thread do pool usa sua própria conexão com o banco
+    close_old_connections()
+    try:
+        executar_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def reservar(job_id):
+    # Troca PENDENTE -> EXECUTANDO de forma atômica; só um worker consegue o job
+    return JobGeracao.objects.filter(id=job_id, estado=EstadoJob.PENDENTE).update(
+        estado=EstadoJob.EXECUTANDO,
+        iniciado_em=timezone.now(),
+    ) == 1
+
+
+def executar_job(job_id):
+    if not reservar(job_id):
+        return
+    job = JobGeracao.objects.select_related('prova').get(id=job_id)
+    try:
+        gerar_questoes(job.prova, usar_cache=job.usar_cache, usar_banco=job.usar_banco)
+    except Exception as e:
+        logger.exception("Falha no job de geração %s", job_id)
+        JobGeracao.objects.filter(id=job_id).update(
+            estado=EstadoJob.FALHOU,
+            erro=str(e),
+            finalizado_em=timezone.now(),
+        )
+        finalizar_seguidores(job, erro=str(e))
+    else:
+        JobGeracao.objects.filter(id=job_id).update(
+            estado=EstadoJob.CONCLUIDO,
+            finalizado_em=timezone.now(),
+        )
+        finalizar_seguidores(job)
+
+
+def finalizar_seguidores(lider, erro=None):
+    # Linhas idênticas de um lote não chamam a LLM: recebem as questões do líder
+    seguidores = JobGeracao.objects.filter(lider=lider, estado=EstadoJob.PENDENTE)
+    if erro is not None:
+        seguidores.update(estado=EstadoJob.FALHOU, erro=erro, finalizado_em=timezone.now())
+        return
+    questoes = list(lider.prova.questoes_ordenadas())
+    for job in seguidores.select_related('prova'):
+        if not reservar(job.id):
+            continue
+        try:
+            persistir_questoes(job.prova, questoes, [])
+        except Exception as e:
+            logger.exception("Falha no job de geração %s", job.id)
+            JobGeracao.objects.filter(id=job.id).update(
+                estado=EstadoJob.FALHOU, erro=str(e), finalizado_em=timezone.now()
+            )
+        else:
+            JobGeracao.objects.filter(id=job.id).update(estado=EstadoJob.CONCLUIDO, finalizado_em=timezone.now())
@@ -0,0 +1,29 @@
+import os
+
+from django.conf import settings
+from dotenv import load_dotenv
+
+from . import governador, transporte
+
+load_dotenv()
+
+# Cliente do Groq compartilhado por todos os caminhos de geração (síncrono e jobs), com o
+# pool de conexões e os timeouts de LLM_TRANSPORTE
+client = transporte.criar_cliente(settings.LLM_TRANSPORTE, api_key=os.environ.get("GROQ_API_KEY"))
+
+# Versão assíncrona, usada pelas views ASGI (provas/views_async.py)
+async_client = transporte.criar_cliente_async(settings.LLM_TRANSPORTE, api_key=os.environ.get("GROQ_API_KEY"))
+
+
+def criar(replica=0, **kwargs):
+    # chat.completions.create com novas tentativas e disjuntor (transporte), passando pelo
+    # governador (limites e coalescência) a cada tentativa
+    envio = transporte.obter()
+    return envio.chamar(lambda: governador.obter().chamar(
+        lambda **k: envio.enviar(client.chat.completions.create, k), kwargs, replica))
+
+
+async def acriar(replica=0, **kwargs):
+    envio = transporte.obter()
+    return await envio.achamar(lambda: governador.obter().achamar(
+        lambda **k: envio.aenviar(async_client.chat.completions.create, k), kwargs, replica))
@@ -0,0 +1,44 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from provas.jobs import executar_em_thread
+from provas.models import EstadoJob, JobGeracao
+
+
+class Command(BaseCommand):
+    help = "Worker que executa os jobs de geração de provas pendentes no banco."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.GERACAO_JOBS['WORKERS'],
+            help="Quantidade de gerações simultâneas.",
+        )
+        parser.add_argument(
+            '--intervalo', type=float, default=1.0,
+            help="Segundos de espera quando não há jobs pendentes.",
+        )
+        parser.add_argument(
+            '--uma-vez', action='store_true',
+            help="Processa os jobs pendentes e encerra.",
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='processar-jobs') as executor:
+            while True:
+                ids = list(
+                    JobGeracao.objects.filter(estado=EstadoJob.PENDENTE, lider__isnull=True)
+                    .order_by('criado_em')
+                    .values_list('id', flat=True)[:workers]
+                )
+                if ids:
+                    # Outros workers podem disputar os mesmos ids; `reservar` garante exclusividade
+                    list(executor.map(executar_em_thread, ids))
+                    self.stdout.write(f"{len(ids)} job(s) processado(s).")
+                    continue
+                if options['uma_vez']:
+                    break
+                time.sleep(options['intervalo'])
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from provas import snapshots
+
+
+class Command(BaseCommand):
+    help = "Refaz os snapshots JSON das provas após mudanças nos serializers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todas', action='store_true',
+            help="Refaz todos os snapshots, não só os ausentes ou de versões anteriores.",
+        )
+        parser.add_argument(
+            '--tamanho-lote', type=int, default=200,
+            help="Provas carregadas por consulta.",
+        )
+
+    def handle(self, *args, **options):
+        total = snapshots.reconstruir(todas=options['todas'], tamanho_lote=options['tamanho_lote'])
+        self.stdout.write(self.style.SUCCESS(f"{total} snapshot(s) reconstruído(s) na versão {snapshots.VERSAO}."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from provas import busca
+
+
+class Command(BaseCommand):
+    help = "Recria o índice de busca textual das questões (carga inicial ou correção)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanho-lote', type=int, default=500,
+            help="Questões indexadas por vez.",
+        )
+
+    def handle(self, *args, **options):
+        total = busca.reconstruir(tamanho_lote=options['tamanho_lote'])
+        self.stdout.write(self.style.SUCCESS(f"{total} questão(ões) indexada(s)."))
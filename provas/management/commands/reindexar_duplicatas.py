@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from provas import deduplicacao
+
+
+class Command(BaseCommand):
+    help = "Recalcula as assinaturas usadas para descartar questões geradas repetidas."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanho-lote', type=int, default=500,
+            help="Questões processadas por vez.",
+        )
+
+    def handle(self, *args, **options):
+        total = deduplicacao.reconstruir(tamanho_lote=options['tamanho_lote'])
+        self.stdout.write(self.style.SUCCESS(f"{total} questão(ões) processada(s)."))
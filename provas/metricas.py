@@ -0,0 +1,262 @@
+import contextvars
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.cache import patch_vary_headers
+
+# Métricas em memória, por processo, no formato texto do Prometheus (GET /metrics).
+# Cada requisição também recebe um cabeçalho Server-Timing com o tempo de cada fase
+# (llm, parse, persistir, renderizar) e o total. Com vários workers (gunicorn),
+# cada processo expõe os próprios números; o Prometheus soma pelos rótulos.
+
+BUCKETS_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Contador:
+    tipo = 'counter'
+
+    def __init__(self, nome, descricao, rotulos=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = rotulos
+        self.lock = threading.Lock()
+        self.valores = {}
+
+    def inc(self, valor=1, **rotulos):
+        chave = tuple(str(rotulos[r]) for r in self.rotulos)
+        with self.lock:
+            self.valores[chave] = self.valores.get(chave, 0) + valor
+
+    def valor(self, **rotulos):
+        return self.valores.get(tuple(str(rotulos[r]) for r in self.rotulos), 0)
+
+    def amostras(self):
+        with self.lock:
+            return [(self.nome, dict(zip(self.rotulos, chave)), valor) for chave, valor in sorted(self.valores.items())]
+
+
+class Histograma:
+    tipo = 'histogram'
+
+    def __init__(self, nome, descricao, rotulos=(), buckets=BUCKETS_PADRAO):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = rotulos
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.valores = {}  # rótulos -> [contagens por bucket, soma, total]
+
+    def observar(self, valor, **rotulos):
+        chave = tuple(str(rotulos[r]) for r in self.rotulos)
+        with self.lock:
+            contagens, soma, total = self.valores.get(chave) or ([0] * len(self.buckets), 0.0, 0)
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    contagens[i] += 1
+            self.valores[chave] = (contagens, soma + valor, total + 1)
+
+    def total(self, **rotulos):
+        entrada = self.valores.get(tuple(str(rotulos[r]) for r in self.rotulos))
+        return entrada[2] if entrada else 0
+
+    def amostras(self):
+        with self.lock:
+            itens = sorted(self.valores.items())
+        linhas = []
+        for chave, (contagens, soma, total) in itens:
+            rotulos = dict(zip(self.rotulos, chave))
+            for limite, contagem in zip(self.buckets, contagens):
+                linhas.append((f'{self.nome}_bucket', {**rotulos, 'le': formatar_numero(limite)}, contagem))
+            linhas.append((f'{self.nome}_bucket', {**rotulos, 'le': '+Inf'}, total))
+            linhas.append((f'{self.nome}_sum', rotulos, soma))
+            linhas.append((f'{self.nome}_count', rotulos, total))
+        return linhas
+
+
+REQUISICOES = Histograma(
+    'provas_requisicao_segundos', "Duração das requisições HTTP", ('view', 'metodo', 'status'),
+)
+FASES = Histograma(
+    'provas_fase_segundos', "Duração das fases da geração e leitura de provas", ('fase',),
+)
+TOKENS_LLM = Contador(
+    'provas_llm_tokens_total', "Tokens consumidos nas chamadas à LLM", ('tipo',),
+)
+CHAMADAS_LLM = Contador(
+    'provas_llm_chamadas_total', "Chamadas à LLM por resultado", ('resultado',),
+)
+CACHE = Contador(
+    'provas_cache_total', "Consultas aos caches por resultado", ('cache', 'resultado'),
+)
+CURRICULO_TOKENS_ECONOMIZADOS = Contador(
+    'provas_curriculo_tokens_economizados_total', "Tokens de currículo poupados nos prompts pelo uso do resumo",
+)
+DUPLICATAS = Contador(
+    'provas_duplicatas_descartadas_total', "Questões geradas descartadas por serem quase idênticas a outras",
+    ('origem',),  # 'prova' (mesma geração) ou 'banco' (questão existente do mesmo tema)
+)
+ESPERA_LLM = Histograma(
+    'provas_llm_espera_segundos', "Tempo na fila do governador antes de cada chamada à LLM",
+)
+LLM_COALESCIDAS = Contador(
+    'provas_llm_coalescidas_total', "Chamadas à LLM atendidas pela resposta de uma chamada idêntica em andamento",
+)
+LLM_NOVAS_TENTATIVAS = Contador(
+    'provas_llm_novas_tentativas_total', "Chamadas à LLM repetidas pelo transporte, por motivo da falha",
+    ('motivo',),  # status HTTP, 'timeout' ou 'conexao'
+)
+DISJUNTOR_ABERTURAS = Contador(
+    'provas_llm_disjuntor_aberturas_total', "Vezes em que o disjuntor da LLM abriu por falhas seguidas do provedor",
+)
+LLM_PRIMEIRO_TOKEN = Histograma(
+    'provas_llm_primeiro_token_segundos', "Tempo até o primeiro token nas chamadas com streaming, por modelo",
+    ('modelo',),
+)
+LLM_HEDGES = Contador(
+    'provas_llm_hedges_total', "Chamadas repetidas no modelo secundário por demora do primário, por vencedor",
+    ('vencedor',),  # 'primario', 'secundario' ou 'nenhum' (os dois falharam)
+)
+METRICAS = [REQUISICOES, FASES, TOKENS_LLM, CHAMADAS_LLM, CACHE, CURRICULO_TOKENS_ECONOMIZADOS, DUPLICATAS,
+            ESPERA_LLM, LLM_COALESCIDAS, LLM_NOVAS_TENTATIVAS, DISJUNTOR_ABERTURAS, LLM_PRIMEIRO_TOKEN, LLM_HEDGES]
+
+
+# --- Tempos por requisição (Server-Timing) ---
+
+class Temporizacao:
+    # Soma dos tempos de cada fase dentro de uma requisição; threads e tarefas
+    # criadas a partir dela compartilham o mesmo objeto pelo contextvar
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fases = {}
+
+    def adicionar(self, fase, segundos):
+        with self.lock:
+            self.fases[fase] = self.fases.get(fase, 0.0) + segundos
+
+
+_temporizacao = contextvars.ContextVar('provas_temporizacao', default=None)
+
+
+@contextmanager
+def fase(nome):
+    # Mede um trecho: alimenta o histograma e o Server-Timing da requisição atual
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        FASES.observar(duracao, fase=nome)
+        temporizacao = _temporizacao.get()
+        if temporizacao is not None:
+            temporizacao.adicionar(nome, duracao)
+
+
+def registrar_uso_llm(chat_completion):
+    # Tokens de prompt e de resposta, quando a API informa (`usage`)
+    uso = getattr(chat_completion, 'usage', None)
+    for tipo in ('prompt', 'completion'):
+        tokens = getattr(uso, f'{tipo}_tokens', None)
+        if isinstance(tokens, int):
+            TOKENS_LLM.inc(tokens, tipo=tipo)
+
+
+def registrar_cache(cache, acerto):
+    CACHE.inc(cache=cache, resultado='acerto' if acerto else 'falha')
+
+
+def server_timing(temporizacao, total):
+    partes = [f'{nome};dur={segundos * 1000:.1f}' for nome, segundos in sorted(temporizacao.fases.items())]
+    partes.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(partes)
+
+
+def finalizar_requisicao(request, response, temporizacao, inicio):
+    total = time.perf_counter() - inicio
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match and match.view_name else 'nao_encontrada'
+    REQUISICOES.observar(total, view=view, metodo=request.method, status=response.status_code)
+    response['Server-Timing'] = server_timing(temporizacao, total)
+
+
+class MetricasMiddleware:
+    # Mede a requisição inteira e abre o contexto em que `fase()` acumula os tempos
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        temporizacao = Temporizacao()
+        token = _temporizacao.set(temporizacao)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _temporizacao.reset(token)
+        finalizar_requisicao(request, response, temporizacao, inicio)
+        return response
+
+    async def __acall__(self, request):
+        temporizacao = Temporizacao()
+        token = _temporizacao.set(temporizacao)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _temporizacao.reset(token)
+        finalizar_requisicao(request, response, temporizacao, inicio)
+        return response
+
+
+# --- Exposição ---
+
+def formatar_numero(valor):
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+
+def escapar(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def exportar():
+    linhas = []
+    for metrica in METRICAS:
+        linhas.append(f'# HELP {metrica.nome} {metrica.descricao}')
+        linhas.append(f'# TYPE {metrica.nome} {metrica.tipo}')
+        for nome, rotulos, valor in metrica.amostras():
+            if rotulos:
+                texto = ','.join(f'{chave}="{escapar(str(v))}"' for chave, v in rotulos.items())
+                nome = f'{nome}{{{texto}}}'
+            linhas.append(f'{nome} {formatar_numero(valor)}')
+    return '\n'.join(linhas) + '\n'
+
+
+def autorizado(request):
+    # Com METRICAS_TOKEN, exige "Authorization: Bearer <token>" (comparado em tempo constante);
+    # sem token, o endpoint só fica aberto com DEBUG
+    token = settings.METRICAS['TOKEN']
+    if not token:
+        return settings.DEBUG
+    enviado = request.headers.get('Authorization', '')
+    return hmac.compare_digest(enviado.encode(), f'Bearer {token}'.encode())
+
+
+def view_metricas(request):
+    # Fora do DRF/JWT: o Prometheus raspa com o token, sem login
+    if not autorizado(request):
+        return HttpResponseForbidden()
+    response = HttpResponse(exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    patch_vary_headers(response, ['Authorization'])
+    return response
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:27
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('provas', '0002_jobgeracao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntradaCacheGeracao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=64, unique=True)),
+                ('questoes', models.JSONField()),
+                ('criado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('acessado_em', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='jobgeracao',
+            name='usar_cache',
+            field=models.BooleanField(default=True),
+        ),
+    ]
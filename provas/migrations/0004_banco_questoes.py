@@ -0,0 +1,62 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('provas', '0003_cache_geracao'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemProva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ordem', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['ordem', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='criteriosprova',
+            name='criado_por',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='provas', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='questao',
+            name='tema',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='jobgeracao',
+            name='usar_banco',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='questao',
+            index=models.Index(fields=['tema', 'tipo', 'nivel_dificuldade'], name='questao_banco_idx'),
+        ),
+        migrations.AddField(
+            model_name='itemprova',
+            name='prova',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='itens', to='provas.criteriosprova'),
+        ),
+        migrations.AddField(
+            model_name='itemprova',
+            name='questao',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='itens', to='provas.questao'),
+        ),
+        # Nula até a cópia dos vínculos (0004_banco_questoes_vinculos): assim a migração
+        # de volta consegue recriá-la antes de preenchê-la
+        migrations.AlterField(
+            model_name='questao',
+            name='prova',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='questoes', to='provas.criteriosprova'),
+        ),
+    ]
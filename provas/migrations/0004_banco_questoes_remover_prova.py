@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('provas', '0004_banco_questoes_vinculos'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='questao',
+            name='prova',
+        ),
+        migrations.AddField(
+            model_name='criteriosprova',
+            name='questoes',
+            field=models.ManyToManyField(related_name='provas', through='provas.ItemProva', to='provas.questao'),
+        ),
+        migrations.AddConstraint(
+            model_name='itemprova',
+            constraint=models.UniqueConstraint(fields=('prova', 'questao'), name='item_prova_unico'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations
+
+TAMANHO_LOTE = 500
+
+
+def copiar_vinculos(apps, schema_editor):
+    # Cada questão existente passa a ser um item da prova a que pertencia
+    Questao = apps.get_model('provas', 'Questao')
+    ItemProva = apps.get_model('provas', 'ItemProva')
+    itens, questoes = [], []
+    ordem_por_prova = {}
+    for questao in Questao.objects.select_related('prova').order_by('id').iterator(chunk_size=TAMANHO_LOTE):
+        ordem = ordem_por_prova.get(questao.prova_id, 0)
+        ordem_por_prova[questao.prova_id] = ordem + 1
+        itens.append(ItemProva(prova_id=questao.prova_id, questao_id=questao.id, ordem=ordem))
+        questao.tema = ' '.join(questao.prova.tema.split()).casefold()
+        questoes.append(questao)
+        if len(itens) >= TAMANHO_LOTE:
+            ItemProva.objects.bulk_create(itens)
+            Questao.objects.bulk_update(questoes, ['tema'])
+            itens, questoes = [], []
+    ItemProva.objects.bulk_create(itens)
+    Questao.objects.bulk_update(questoes, ['tema'])
+
+
+def restaurar_vinculos(apps, schema_editor):
+    # Volta ao esquema antigo: cada questão pertence à primeira prova em que aparece
+    # (uma questão reaproveitada em outras provas fica só na primeira)
+    Questao = apps.get_model('provas', 'Questao')
+    ItemProva = apps.get_model('provas', 'ItemProva')
+    questoes, vistas = [], set()
+    itens = ItemProva.objects.order_by('questao_id', 'id').values_list('questao_id', 'prova_id')
+    for questao_id, prova_id in itens.iterator(chunk_size=TAMANHO_LOTE):
+        if questao_id in vistas:
+            continue
+        vistas.add(questao_id)
+        questoes.append(Questao(id=questao_id, prova_id=prova_id))
+        if len(questoes) >= TAMANHO_LOTE:
+            Questao.objects.bulk_update(questoes, ['prova'])
+            questoes = []
+    Questao.objects.bulk_update(questoes, ['prova'])
+
+
+class Migration(migrations.Migration):
+    # Só dados, numa migração (e transação) própria: no Postgres, alterar a tabela na mesma
+    # transação em que as linhas foram gravadas falha com "pending trigger events"
+
+    dependencies = [
+        ('provas', '0004_banco_questoes'),
+    ]
+
+    operations = [
+        migrations.RunPython(copiar_vinculos, restaurar_vinculos),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('provas', '0004_banco_questoes_remover_prova'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotProva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('versao', models.PositiveIntegerField()),
+                ('prova_json', models.BinaryField()),
+                ('gabarito_json', models.BinaryField(blank=True, null=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('prova', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot', to='provas.criteriosprova')),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from provas import busca
+
+
+def criar_indice(apps, schema_editor):
+    busca.criar_indice(schema_editor)
+    # Indexa as questões que já existem
+    Questao = apps.get_model('provas', 'Questao')
+    busca.indexar(Questao.objects.only('id', 'enunciado', 'tema'))
+
+
+def remover_indice(apps, schema_editor):
+    busca.remover_indice(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('provas', '0005_snapshot_prova'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice, remover_indice),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:42
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('provas', '0006_busca_questoes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='criteriosprova',
+            name='criado_em',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='questao',
+            name='criado_em',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='criteriosprova',
+            index=models.Index(fields=['-criado_em', '-id'], name='prova_criado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='criteriosprova',
+            index=models.Index(fields=['tema', '-criado_em', '-id'], name='prova_tema_criado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='criteriosprova',
+            index=models.Index(fields=['dificuldade', '-criado_em', '-id'], name='prova_dific_criado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='criteriosprova',
+            index=models.Index(fields=['tipos_questoes', '-criado_em', '-id'], name='prova_tipos_criado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='questao',
+            index=models.Index(fields=['-criado_em', '-id'], name='questao_criado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='questao',
+            index=models.Index(fields=['tema', '-criado_em', '-id'], name='questao_tema_criado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='questao',
+            index=models.Index(fields=['tipo', '-criado_em', '-id'], name='questao_tipo_criado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='questao',
+            index=models.Index(fields=['nivel_dificuldade', '-criado_em', '-id'], name='questao_nivel_criado_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('provas', '0008_lote_geracao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoCurriculo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=64, unique=True)),
+                ('texto', models.TextField()),
+                ('resumo', models.TextField()),
+                ('metodo', models.CharField(max_length=20)),
+                ('orcamento_tokens', models.PositiveIntegerField()),
+                ('tokens_texto', models.PositiveIntegerField()),
+                ('tokens_resumo', models.PositiveIntegerField()),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from provas import deduplicacao
+
+
+def assinar_existentes(apps, schema_editor):
+    # Assinaturas das questões que já existem
+    Questao = apps.get_model('provas', 'Questao')
+    AssinaturaQuestao = apps.get_model('provas', 'AssinaturaQuestao')
+    questoes = list(Questao.objects.only('id', 'tema', 'enunciado').order_by('id'))
+    for inicio in range(0, len(questoes), 500):
+        lote = questoes[inicio:inicio + 500]
+        matriz = deduplicacao.assinaturas([q.enunciado for q in lote])
+        AssinaturaQuestao.objects.bulk_create(
+            [AssinaturaQuestao(questao_id=q.id, tema=q.tema, assinatura=linha.tobytes()) for q, linha in zip(lote, matriz)]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('provas', '0009_documento_curriculo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssinaturaQuestao',
+            fields=[
+                ('questao', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='assinatura', serialize=False, to='provas.questao')),
+                ('tema', models.CharField(max_length=200)),
+                ('assinatura', models.BinaryField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tema', 'questao'], name='assinatura_tema_idx')],
+            },
+        ),
+        migrations.RunPython(assinar_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('provas', '0010_assinaturas_questoes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='itemprova',
+            index=models.Index(fields=['prova', 'ordem'], name='item_prova_ordem_idx'),
+        ),
+    ]
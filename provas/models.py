@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 class NivelDificuldade(models.TextChoices):
@@ -29,16 +31,40 @@ class CriteriosProva(models.Model):
         # Permite múltiplos tipos, separados por vírgula
     )
     curriculo = models.TextField(blank=True, null=True)  # Opcional
+    criado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='provas'  # Usado na regra de não repetir questões do banco por usuário
+    )
+    questoes = models.ManyToManyField(
+        'Questao',
+        through='ItemProva',
+        related_name='provas'  # Uma questão do banco pode estar em várias provas
+    )
+    criado_em = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        # Listagem paginada por cursor em (-criado_em, -id), com ou sem filtro
+        indexes = [
+            models.Index(fields=['-criado_em', '-id'], name='prova_criado_idx'),
+            models.Index(fields=['tema', '-criado_em', '-id'], name='prova_tema_criado_idx'),
+            models.Index(fields=['dificuldade', '-criado_em', '-id'], name='prova_dific_criado_idx'),
+            models.Index(fields=['tipos_questoes', '-criado_em', '-id'], name='prova_tipos_criado_idx'),
+        ]
 
     def __str__(self):
         return f"Prova sobre {self.tema} ({self.get_dificuldade_display()})"
 
+    def questoes_ordenadas(self):
+        # Aproveita o prefetch de `prefetch_questoes()`, que já vem na ordem da prova
+        if 'questoes' in getattr(self, '_prefetched_objects_cache', {}):
+            return self.questoes.all()
+        return self.questoes.order_by('itens__ordem')
+
 class Questao(models.Model):
-    prova = models.ForeignKey(
-        CriteriosProva,
-        on_delete=models.CASCADE,  # Se a prova for excluída, as questões também são
-        related_name='questoes'  # Acesso reverso: prova.questoes
-    )
+    tema = models.CharField(max_length=200, blank=True, default='')  # Tema normalizado, para o banco de questões
     tipo = models.CharField(
         max_length=20,
         choices=TipoQuestao.choices
@@ -53,11 +79,50 @@ class Questao(models.Model):
         blank=True,
         null=True
     )
+    criado_em = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tema', 'tipo', 'nivel_dificuldade'], name='questao_banco_idx'),
+            # Listagem paginada por cursor em (-criado_em, -id)
+            models.Index(fields=['-criado_em', '-id'], name='questao_criado_idx'),
+            models.Index(fields=['tema', '-criado_em', '-id'], name='questao_tema_criado_idx'),
+            models.Index(fields=['tipo', '-criado_em', '-id'], name='questao_tipo_criado_idx'),
+            models.Index(fields=['nivel_dificuldade', '-criado_em', '-id'], name='questao_nivel_criado_idx'),
+        ]
 
     def __str__(self):
         return self.enunciado
 
 
+class ItemProva(models.Model):
+    # Liga uma questão a uma prova, na posição `ordem`
+    prova = models.ForeignKey(
+        CriteriosProva,
+        on_delete=models.CASCADE,
+        related_name='itens'
+    )
+    questao = models.ForeignKey(
+        Questao,
+        on_delete=models.CASCADE,
+        related_name='itens'
+    )
+    ordem = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['ordem', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['prova', 'questao'], name='item_prova_unico'),
+        ]
+        indexes = [
+            # Questões de uma prova na ordem (prefetch de prova.questoes e do gabarito)
+            models.Index(fields=['prova', 'ordem'], name='item_prova_ordem_idx'),
+        ]
+
+    def __str__(self):
+        return f"Questão {self.questao_id} da prova {self.prova_id}"
+
+
 class Gabarito(models.Model):
     prova = models.OneToOneField(
         CriteriosProva,
@@ -67,4 +132,132 @@ class Gabarito(models.Model):
     respostas = models.JSONField()
 
     def __str__(self):
-        return f"Gabarito da prova {self.prova.id}"
\ No newline at end of file
+        return f"Gabarito da prova {self.prova_id}"
+
+
+class EstadoJob(models.TextChoices):
+    PENDENTE = 'pendente', _('Pendente')
+    EXECUTANDO = 'executando', _('Executando')
+    CONCLUIDO = 'concluido', _('Concluído')
+    FALHOU = 'falhou', _('Falhou')
+
+
+class LoteGeracao(models.Model):
+    # Várias provas enviadas de uma vez (POST /api/gerar-prova/lote/); cada linha vira um JobGeracao
+    criado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='lotes'
+    )
+    total = models.PositiveIntegerField()
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Lote {self.id} ({self.total} provas)"
+
+
+class JobGeracao(models.Model):
+    prova = models.OneToOneField(
+        CriteriosProva,
+        on_delete=models.CASCADE,
+        related_name='job'  # Acesso reverso: prova.job
+    )
+    estado = models.CharField(
+        max_length=20,
+        choices=EstadoJob.choices,
+        default=EstadoJob.PENDENTE,
+        db_index=True  # O worker do banco busca os jobs pendentes por estado
+    )
+    usar_cache = models.BooleanField(default=True)
+    usar_banco = models.BooleanField(default=False)
+    erro = models.TextField(blank=True, null=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(blank=True, null=True)
+    finalizado_em = models.DateTimeField(blank=True, null=True)
+    lote = models.ForeignKey(
+        LoteGeracao,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name='jobs'
+    )
+    linha = models.PositiveIntegerField(blank=True, null=True)  # Posição no arquivo do lote
+    lider = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='seguidores'  # Linhas idênticas do lote esperam as questões geradas pelo líder
+    )
+
+    def __str__(self):
+        return f"Job {self.id} ({self.get_estado_display()})"
+
+
+class EntradaCacheGeracao(models.Model):
+    # Backend em banco do cache de gerações (provas.cache_geracao.CacheBanco)
+    chave = models.CharField(max_length=64, unique=True)  # sha256 dos critérios normalizados
+    questoes = models.JSONField()
+    criado_em = models.DateTimeField(default=timezone.now)
+    acessado_em = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.chave
+
+
+class SnapshotProva(models.Model):
+    # JSON já renderizado da prova e do gabarito, servido direto pelas views de leitura.
+    # `versao` acompanha provas.snapshots.VERSAO; snapshots antigos são ignorados
+    # até serem refeitos com `manage.py reconstruir_snapshots`.
+    prova = models.OneToOneField(
+        CriteriosProva,
+        on_delete=models.CASCADE,
+        related_name='snapshot'
+    )
+    versao = models.PositiveIntegerField()
+    prova_json = models.BinaryField()
+    gabarito_json = models.BinaryField(blank=True, null=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Snapshot v{self.versao} da prova {self.prova_id}"
+
+
+class DocumentoCurriculo(models.Model):
+    # Currículo guardado uma vez por conteúdo (sha256 do texto normalizado), com o
+    # resumo em tópicos que vai nos prompts no lugar do texto inteiro (provas.curriculo)
+    hash = models.CharField(max_length=64, unique=True)
+    texto = models.TextField()
+    resumo = models.TextField()
+    metodo = models.CharField(max_length=20)  # 'extrativo' ou 'llm'
+    orcamento_tokens = models.PositiveIntegerField()  # Orçamento usado ao resumir
+    tokens_texto = models.PositiveIntegerField()
+    tokens_resumo = models.PositiveIntegerField()
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Currículo {self.hash[:12]} ({self.tokens_texto} -> {self.tokens_resumo} tokens)"
+
+
+class AssinaturaQuestao(models.Model):
+    # Assinatura MinHash do enunciado (provas.deduplicacao), por tema, para descartar
+    # questões geradas quase idênticas às que já estão no banco
+    questao = models.OneToOneField(Questao, on_delete=models.CASCADE, primary_key=True, related_name='assinatura')
+    tema = models.CharField(max_length=200)
+    assinatura = models.BinaryField()  # uint32 x NUM_PERMUTACOES
+
+    class Meta:
+        indexes = [
+            # Carga incremental do índice de um tema: questao_id > último carregado
+            models.Index(fields=['tema', 'questao'], name='assinatura_tema_idx'),
+        ]
+
+    def __str__(self):
+        return f"Assinatura da questão {self.questao_id}"
+
+
+def prefetch_questoes():
+    # Para usar em prefetch_related(): carrega as questões de várias provas em uma consulta
+    return models.Prefetch('questoes', queryset=Questao.objects.order_by('itens__ordem'))
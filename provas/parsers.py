@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+# Corpos de lote (POST /api/gerar-prova/lote/): cada parser devolve uma lista de dicts, uma por linha
+
+
+class JSONLinesParser(BaseParser):
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        linhas = []
+        for numero, linha in enumerate(ler_texto(stream, parser_context).splitlines(), start=1):
+            if not linha.strip():
+                continue
+            try:
+                linhas.append(json.loads(linha))
+            except ValueError as e:
+                raise ParseError(f"Linha {numero}: JSON inválido ({e}).")
+            if not isinstance(linhas[-1], dict):
+                raise ParseError(f"Linha {numero}: esperado um objeto JSON.")
+        return linhas
+
+
+class JSONLParser(JSONLinesParser):
+    media_type = 'application/jsonl'
+
+
+class CSVParser(BaseParser):
+    # Primeira linha com os nomes dos campos de CriteriosProvaSerializer
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            leitor = csv.DictReader(io.StringIO(ler_texto(stream, parser_context)))
+            # Células vazias equivalem a campos ausentes
+            return [{campo: valor for campo, valor in linha.items() if campo and valor not in (None, '')}
+                    for linha in leitor]
+        except csv.Error as e:
+            raise ParseError(f"CSV inválido: {e}.")
+
+
+def ler_texto(stream, parser_context):
+    encoding = (parser_context or {}).get('encoding', 'utf-8')
+    try:
+        return stream.read().decode(encoding).lstrip('\ufeff')  # BOM de planilhas exportadas
+    except UnicodeDecodeError as e:
+        raise ParseError(f"Corpo não está em {encoding}: {e}.")
@@ -0,0 +1,170 @@
+import io
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import KeepTogether, Paragraph, SimpleDocTemplate, Spacer
+
+from .models import CriteriosProva, Gabarito, TipoQuestao, prefetch_questoes
+
+logger = logging.getLogger(__name__)
+
+# Incrementar sempre que o layout mudar: os arquivos antigos deixam de ser usados
+VERSAO_LAYOUT = 1
+
+TIPOS = ('prova', 'gabarito')
+LETRAS = 'ABCDEFGHIJ'
+LINHAS_DISSERTATIVA = 6
+
+
+def diretorio():
+    return settings.PROVAS_PDF['DIRETORIO']
+
+
+def nome_arquivo(tipo, prova_id):
+    return f"{tipo}-{prova_id}-v{VERSAO_LAYOUT}.pdf"
+
+
+def caminho(tipo, prova_id):
+    return os.path.join(diretorio(), nome_arquivo(tipo, prova_id))
+
+
+def carregar_prova(prova_id):
+    return CriteriosProva.objects.select_related('gabarito').prefetch_related(prefetch_questoes()).get(id=prova_id)
+
+
+# --- Renderização ---
+
+def renderizar(tipo, prova):
+    # `prova` deve vir com as questões carregadas (prefetch) e o gabarito
+    estilos = getSampleStyleSheet()
+    buffer = io.BytesIO()
+    documento = SimpleDocTemplate(
+        buffer, pagesize=A4, leftMargin=2 * cm, rightMargin=2 * cm, topMargin=2 * cm, bottomMargin=2 * cm,
+        title=f"{'Gabarito' if tipo == 'gabarito' else 'Prova'} - {prova.tema}",
+    )
+    titulo = f"Gabarito: {prova.tema}" if tipo == 'gabarito' else prova.tema
+    elementos = [
+        Paragraph(escape(titulo), estilos['Title']),
+        Paragraph(escape(f"Nível: {prova.get_dificuldade_display()} · {prova.quantidade_questoes} questões"),
+                  estilos['Normal']),
+        Spacer(1, 0.6 * cm),
+    ]
+    if tipo == 'gabarito':
+        elementos += elementos_gabarito(prova, estilos)
+    else:
+        elementos += elementos_prova(prova, estilos)
+    documento.build(elementos)
+    return buffer.getvalue()
+
+
+def elementos_prova(prova, estilos):
+    elementos = []
+    for numero, questao in enumerate(prova.questoes_ordenadas(), start=1):
+        bloco = [Paragraph(f"<b>{numero}.</b> {escape(questao.enunciado)}", estilos['Normal']), Spacer(1, 0.2 * cm)]
+        if questao.tipo == TipoQuestao.MULTIPLA_ESCOLHA:
+            for letra, opcao in zip(LETRAS, questao.opcoes or []):
+                bloco.append(Paragraph(f"{letra}) {escape(str(opcao))}", estilos['Normal']))
+        elif questao.tipo == TipoQuestao.VERDADEIRO_FALSO:
+            bloco.append(Paragraph("( ) Verdadeiro &nbsp;&nbsp; ( ) Falso", estilos['Normal']))
+        else:
+            bloco += [Spacer(1, 0.7 * cm)] * LINHAS_DISSERTATIVA
+        bloco.append(Spacer(1, 0.5 * cm))
+        elementos.append(KeepTogether(bloco))  # Não quebra a questão entre páginas
+    return elementos
+
+
+def elementos_gabarito(prova, estilos):
+    try:
+        respostas = prova.gabarito.respostas
+    except Gabarito.DoesNotExist:
+        respostas = {}
+    elementos = []
+    for numero, questao in enumerate(prova.questoes_ordenadas(), start=1):
+        resposta = respostas.get(str(questao.id), questao.resposta)
+        elementos.append(Paragraph(f"<b>{numero}.</b> {escape(str(resposta))}", estilos['Normal']))
+        elementos.append(Spacer(1, 0.2 * cm))
+    return elementos
+
+
+# --- Cache em disco ---
+
+def gravar(tipo, prova):
+    # Escreve em arquivo temporário e renomeia: leitores nunca veem um PDF pela metade
+    os.makedirs(diretorio(), exist_ok=True)
+    conteudo = renderizar(tipo, prova)
+    descritor, temporario = tempfile.mkstemp(dir=diretorio(), suffix='.tmp')
+    try:
+        with os.fdopen(descritor, 'wb') as arquivo:
+            arquivo.write(conteudo)
+        os.replace(temporario, caminho(tipo, prova.id))
+    except BaseException:
+        os.unlink(temporario)
+        raise
+    return caminho(tipo, prova.id)
+
+
+def obter(tipo, prova_id):
+    # Caminho do PDF, renderizado agora se ainda não estiver em disco.
+    # CriteriosProva.DoesNotExist se a prova não existir.
+    destino = caminho(tipo, prova_id)
+    if os.path.exists(destino):
+        return destino
+    return gravar(tipo, carregar_prova(prova_id))
+
+
+def invalidar(*provas_ids):
+    for prova_id in provas_ids:
+        for tipo in TIPOS:
+            try:
+                os.remove(caminho(tipo, prova_id))
+            except FileNotFoundError:
+                pass
+
+
+# --- Pré-renderização ---
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    # Pool próprio, separado do de jobs de geração: uma rajada de lotes não atrasa os PDFs,
+    # e uma rajada de PDFs não segura as gerações
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PROVAS_PDF['WORKERS'],
+                thread_name_prefix='pdf-prova',
+            )
+    return _executor
+
+
+def agendar(prova_id):
+    # Gera os PDFs em segundo plano depois do commit, para o primeiro download já sair do disco
+    if not settings.PROVAS_PDF['PRE_RENDERIZAR']:
+        return
+    transaction.on_commit(lambda: get_executor().submit(pre_renderizar, prova_id))
+
+
+def pre_renderizar(prova_id):
+    close_old_connections()
+    try:
+        prova = carregar_prova(prova_id)
+        for tipo in TIPOS:
+            gravar(tipo, prova)
+    except CriteriosProva.DoesNotExist:
+        pass  # Apagada antes de o worker chegar nela
+    except Exception:
+        logger.exception("Falha ao pré-renderizar os PDFs da prova %s", prova_id)
+    finally:
+        close_old_connections()
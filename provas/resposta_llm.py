@@ -0,0 +1,90 @@
+import json
+import re
+
+INICIO_QUESTOES = re.compile(r'"questoes"\s*:\s*\[')
+INICIO_ARRAY = re.compile(r'\[\s*(?=\{)')  # Array de objetos solto, sem a chave "questoes"
+
+
+class ParserQuestoesIncremental:
+    """Extrai os objetos do array "questoes" à medida que o texto da LLM chega.
+
+    `alimentar` recebe um pedaço do texto e devolve os objetos que ficaram
+    completos com ele. O texto já consumido é descartado do buffer.
+    """
+
+    def __init__(self, inicio=INICIO_QUESTOES):
+        self.inicio = inicio
+        self.finalizado = False
+        self._buffer = ""
+        self._pos = 0
+        self._no_array = False
+        self._inicio_objeto = None
+        self._profundidade = 0
+        self._em_string = False
+        self._escape = False
+
+    def alimentar(self, trecho):
+        self._buffer += trecho
+        if self.finalizado:
+            return []
+        if not self._no_array:
+            match = self.inicio.search(self._buffer)
+            if match is None:
+                return []
+            self._no_array = True
+            self._pos = match.end()
+
+        objetos = []
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            c = buffer[self._pos]
+            if self._em_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._em_string = False
+            elif c == '"':
+                self._em_string = True
+            elif c == "{":
+                if self._profundidade == 0:
+                    self._inicio_objeto = self._pos
+                self._profundidade += 1
+            elif c == "}":
+                self._profundidade -= 1
+                if self._profundidade == 0:
+                    try:
+                        objetos.append(json.loads(buffer[self._inicio_objeto:self._pos + 1]))
+                    except json.JSONDecodeError:
+                        pass
+            elif c == "]" and self._profundidade == 0:
+                self.finalizado = True
+                break
+            self._pos += 1
+
+        if self._profundidade == 0:
+            # Nada pendente: descarta o que já foi processado
+            self._buffer = buffer[self._pos:]
+            self._pos = 0
+        return objetos
+
+
+    @property
+    def encontrou_array(self):
+        return self._no_array
+
+
+def extrair_objetos(texto):
+    """Recupera os objetos de questão de uma resposta completa da LLM.
+
+    Tolera cercas de markdown e texto antes ou depois do JSON (só o array é
+    lido) e respostas truncadas (ficam os objetos que chegaram inteiros).
+    Devolve `(objetos, completa)`; `completa` é False se o array não fechou.
+    """
+    parser = ParserQuestoesIncremental()
+    objetos = parser.alimentar(texto)
+    if not parser.encontrou_array:
+        parser = ParserQuestoesIncremental(INICIO_ARRAY)
+        objetos = parser.alimentar(texto)
+    return objetos, parser.finalizado
@@ -0,0 +1,389 @@
+import asyncio
+import contextvars
+import logging
+import math
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import governador, llm, metricas, transporte
+
+logger = logging.getLogger(__name__)
+
+# Roteamento entre os modelos de LLM_ROTEAMENTO['MODELOS'] e hedge contra respostas lentas.
+#
+# *   Cada lote vai para os modelos que atendem a quantidade de questões e os tipos pedidos,
+#     do mais rápido ao mais lento pela média móvel exponencial (EWMA) de segundos por questão,
+#     medida neste processo. Modelos ainda sem medição vêm antes, na ordem configurada.
+# *   Com dois ou mais candidatos, o primário é chamado com streaming. Se o primeiro token não
+#     chegar dentro do percentil PERCENTIL_HEDGE dos tempos recentes desse modelo (ou se ele
+#     falhar antes disso), o mesmo pedido vai para o secundário; vale a primeira resposta
+#     completa e o stream da outra é fechado (devolvendo a vaga do governador).
+# *   Com um único modelo, a chamada é a de sempre, sem streaming (e com coalescência).
+
+JANELA_AMOSTRAS = 200  # Tempos até o primeiro token guardados por modelo
+MIN_AMOSTRAS = 20  # Com menos amostras que isso, o limiar do hedge é HEDGE_INICIAL
+PENALIDADE_ERRO = 2  # Uma falha conta como uma chamada duas vezes mais lenta que a média do modelo
+
+
+class CorridaCancelada(Exception):
+    pass
+
+
+def percentil(valores, p):
+    # Nearest-rank, como em benchmarks.carga
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def ewma(atual, valor, alfa):
+    return valor if atual is None else atual + alfa * (valor - atual)
+
+
+class Modelo:
+    def __init__(self, config):
+        if isinstance(config, str):
+            config = {'nome': config}
+        self.nome = config['nome']
+        self.max_questoes = config.get('max_questoes')  # Por chamada
+        self.tipos = set(config['tipos']) if config.get('tipos') else None
+        self.segundos_por_questao = None  # EWMA da duração das chamadas
+        self.primeiro_token = None  # EWMA do tempo até o primeiro token (streaming)
+        self.amostras_primeiro_token = deque(maxlen=JANELA_AMOSTRAS)
+
+    def atende(self, quantidade, tipos):
+        if self.max_questoes is not None and quantidade > self.max_questoes:
+            return False
+        return self.tipos is None or set(tipos) <= self.tipos
+
+
+class Roteador:
+    def __init__(self, config):
+        self.modelos = [Modelo(m) for m in config['MODELOS']]
+        if not self.modelos:
+            raise ImproperlyConfigured("LLM_MODELOS precisa de pelo menos um modelo")
+        self.por_nome = {m.nome: m for m in self.modelos}
+        self.hedge = config['HEDGE']
+        self.percentil_hedge = config['PERCENTIL_HEDGE']
+        self.hedge_inicial = config['HEDGE_INICIAL']
+        self.hedge_minimo = config['HEDGE_MINIMO']
+        self.alfa = config['ALFA_EWMA']
+        self.lock = threading.Lock()
+
+    def chave_modelos(self):
+        # Entra na chave do cache de gerações: trocar os modelos invalida as gerações guardadas
+        return ','.join(m.nome for m in self.modelos)
+
+    def modelo_padrao(self):
+        return self.modelos[0].nome
+
+    def candidatos(self, quantidade, tipos):
+        # Nomes dos modelos que atendem o pedido, do mais rápido ao mais lento;
+        # se nenhum atender, todos, para não deixar o pedido sem modelo
+        aptos = [m for m in self.modelos if m.atende(quantidade, tipos)] or self.modelos
+        with self.lock:
+            ordenados = sorted(aptos, key=lambda m: (m.segundos_por_questao is not None, m.segundos_por_questao or 0))
+        return [m.nome for m in ordenados]
+
+    def limiar_hedge(self, nome):
+        with self.lock:
+            amostras = list(self.por_nome[nome].amostras_primeiro_token)
+        if len(amostras) < MIN_AMOSTRAS:
+            return self.hedge_inicial
+        return max(self.hedge_minimo, percentil(amostras, self.percentil_hedge))
+
+    def registrar(self, nome, quantidade, duracao, primeiro_token=None, erro=False):
+        modelo = self.por_nome.get(nome)
+        if modelo is None:
+            return
+        if primeiro_token is not None:
+            metricas.LLM_PRIMEIRO_TOKEN.observar(primeiro_token, modelo=nome)
+        with self.lock:
+            if primeiro_token is not None:
+                modelo.amostras_primeiro_token.append(primeiro_token)
+                modelo.primeiro_token = ewma(modelo.primeiro_token, primeiro_token, self.alfa)
+            valor = duracao / max(1, quantidade)
+            if erro:
+                valor = max(modelo.segundos_por_questao or 0, valor) * PENALIDADE_ERRO
+            modelo.segundos_por_questao = ewma(modelo.segundos_por_questao, valor, self.alfa)
+
+    # Chamadas
+
+    def chamar(self, quantidade, tipos, kwargs, replica=0):
+        candidatos = self.candidatos(quantidade, tipos)
+        if self.hedge and len(candidatos) > 1:
+            return self.chamar_com_hedge(candidatos, quantidade, kwargs, replica)
+        return self.chamar_direto(candidatos[0], quantidade, kwargs, replica)
+
+    async def achamar(self, quantidade, tipos, kwargs, replica=0):
+        candidatos = self.candidatos(quantidade, tipos)
+        if self.hedge and len(candidatos) > 1:
+            return await self.achamar_com_hedge(candidatos, quantidade, kwargs, replica)
+        return await self.achamar_direto(candidatos[0], quantidade, kwargs, replica)
+
+    def chamar_direto(self, nome, quantidade, kwargs, replica):
+        inicio = time.monotonic()
+        try:
+            resposta = llm.criar(replica=replica, model=nome, **kwargs)
+        except governador.LimiteLLMExcedido:
+            raise  # Fila local, não lentidão do modelo
+        except Exception:
+            self.registrar(nome, quantidade, time.monotonic() - inicio, erro=True)
+            raise
+        self.registrar(nome, quantidade, time.monotonic() - inicio)
+        return resposta
+
+    async def achamar_direto(self, nome, quantidade, kwargs, replica):
+        inicio = time.monotonic()
+        try:
+            resposta = await llm.acriar(replica=replica, model=nome, **kwargs)
+        except governador.LimiteLLMExcedido:
+            raise
+        except Exception:
+            self.registrar(nome, quantidade, time.monotonic() - inicio, erro=True)
+            raise
+        self.registrar(nome, quantidade, time.monotonic() - inicio)
+        return resposta
+
+    def chamar_com_hedge(self, candidatos, quantidade, kwargs, replica):
+        primario = Participante(self, candidatos[0], quantidade, kwargs, replica)
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='hedge')
+        try:
+            # copy_context: as threads continuam somando no Server-Timing da requisição
+            futuro = executor.submit(contextvars.copy_context().run, primario.executar)
+            primario.respondeu.wait(self.limiar_hedge(primario.modelo))
+            if not self.deve_hedge(primario, futuro):
+                return futuro.result()
+            secundario = Participante(self, candidatos[1], quantidade, kwargs, replica)
+            futuros = {futuro: primario,
+                       executor.submit(contextvars.copy_context().run, secundario.executar): secundario}
+            pendentes, erro = set(futuros), None
+            while pendentes:
+                prontos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+                for pronto in prontos:
+                    if pronto.exception() is None:
+                        for perdedor in pendentes:
+                            futuros[perdedor].cancelar()
+                        metricas.LLM_HEDGES.inc(vencedor='primario' if futuros[pronto] is primario else 'secundario')
+                        return pronto.result()
+                    erro = erro or pronto.exception()
+            metricas.LLM_HEDGES.inc(vencedor='nenhum')
+            raise erro
+        finally:
+            executor.shutdown(wait=False)  # O perdedor termina sozinho ao ver o stream fechado
+
+    async def achamar_com_hedge(self, candidatos, quantidade, kwargs, replica):
+        primario = ParticipanteAsync(self, candidatos[0], quantidade, kwargs, replica)
+        tarefa = asyncio.ensure_future(primario.executar())
+        tarefas = {tarefa: primario}
+        try:
+            try:
+                await asyncio.wait_for(primario.respondeu.wait(), self.limiar_hedge(primario.modelo))
+            except asyncio.TimeoutError:
+                pass
+            if not self.deve_hedge(primario, tarefa):
+                return await tarefa
+            secundario = ParticipanteAsync(self, candidatos[1], quantidade, kwargs, replica)
+            tarefas[asyncio.ensure_future(secundario.executar())] = secundario
+            pendentes, erro = set(tarefas), None
+            while pendentes:
+                prontos, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+                for pronta in prontos:
+                    if pronta.exception() is None:
+                        metricas.LLM_HEDGES.inc(vencedor='primario' if tarefas[pronta] is primario else 'secundario')
+                        return pronta.result()
+                    erro = erro or pronta.exception()
+            metricas.LLM_HEDGES.inc(vencedor='nenhum')
+            raise erro
+        finally:
+            # O perdedor (ou todos, se esta corrotina for cancelada) fecha o próprio stream
+            restantes = [t for t in tarefas if not t.done()]
+            for restante in restantes:
+                restante.cancel()
+            await asyncio.gather(*restantes, return_exceptions=True)
+
+    def deve_hedge(self, primario, execucao):
+        # Sem primeiro token no limiar: ainda esperando ou falhou antes de responder
+        if primario.tempo_primeiro_token is not None:
+            return False
+        if execucao.done() and execucao.exception() is None:
+            return False
+        logger.info("Modelo %s %s antes do primeiro token; hedge no secundário", primario.modelo,
+                    'falhou' if execucao.done() else 'demorou')
+        return True
+
+
+# --- Participantes de uma corrida (uma chamada com streaming a um modelo) ---
+
+class Acumulador:
+    # Junta os pedaços do stream numa ChatCompletion, como a de uma chamada sem streaming
+    def __init__(self):
+        self.partes = []
+        self.fim = None
+        self.uso = None
+
+    def alimentar(self, chunk):
+        # True se o pedaço trouxe texto
+        uso = getattr(getattr(chunk, 'x_groq', None), 'usage', None) or getattr(chunk, 'usage', None)
+        if uso is not None:
+            self.uso = uso
+        if not chunk.choices:
+            return False
+        escolha = chunk.choices[0]
+        self.fim = escolha.finish_reason or self.fim
+        if escolha.delta.content:
+            self.partes.append(escolha.delta.content)
+            return True
+        return False
+
+    def resposta(self, modelo):
+        from groq.types.chat import ChatCompletion
+
+        return ChatCompletion.model_validate({
+            'id': f"chatcmpl-{uuid.uuid4().hex}", 'object': 'chat.completion', 'created': int(time.time()),
+            'model': modelo,
+            # Stream que terminou sem finish_reason foi cortado
+            'choices': [{'index': 0, 'finish_reason': self.fim or 'length',
+                         'message': {'role': 'assistant', 'content': ''.join(self.partes)}}],
+            'usage': self.uso.model_dump() if self.uso is not None else None,
+        })
+
+
+class Participante:
+    def __init__(self, roteador, modelo, quantidade, kwargs, replica):
+        self.roteador = roteador
+        self.modelo = modelo
+        self.quantidade = quantidade
+        self.kwargs = {**kwargs, 'model': modelo, 'stream': True}
+        self.replica = replica
+        self.respondeu = threading.Event()  # Primeiro token, ou o fim (com ou sem erro)
+        self.inicio = time.monotonic()
+        self.tempo_primeiro_token = None
+        self.lock = threading.Lock()
+        self.stream = None
+        self.cancelado = threading.Event()
+
+    def decorrido(self):
+        return time.monotonic() - self.inicio
+
+    def marcar_texto(self):
+        if self.tempo_primeiro_token is None:
+            self.tempo_primeiro_token = self.decorrido()
+            self.respondeu.set()
+
+    def concluir(self, acumulador):
+        self.roteador.registrar(self.modelo, self.quantidade, self.decorrido(), self.tempo_primeiro_token)
+        return acumulador.resposta(self.modelo)
+
+    def falhar(self, erro):
+        if not isinstance(erro, governador.LimiteLLMExcedido):
+            self.roteador.registrar(self.modelo, self.quantidade, self.decorrido(), self.tempo_primeiro_token,
+                                    erro=True)
+
+    def registrar_cancelamento(self):
+        # Perdeu a corrida: o tempo até aqui é um piso para a duração. Sem primeiro token, não
+        # há amostra dele: um piso cortado no cancelamento puxaria o limiar do hedge para baixo
+        self.roteador.registrar(self.modelo, self.quantidade, self.decorrido(), self.tempo_primeiro_token)
+
+    def executar(self):
+        self.inicio = time.monotonic()
+        try:
+            with transporte.abandonavel(self.cancelado):
+                stream = llm.criar(replica=self.replica, **self.kwargs)
+            with self.lock:
+                self.stream = stream
+                cancelado = self.cancelado.is_set()
+            if cancelado:
+                stream.close()
+                raise CorridaCancelada()
+            acumulador = Acumulador()
+            for chunk in stream:
+                if acumulador.alimentar(chunk):
+                    self.marcar_texto()
+            return self.concluir(acumulador)
+        except Exception as e:
+            if self.cancelado.is_set():
+                raise CorridaCancelada() from e
+            self.falhar(e)
+            raise
+        finally:
+            self.respondeu.set()
+
+    def cancelar(self):
+        # Chamado pela thread da corrida: fechar o stream interrompe a leitura na thread do participante
+        with self.lock:
+            self.cancelado.set()
+            stream = self.stream
+        self.registrar_cancelamento()
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception as e:
+                logger.debug("Falha ao fechar o stream do modelo %s: %s", self.modelo, e)
+
+
+class ParticipanteAsync(Participante):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.respondeu = asyncio.Event()
+
+    async def executar(self):
+        self.inicio = time.monotonic()
+        try:
+            self.stream = await llm.acriar(replica=self.replica, **self.kwargs)
+            acumulador = Acumulador()
+            async for chunk in self.stream:
+                if acumulador.alimentar(chunk):
+                    self.marcar_texto()
+            return self.concluir(acumulador)
+        except asyncio.CancelledError:
+            self.registrar_cancelamento()
+            if self.stream is not None:
+                await self.stream.close()
+            raise
+        except Exception as e:
+            self.falhar(e)
+            raise
+        finally:
+            self.respondeu.set()
+
+
+_roteador = None
+_roteador_lock = threading.Lock()
+
+
+def obter():
+    global _roteador
+    with _roteador_lock:
+        if _roteador is None:
+            _roteador = Roteador(settings.LLM_ROTEAMENTO)
+    return _roteador
+
+
+def reiniciar():
+    # Descarta as médias medidas; a próxima chamada lê LLM_ROTEAMENTO de novo
+    global _roteador
+    with _roteador_lock:
+        _roteador = None
+
+
+@receiver(setting_changed)
+def _recarregar(setting, **kwargs):
+    if setting == 'LLM_ROTEAMENTO':
+        reiniciar()
+
+
+def criar(quantidade, tipos, replica=0, **kwargs):
+    # Como llm.criar, mas o modelo é escolhido aqui
+    return obter().chamar(quantidade, tipos, kwargs, replica)
+
+
+async def acriar(quantidade, tipos, replica=0, **kwargs):
+    return await obter().achamar(quantidade, tipos, kwargs, replica)
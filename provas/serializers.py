@@ -1,5 +1,7 @@
+from collections import Counter
+
 from rest_framework import serializers
-from .models import CriteriosProva, Questao, Gabarito, NivelDificuldade, TipoQuestao
+from .models import CriteriosProva, Questao, Gabarito, JobGeracao, LoteGeracao, EstadoJob, NivelDificuldade, TipoQuestao
 
 class QuestaoSerializer(serializers.ModelSerializer):
     tipo = serializers.ChoiceField(choices=TipoQuestao.choices)
@@ -14,11 +16,12 @@ class CriteriosProvaSerializer(serializers.ModelSerializer):
     #Para exibir texto, ao invés de chave estrangeira
     tipos_questoes = serializers.CharField()
     dificuldade = serializers.CharField()
-    questoes = QuestaoSerializer(many=True, read_only=True)  # Serializa as questões relacionadas
+    questoes = QuestaoSerializer(many=True, read_only=True, source='questoes_ordenadas')  # Serializa as questões relacionadas
 
     class Meta:
         model = CriteriosProva
         fields = '__all__'
+        read_only_fields = ['criado_por']
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -26,7 +29,60 @@ class CriteriosProvaSerializer(serializers.ModelSerializer):
         representation['dificuldade'] = instance.get_dificuldade_display()
         return representation
 
+class ResumoProvaSerializer(serializers.ModelSerializer):
+    # Listagem: só os critérios, sem as questões
+    class Meta:
+        model = CriteriosProva
+        fields = ['id', 'tema', 'dificuldade', 'quantidade_questoes', 'tipos_questoes', 'criado_por', 'criado_em']
+
+class QuestaoListagemSerializer(QuestaoSerializer):
+    criado_em = serializers.DateTimeField(read_only=True)
+
 class GabaritoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Gabarito
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class JobGeracaoSerializer(serializers.ModelSerializer):
+    # Tempos em segundos: espera na fila e duração da geração
+    tempo_fila = serializers.SerializerMethodField()
+    tempo_execucao = serializers.SerializerMethodField()
+
+    class Meta:
+        model = JobGeracao
+        fields = ['id', 'estado', 'prova', 'erro', 'criado_em', 'iniciado_em', 'finalizado_em',
+                  'tempo_fila', 'tempo_execucao']
+
+    def get_tempo_fila(self, obj):
+        if obj.iniciado_em is None:
+            return None
+        return (obj.iniciado_em - obj.criado_em).total_seconds()
+
+    def get_tempo_execucao(self, obj):
+        if obj.iniciado_em is None or obj.finalizado_em is None:
+            return None
+        return (obj.finalizado_em - obj.iniciado_em).total_seconds()
+
+class LoteGeracaoSerializer(serializers.ModelSerializer):
+    # Espera os jobs pré-carregados em ordem de linha (prefetch de `jobs`)
+    progresso = serializers.SerializerMethodField()
+    concluido = serializers.SerializerMethodField()
+    linhas = serializers.SerializerMethodField()
+
+    class Meta:
+        model = LoteGeracao
+        fields = ['id', 'total', 'criado_em', 'progresso', 'concluido', 'linhas']
+
+    def get_progresso(self, obj):
+        contagem = Counter(job.estado for job in obj.jobs.all())
+        return {estado: contagem.get(estado, 0) for estado in EstadoJob.values}
+
+    def get_concluido(self, obj):
+        return all(job.estado in (EstadoJob.CONCLUIDO, EstadoJob.FALHOU) for job in obj.jobs.all())
+
+    def get_linhas(self, obj):
+        return [
+            {'linha': job.linha, 'prova': job.prova_id, 'job': job.id, 'estado': job.estado, 'erro': job.erro,
+             'compartilha_com': job.lider_id}
+            for job in obj.jobs.all()
+        ]
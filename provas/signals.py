@@ -0,0 +1,52 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import busca, cache_leitura, deduplicacao, pdf, snapshots
+from .models import CriteriosProva, Gabarito, ItemProva, Questao
+
+
+# Invalidação do cache de leitura, dos snapshots e dos PDFs. bulk_create não dispara sinais,
+# mas só é usado na criação da prova, antes de existir cache ou snapshot dela.
+# Pelo mesmo motivo, as questões do bulk_create são indexadas (busca e duplicatas) por persistir_questoes.
+
+
+def invalidar(*provas_ids):
+    cache_leitura.invalidar(*provas_ids)
+    snapshots.invalidar(*provas_ids)
+    pdf.invalidar(*provas_ids)
+
+
+@receiver([post_save, post_delete], sender=CriteriosProva)
+def invalidar_prova(sender, instance, created=False, **kwargs):
+    if not created:  # Prova nova ainda não tem nada em cache
+        invalidar(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Gabarito)
+@receiver([post_save, post_delete], sender=ItemProva)
+def invalidar_prova_relacionada(sender, instance, **kwargs):
+    invalidar(instance.prova_id)
+
+
+@receiver([post_save, post_delete], sender=Questao)
+def invalidar_provas_da_questao(sender, instance, **kwargs):
+    # Uma questão do banco pode estar em várias provas
+    provas_ids = list(ItemProva.objects.filter(questao_id=instance.id).values_list('prova_id', flat=True))
+    if provas_ids:
+        invalidar(*provas_ids)
+
+
+@receiver(post_save, sender=Questao)
+def indexar_questao(sender, instance, **kwargs):
+    busca.indexar([instance])
+    deduplicacao.registrar([instance])
+
+
+@receiver(m2m_changed, sender=CriteriosProva.questoes.through)
+def invalidar_questoes_alteradas(sender, instance, action, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, CriteriosProva):
+        invalidar(instance.id)
+    elif pk_set:
+        invalidar(*pk_set)
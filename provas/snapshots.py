@@ -0,0 +1,60 @@
+from rest_framework.renderers import JSONRenderer
+
+from . import metricas
+from .models import CriteriosProva, Gabarito, SnapshotProva, prefetch_questoes
+from .serializers import CriteriosProvaSerializer, GabaritoSerializer
+
+# Incrementar sempre que a saída de CriteriosProvaSerializer ou GabaritoSerializer mudar
+VERSAO = 1
+
+CAMPOS = {
+    'prova': 'prova_json',
+    'gabarito': 'gabarito_json',
+}
+
+
+def renderizar(prova):
+    # `prova` deve vir com as questões carregadas (prefetch) e, se existir, o gabarito
+    renderer = JSONRenderer()
+    with metricas.fase('renderizar'):
+        prova_json = renderer.render(CriteriosProvaSerializer(prova).data)
+        try:
+            gabarito_json = renderer.render(GabaritoSerializer(prova.gabarito).data)
+        except Gabarito.DoesNotExist:
+            gabarito_json = None
+    return prova_json, gabarito_json
+
+
+def salvar(prova):
+    prova_json, gabarito_json = renderizar(prova)
+    SnapshotProva.objects.update_or_create(
+        prova=prova,
+        defaults={'versao': VERSAO, 'prova_json': prova_json, 'gabarito_json': gabarito_json},
+    )
+
+
+def obter(tipo, prova_id):
+    # Bytes do JSON ou None se não houver snapshot na versão atual
+    conteudo = (
+        SnapshotProva.objects.filter(prova_id=prova_id, versao=VERSAO)
+        .values_list(CAMPOS[tipo], flat=True)
+        .first()
+    )
+    return bytes(conteudo) if conteudo is not None else None
+
+
+def invalidar(*provas_ids):
+    SnapshotProva.objects.filter(prova_id__in=provas_ids).delete()
+
+
+def reconstruir(todas=False, tamanho_lote=200):
+    # Refaz os snapshots ausentes ou de versões anteriores (ou todos); devolve a quantidade
+    provas = CriteriosProva.objects.select_related('gabarito').prefetch_related(prefetch_questoes()).order_by('id')
+    if not todas:
+        atualizados = SnapshotProva.objects.filter(versao=VERSAO).values('prova_id')
+        provas = provas.exclude(id__in=atualizados)
+    total = 0
+    for prova in provas.iterator(chunk_size=tamanho_lote):
+        salvar(prova)
+        total += 1
+    return total
@@ -1,11 +1,59 @@
-from django.test import TestCase
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from datetime import timedelta
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
-from .models import CriteriosProva, Questao, Gabarito, NivelDificuldade, TipoQuestao
+from .models import CriteriosProva, Questao, ItemProva, Gabarito, JobGeracao, LoteGeracao, SnapshotProva, EstadoJob, NivelDificuldade, TipoQuestao, DocumentoCurriculo, AssinaturaQuestao
 from .serializers import CriteriosProvaSerializer
-from unittest.mock import patch
+import asyncio
+import io
+import os
+import json
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+from unittest.mock import AsyncMock, patch
+from pathlib import Path
+from types import SimpleNamespace
+from .resposta_llm import ParserQuestoesIncremental, extrair_objetos
+from . import (banco_questoes, busca, cache_geracao, curriculo, deduplicacao, governador, llm, metricas, pdf, roteamento, snapshots,
+               transporte, variantes)
+from benchmarks import groq_falso
+from django.core.management import call_command
+from .geracao import (dividir_em_lotes, formatar_questao, gerar_questoes, gerar_questoes_em_fluxo, persistir_questoes,
+                      processar_resposta_groq)
+from .deduplicacao import Deduplicador
 from django.contrib.auth.models import User  # Importe o modelo User
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+class CachesLimposMixin:
+    # Cada teste começa com os caches vazios: gerações (o backend é recriado), leituras e o
+    # índice de duplicatas em memória; com o disjuntor da LLM fechado e sem médias de latência.
+    # O estado do governador vai para um diretório temporário, não para o llm_estado/ do projeto
+    # (compartilhado com o servidor de desenvolvimento).
+    def setUp(self):
+        super().setUp()
+        caches[settings.PROVAS_CACHE_LEITURA['ALIAS']].clear()
+        deduplicacao.limpar_memoria()
+        transporte.reiniciar()
+        roteamento.reiniciar()
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        override = override_settings(
+            GERACAO_CACHE={**settings.GERACAO_CACHE, 'BACKEND': 'memoria'},
+            LLM_LIMITES={**settings.LLM_LIMITES, 'DIRETORIO': Path(diretorio.name)},
+        )
+        override.enable()
+        self.addCleanup(override.disable)
 
 
 # --- Testes Unitários ---
@@ -26,8 +74,9 @@ class TipoQuestaoTestCase(TestCase):
         self.assertEqual(TipoQuestao.VERDADEIRO_FALSO, 'verdadeiro_falso')
 
 # --- Testes de Integração ---
-class GerarProvaAPITestCase(TestCase):
+class GerarProvaAPITestCase(CachesLimposMixin, TestCase):
     def setUp(self):
+        super().setUp()
         self.client = APIClient()
         self.url = reverse('gerar-prova')
         self.dados_validos = {
@@ -46,7 +95,7 @@ class GerarProvaAPITestCase(TestCase):
         self.user = User.objects.create_user(username='testuser', password='testpassword')
         self.client.force_authenticate(user=self.user)
 
-    @patch('provas.views.client.chat.completions.create')
+    @patch('provas.llm.client.chat.completions.create')
     def test_criar_prova_com_sucesso(self, mock_groq_create):
         mock_groq_create.return_value.choices[0].message.content = """
         {
@@ -93,13 +142,14 @@ class GerarProvaAPITestCase(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-class BuscaQuestoes(TestCase): #Classe para testar os serviços, separadamente
+class BuscaQuestoes(CachesLimposMixin, TestCase): #Classe para testar os serviços, separadamente
     def setUp(self):
+        super().setUp()
         self.client = APIClient()
         self.user = User.objects.create_user(username='testuser', password='testpassword')
         self.client.force_authenticate(user=self.user)
 
-    @patch('provas.views.client.chat.completions.create')
+    @patch('provas.llm.client.chat.completions.create')
     def test_criar_multipla_escolha(self, mock_groq):
         mock_groq.return_value.choices[0].message.content = """
         {
@@ -131,7 +181,7 @@ class BuscaQuestoes(TestCase): #Classe para testar os serviços, separadamente
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
 
-    @patch('provas.views.client.chat.completions.create')
+    @patch('provas.llm.client.chat.completions.create')
     def test_criar_dissertativa(self, mock_groq):
         mock_groq.return_value.choices[0].message.content = """
         {
@@ -160,7 +210,7 @@ class BuscaQuestoes(TestCase): #Classe para testar os serviços, separadamente
         response = self.client.post(url, dados_entrada, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
-    @patch('provas.views.client.chat.completions.create')
+    @patch('provas.llm.client.chat.completions.create')
     def test_criar_verdadeiro_falso(self, mock_groq):
         mock_groq.return_value.choices[0].message.content = """
         {
@@ -187,4 +237,1713 @@ class BuscaQuestoes(TestCase): #Classe para testar os serviços, separadamente
         #Chama o endpoint
         url = reverse('gerar-prova')
         response = self.client.post(url, dados_entrada, format='json')
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+class JobGeracaoAPITestCase(CachesLimposMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.url = reverse('gerar-prova') + '?assincrono=true'
+        self.dados_validos = {
+            'tema': 'Teste',
+            'dificuldade': NivelDificuldade.LEMBRAR,
+            'quantidade_questoes': 1,
+            'tipos_questoes': TipoQuestao.DISSERTATIVA,
+        }
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+
+    @override_settings(GERACAO_JOBS={'BACKEND': 'banco', 'WORKERS': 1})
+    @patch('provas.llm.client.chat.completions.create')
+    def test_job_retorna_202_sem_chamar_llm(self, mock_groq):
+        response = self.client.post(self.url, self.dados_validos, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['estado'], EstadoJob.PENDENTE)
+        self.assertEqual(response['Location'], reverse('detalhar-job', kwargs={'id': response.data['id']}))
+        mock_groq.assert_not_called()
+        self.assertEqual(Questao.objects.count(), 0)
+
+    @override_settings(GERACAO_JOBS={'BACKEND': 'sincrono', 'WORKERS': 1})
+    @patch('provas.llm.client.chat.completions.create')
+    def test_job_concluido(self, mock_groq):
+        mock_groq.return_value.choices[0].message.content = """
+        {"questoes": [{"tipo": "dissertativa", "enunciado": "Enunciado", "resposta": "Resposta"}]}
+        """
+        response = self.client.post(self.url, self.dados_validos, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        response = self.client.get(reverse('detalhar-job', kwargs={'id': response.data['id']}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['estado'], EstadoJob.CONCLUIDO)
+        self.assertIsNotNone(response.data['tempo_execucao'])
+        prova = CriteriosProva.objects.get(id=response.data['prova'])
+        self.assertEqual(prova.questoes.count(), 1)
+        self.assertTrue(Gabarito.objects.filter(prova=prova).exists())
+
+    @override_settings(GERACAO_JOBS={'BACKEND': 'sincrono', 'WORKERS': 1})
+    @patch('provas.llm.client.chat.completions.create', side_effect=RuntimeError('indisponível'))
+    def test_job_com_falha(self, mock_groq):
+        response = self.client.post(self.url, self.dados_validos, format='json')
+        job = JobGeracao.objects.get(id=response.data['id'])
+        self.assertEqual(job.estado, EstadoJob.FALHOU)
+        self.assertEqual(job.erro, 'indisponível')
+
+
+def chunks_stream(texto, tamanho=7):
+    # Simula os chunks de `client.chat.completions.create(stream=True)`
+    return [
+        SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=texto[i:i + tamanho]))])
+        for i in range(0, len(texto), tamanho)
+    ]
+
+
+class ParserQuestoesIncrementalTestCase(TestCase):
+    texto = """{"questoes": [
+        {"tipo": "multipla_escolha", "enunciado": "Quanto é {1} + \\"1\\"?", "opcoes": ["1", "2"], "resposta": "B"},
+        {"tipo": "dissertativa", "enunciado": "Explique ]", "resposta": "..."}
+    ]}"""
+
+    def test_objetos_emitidos_assim_que_completos(self):
+        parser = ParserQuestoesIncremental()
+        emitidos = []
+        for i, c in enumerate(self.texto):
+            for objeto in parser.alimentar(c):
+                emitidos.append((i, objeto))
+        self.assertEqual(len(emitidos), 2)
+        self.assertEqual(emitidos[0][1]['enunciado'], 'Quanto é {1} + "1"?')
+        self.assertEqual(emitidos[0][1]['opcoes'], ['1', '2'])
+        # A primeira questão sai antes do fim do texto
+        self.assertLess(emitidos[0][0], self.texto.index('dissertativa'))
+        self.assertTrue(parser.finalizado)
+
+
+def resposta_texto(texto, finish_reason='stop'):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=texto), finish_reason=finish_reason)])
+
+
+class RespostaToleranteTestCase(CachesLimposMixin, TestCase):
+    truncada = """Claro! Seguem as questões:
+```json
+{"questoes": [
+    {"tipo": "verdadeiro_falso", "enunciado": "A água ferve a 100 °C ao nível do mar", "resposta": "Verdadeiro"},
+    {"tipo": "verdadeiro_falso", "enunciado": "O gelo é mais denso que a ág"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+
+    def test_cercas_texto_e_truncamento(self):
+        objetos, completa = extrair_objetos(self.truncada)
+        self.assertFalse(completa)
+        self.assertEqual([o['resposta'] for o in objetos], ['Verdadeiro'])
+
+        objetos, completa = extrair_objetos('Aqui está:\n```\n[{"tipo": "dissertativa"}]\n```\nBons estudos!')
+        self.assertTrue(completa)
+        self.assertEqual(objetos, [{'tipo': 'dissertativa'}])
+
+    def test_validacao_das_questoes(self):
+        base = {'enunciado': 'Enunciado', 'resposta': 'A'}
+        self.assertIsNone(formatar_questao({**base, 'tipo': 'multipla_escolha'}))
+        self.assertIsNone(formatar_questao({**base, 'tipo': 'multipla_escolha', 'opcoes': ['Só uma']}))
+        self.assertIsNone(formatar_questao({**base, 'tipo': 'ensaio'}))
+        self.assertIsNone(formatar_questao({'tipo': 'dissertativa', 'enunciado': ' ', 'resposta': 'A'}))
+        questao = formatar_questao({**base, 'tipo': 'Múltipla Escolha', 'opcoes': ['A', 'B'],
+                                    'nivel_dificuldade': 'Difícil'})
+        self.assertEqual(questao['tipo'], TipoQuestao.MULTIPLA_ESCOLHA)
+        self.assertIsNone(questao['nivel_dificuldade'])
+        questao = formatar_questao({'tipo': 'Verdadeiro/Falso', 'enunciado': 'E', 'resposta': True,
+                                    'nivel_dificuldade': 'Entender'})
+        self.assertEqual((questao['tipo'], questao['resposta'], questao['nivel_dificuldade']),
+                         ('verdadeiro_falso', 'True', 'entender'))
+
+    @patch('provas.llm.client.chat.completions.create')
+    def test_resposta_truncada_pede_so_o_que_faltou(self, mock_groq):
+        mock_groq.side_effect = [
+            resposta_texto(self.truncada, finish_reason='length'),
+            resposta_groq([
+                {'tipo': 'verdadeiro_falso', 'enunciado': 'O gelo é menos denso que a água', 'resposta': 'Verdadeiro'},
+                {'tipo': 'verdadeiro_falso', 'enunciado': 'O vapor é invisível', 'resposta': 'Verdadeiro'},
+            ]),
+        ]
+        prova = CriteriosProva.objects.create(tema='Água', dificuldade='lembrar', quantidade_questoes=3,
+                                              tipos_questoes='verdadeiro_falso', criado_por=self.user)
+        with self.assertLogs('provas.geracao', level='WARNING'):
+            gerar_questoes(prova, usar_cache=False)
+        self.assertEqual(mock_groq.call_count, 2)
+        complemento = mock_groq.call_args.kwargs['messages'][0]['content']
+        self.assertIn('Gere 2 questões', complemento)
+        self.assertIn('não as repita', complemento)
+        self.assertIn('A água ferve a 100 °C ao nível do mar', complemento)
+        self.assertEqual(prova.questoes.count(), 3)
+        self.assertEqual(len(prova.gabarito.respostas), 3)
+
+    @patch('provas.llm.client.chat.completions.create')
+    def test_stream_truncado_e_complementado(self, mock_groq):
+        mock_groq.side_effect = [
+            chunks_stream(self.truncada),
+            resposta_groq([{'tipo': 'verdadeiro_falso', 'enunciado': 'O gelo flutua na água', 'resposta': 'V'}]),
+        ]
+        prova = CriteriosProva.objects.create(tema='Água', dificuldade='lembrar', quantidade_questoes=2,
+                                              tipos_questoes='verdadeiro_falso', criado_por=self.user)
+        with self.assertLogs('provas.geracao', level='WARNING'):
+            enunciados = [q.enunciado for q in gerar_questoes_em_fluxo(prova, usar_cache=False)]
+        self.assertEqual(enunciados, ['A água ferve a 100 °C ao nível do mar', 'O gelo flutua na água'])
+        self.assertFalse(mock_groq.call_args.kwargs.get('stream', False))
+        self.assertEqual(len(prova.gabarito.respostas), 2)
+
+
+class GerarProvaStreamAPITestCase(CachesLimposMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+
+    @patch('provas.llm.client.chat.completions.create')
+    def test_stream_sse(self, mock_groq):
+        mock_groq.return_value = chunks_stream("""{"questoes": [
+            {"tipo": "verdadeiro_falso", "enunciado": "A", "resposta": "V"},
+            {"tipo": "verdadeiro_falso", "enunciado": "B", "resposta": "F"}
+        ]}""")
+        dados = {
+            'tema': 'Teste',
+            'dificuldade': NivelDificuldade.LEMBRAR,
+            'quantidade_questoes': 2,
+            'tipos_questoes': TipoQuestao.VERDADEIRO_FALSO,
+        }
+        response = self.client.post(reverse('gerar-prova-stream'), dados, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        corpo = b''.join(response.streaming_content).decode()
+        self.assertEqual(corpo.count('event: questao'), 2)
+        self.assertIn('event: fim', corpo)
+        self.assertTrue(mock_groq.call_args.kwargs['stream'])
+        prova = CriteriosProva.objects.get()
+        self.assertEqual(prova.questoes.count(), 2)
+        self.assertEqual(len(prova.gabarito.respostas), 2)
+
+    @patch('provas.llm.client.chat.completions.create', side_effect=RuntimeError('detalhe interno do provedor'))
+    def test_falha_na_chamada_finaliza_a_prova(self, mock_groq):
+        dados = {'tema': 'Falha', 'dificuldade': 'lembrar', 'quantidade_questoes': 1, 'tipos_questoes': 'dissertativa'}
+        response = self.client.post(reverse('gerar-prova-stream'), dados, format='json')
+        with self.assertLogs('provas.views', level='ERROR'):
+            corpo = b''.join(response.streaming_content).decode()
+        self.assertIn('event: erro', corpo)
+        self.assertIn('Falha ao gerar a prova.', corpo)
+        self.assertNotIn('detalhe interno', corpo)
+        prova = CriteriosProva.objects.get()
+        self.assertEqual(prova.gabarito.respostas, {})
+        self.assertTrue(SnapshotProva.objects.filter(prova=prova).exists())
+
+
+class CacheGeracaoTestCase(CachesLimposMixin, TestCase):
+    resposta = """{"questoes": [{"tipo": "dissertativa", "enunciado": "Enunciado", "resposta": "Resposta"}]}"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.dados = {
+            'tema': 'Fotossíntese',
+            'dificuldade': NivelDificuldade.ENTENDER,
+            'quantidade_questoes': 1,
+            'tipos_questoes': TipoQuestao.DISSERTATIVA,
+            'curriculo': 'Biologia  do ensino médio',
+        }
+
+    def test_chave_normaliza_criterios(self):
+        a = CriteriosProva(tema=' Fotossíntese ', dificuldade='lembrar', quantidade_questoes=2,
+                           tipos_questoes='dissertativa,multipla_escolha')
+        b = CriteriosProva(tema='fotossíntese', dificuldade='lembrar', quantidade_questoes=2,
+                           tipos_questoes='multipla_escolha, dissertativa')
+        self.assertEqual(cache_geracao.chave_criterios(a, 'm', 1), cache_geracao.chave_criterios(b, 'm', 1))
+        self.assertNotEqual(cache_geracao.chave_criterios(a, 'm', 1), cache_geracao.chave_criterios(a, 'm', 2))
+        self.assertNotEqual(cache_geracao.chave_criterios(a, 'm', 1), cache_geracao.chave_criterios(a, 'n', 1))
+
+    def _gerar_duas_vezes(self, mock_groq, url):
+        mock_groq.return_value.choices[0].message.content = self.resposta
+        antes = cache_geracao.estatisticas()
+        primeira = self.client.post(url, self.dados, format='json')
+        segunda = self.client.post(url, {**self.dados, 'tema': 'fotossíntese '}, format='json')
+        depois = cache_geracao.estatisticas()
+        self.assertNotEqual(primeira.data['id'], segunda.data['id'])
+        self.assertEqual(segunda.data['questoes'][0]['enunciado'], 'Enunciado')
+        return primeira, segunda, antes, depois
+
+    @patch('provas.llm.client.chat.completions.create')
+    def test_acerto_nao_chama_llm(self, mock_groq):
+        primeira, segunda, antes, depois = self._gerar_duas_vezes(mock_groq, reverse('gerar-prova'))
+        self.assertEqual(mock_groq.call_count, 1)
+        # O acerto liga a mesma questão à nova prova, sem copiá-la
+        self.assertEqual(primeira.data['questoes'][0]['id'], segunda.data['questoes'][0]['id'])
+        self.assertEqual(Questao.objects.count(), 1)
+        self.assertEqual(depois['acertos'] - antes['acertos'], 1)
+        self.assertEqual(depois['falhas'] - antes['falhas'], 1)
+        self.assertEqual(Gabarito.objects.count(), 2)
+
+    @override_settings(GERACAO_CACHE={'BACKEND': 'banco', 'TTL': 60, 'MAX_ENTRADAS': 10})
+    @patch('provas.llm.client.chat.completions.create')
+    def test_backend_banco(self, mock_groq):
+        self._gerar_duas_vezes(mock_groq, reverse('gerar-prova'))
+        self.assertEqual(mock_groq.call_count, 1)
+        self.assertEqual(Questao.objects.count(), 1)
+
+    @patch('provas.llm.client.chat.completions.create')
+    def test_acerto_via_stream_liga_as_mesmas_questoes(self, mock_groq):
+        mock_groq.return_value.choices[0].message.content = self.resposta
+        primeira = self.client.post(reverse('gerar-prova'), self.dados, format='json')
+        response = self.client.post(reverse('gerar-prova-stream'), self.dados, format='json')
+        b''.join(response.streaming_content)
+        self.assertEqual(mock_groq.call_count, 1)
+        self.assertEqual(Questao.objects.count(), 1)
+        self.assertEqual(Questao.objects.get().provas.count(), 2)
+        self.assertEqual(primeira.data['questoes'][0]['id'], Questao.objects.get().id)
+
+    @patch('provas.llm.client.chat.completions.create')
+    def test_bypass(self, mock_groq):
+        self._gerar_duas_vezes(mock_groq, reverse('gerar-prova') + '?cache=false')
+        # A segunda geração repete a questão já no banco: é pedida de novo em cada tentativa
+        # e, como a LLM insiste, a repetida completa a prova
+        self.assertEqual(mock_groq.call_count, 2 + settings.GERACAO_LOTES['TENTATIVAS'])
+
+    def test_lru_e_ttl_memoria(self):
+        cache = cache_geracao.CacheMemoria({'TTL': 60, 'MAX_ENTRADAS': 2})
+        cache.salvar('a', [1])
+        cache.salvar('b', [2])
+        cache.obter('a')
+        cache.salvar('c', [3])
+        self.assertIsNone(cache.obter('b'))  # menos usada recentemente
+        self.assertEqual(cache.obter('a'), [1])
+        cache.ttl = -1
+        cache.salvar('d', [4])
+        self.assertIsNone(cache.obter('d'))
+
+
+class BancoQuestoesTestCase(CachesLimposMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('gerar-prova') + '?banco=true'
+        self.dados = {
+            'tema': 'Ciclo da Água',
+            'dificuldade': NivelDificuldade.LEMBRAR,
+            'quantidade_questoes': 3,
+            'tipos_questoes': TipoQuestao.VERDADEIRO_FALSO,
+        }
+        # Duas questões já pagas em uma prova de outro usuário
+        outro = User.objects.create_user(username='outro', password='testpassword')
+        prova = CriteriosProva.objects.create(criado_por=outro, **self.dados)
+        for ordem, enunciado in enumerate(['Existente 1', 'Existente 2']):
+            questao = Questao.objects.create(
+                tema='ciclo da água', tipo=TipoQuestao.VERDADEIRO_FALSO, enunciado=enunciado,
+                resposta='V', nivel_dificuldade=NivelDificuldade.LEMBRAR,
+            )
+            ItemProva.objects.create(prova=prova, questao=questao, ordem=ordem)
+
+    @patch('provas.llm.client.chat.completions.create')
+    def test_gera_apenas_o_deficit(self, mock_groq):
+        mock_groq.return_value.choices[0].message.content = """
+        {"questoes": [{"tipo": "verdadeiro_falso", "enunciado": "Nova", "resposta": "F", "nivel_dificuldade": "lembrar"}]}
+        """
+        response = self.client.post(self.url, self.dados, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        prompt = mock_groq.call_args.kwargs['messages'][0]['content']
+        self.assertIn('Gere 1 questões', prompt)
+        self.assertEqual(
+            [q['enunciado'] for q in response.data['questoes']],
+            ['Existente 1', 'Existente 2', 'Nova'],
+        )
+        # A mesma questão agora pertence a duas provas
+        self.assertEqual(Questao.objects.get(enunciado='Existente 1').provas.count(), 2)
+        self.assertEqual(len(Gabarito.objects.get(prova_id=response.data['id']).respostas), 3)
+
+    @patch('provas.llm.client.chat.completions.create')
+    def test_nao_repete_questoes_para_o_mesmo_usuario(self, mock_groq):
+        mock_groq.return_value.choices[0].message.content = """
+        {"questoes": [{"tipo": "verdadeiro_falso", "enunciado": "Nova", "resposta": "F", "nivel_dificuldade": "lembrar"}]}
+        """
+        self.client.post(self.url, {**self.dados, 'quantidade_questoes': 2}, format='json')
+        self.assertEqual(mock_groq.call_count, 0)
+
+        response = self.client.post(self.url, {**self.dados, 'quantidade_questoes': 1}, format='json')
+        self.assertEqual(mock_groq.call_count, 1)
+        self.assertEqual([q['enunciado'] for q in response.data['questoes']], ['Nova'])
+
+    @patch('provas.llm.client.chat.completions.create')
+    def test_acerto_do_cache_e_depois_o_banco(self, mock_groq):
+        mock_groq.return_value.choices[0].message.content = json.dumps({'questoes': [
+            {'tipo': 'verdadeiro_falso', 'enunciado': f'Maré {i}', 'resposta': 'V', 'nivel_dificuldade': 'lembrar'}
+            for i in range(3)
+        ]})
+        dados = {**self.dados, 'tema': 'Marés'}
+        primeira = self.client.post(reverse('gerar-prova'), dados, format='json')
+        segunda = self.client.post(reverse('gerar-prova'), dados, format='json')  # Acerto do cache
+        self.assertEqual(mock_groq.call_count, 1)
+        self.assertEqual([q['id'] for q in primeira.data['questoes']], [q['id'] for q in segunda.data['questoes']])
+        self.assertEqual(Questao.objects.filter(tema='marés').count(), 3)
+
+        outro = APIClient()
+        outro.force_authenticate(user=User.objects.get(username='outro'))
+        response = outro.post(self.url, {**dados, 'quantidade_questoes': 3}, format='json')
+        self.assertEqual(mock_groq.call_count, 1)
+        self.assertEqual(sorted(q['enunciado'] for q in response.data['questoes']), ['Maré 0', 'Maré 1', 'Maré 2'])
+
+    def test_selecao_ignora_enunciados_repetidos(self):
+        # Cópias de gerações antigas: mesmo enunciado em outra linha de Questao
+        for enunciado in ['Existente 1', ' existente  1 ', 'Existente 2', 'Existente 3']:
+            Questao.objects.create(tema='ciclo da água', tipo=TipoQuestao.VERDADEIRO_FALSO, enunciado=enunciado,
+                                   resposta='V', nivel_dificuldade=NivelDificuldade.LEMBRAR)
+        criterios = CriteriosProva(criado_por=self.user, **{**self.dados, 'quantidade_questoes': 5})
+        selecionadas = banco_questoes.selecionar(criterios, tamanho_pagina=2)
+        self.assertEqual([q.enunciado for q in selecionadas], ['Existente 1', 'Existente 2', 'Existente 3'])
+
+        # O que o usuário já viu também não volta como cópia
+        prova = CriteriosProva.objects.create(criado_por=self.user, **self.dados)
+        ItemProva.objects.create(prova=prova, questao=Questao.objects.get(enunciado=' existente  1 '), ordem=0)
+        self.assertEqual([q.enunciado for q in banco_questoes.selecionar(criterios)], ['Existente 2', 'Existente 3'])
+
+
+def resposta_groq(questoes):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps({'questoes': questoes})))])
+
+
+class LLMFalso:
+    # Responde cada prompt com a quantidade pedida de questões numeradas (thread-safe)
+    def __init__(self, falhar_primeiras=0, repetir=False):
+        self.lock = threading.Lock()
+        self.chamadas = 0
+        self.contador = 0
+        self.falhar_primeiras = falhar_primeiras
+        self.repetir = repetir
+
+    def __call__(self, messages, model, **kwargs):
+        prompt = messages[0]['content']
+        quantidade = int(re.search(r'Gere (\d+) questões', prompt).group(1))
+        with self.lock:
+            self.chamadas += 1
+            if self.chamadas <= self.falhar_primeiras:
+                raise RuntimeError('timeout')
+            inicio = self.contador
+            self.contador += quantidade
+        questoes = []
+        for i in range(inicio, inicio + quantidade):
+            enunciado = 'Enunciado repetido' if self.repetir else f'Questão número {i} sobre assunto {i * 7}'
+            questoes.append({'tipo': 'dissertativa', 'enunciado': enunciado, 'resposta': 'R'})
+        return resposta_groq(questoes)
+
+
+class GeracaoEmLotesTestCase(CachesLimposMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.dados = {
+            'tema': 'Teste',
+            'dificuldade': NivelDificuldade.LEMBRAR,
+            'quantidade_questoes': 25,
+            'tipos_questoes': TipoQuestao.DISSERTATIVA,
+        }
+
+    def test_dividir_em_lotes(self):
+        self.assertEqual(dividir_em_lotes(5, ['a', 'b'], 10), [(5, ['a', 'b'])])
+        self.assertEqual(
+            dividir_em_lotes(25, ['a', 'b'], 10),
+            [(10, ['a']), (3, ['a']), (10, ['b']), (2, ['b'])],
+        )
+
+    def test_deduplicador(self):
+        deduplicador = Deduplicador(0.8)
+        aceitas = deduplicador.filtrar([
+            {'enunciado': 'Qual é a capital do Brasil?'},
+            {'enunciado': 'qual é a capital do brasil'},
+            {'enunciado': 'Qual é a capital da Argentina?'},
+        ])
+        self.assertEqual(len(aceitas), 2)
+
+    @override_settings(GERACAO_LOTES={'TAMANHO': 10, 'MAX_PARALELO': 4, 'TENTATIVAS': 2, 'LIMIAR_DUPLICATA': 0.85})
+    def test_lotes_em_paralelo_com_nova_tentativa(self):
+        llm_falso = LLMFalso(falhar_primeiras=1)
+        with patch('provas.llm.client.chat.completions.create', side_effect=llm_falso):
+            response = self.client.post(reverse('gerar-prova'), self.dados, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['questoes']), 25)
+        # 3 lotes (10, 10, 5) + 1 nova tentativa do lote que falhou
+        self.assertEqual(llm_falso.chamadas, 4)
+
+    @override_settings(GERACAO_LOTES={'TAMANHO': 10, 'MAX_PARALELO': 4, 'TENTATIVAS': 1, 'LIMIAR_DUPLICATA': 0.85})
+    def test_duplicatas_descartadas(self):
+        llm_falso = LLMFalso(repetir=True)
+        with patch('provas.llm.client.chat.completions.create', side_effect=llm_falso):
+            response = self.client.post(reverse('gerar-prova'), self.dados, format='json')
+        self.assertEqual(len(response.data['questoes']), 1)
+
+
+class DeduplicacaoTestCase(CachesLimposMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+
+    def criar_prova(self, quantidade=1):
+        return CriteriosProva.objects.create(tema=' Geografia ', dificuldade='lembrar', quantidade_questoes=quantidade,
+                                             tipos_questoes='dissertativa', criado_por=self.user)
+
+    def test_assinaturas_estimam_a_similaridade(self):
+        matriz = deduplicacao.assinaturas([
+            'Explique a função das mitocôndrias nas células.',
+            'explique as funções da mitocôndria na célula',
+            'Explique o ciclo da água.',
+        ])
+        sim = deduplicacao.similaridades(matriz, matriz)
+        self.assertGreater(sim[0, 1], 0.9)
+        self.assertLess(sim[0, 2], 0.2)
+        indice = deduplicacao.IndiceLSH()
+        indice.adicionar(matriz[:2])
+        maxima = indice.similaridade_maxima(matriz[[0, 2]])
+        self.assertEqual(maxima[0], 1.0)
+        self.assertLess(maxima[1], 0.5)  # Sem faixa em comum, nem chega a ser comparada
+
+    @patch('provas.llm.client.chat.completions.create')
+    def test_questao_repetida_do_banco_e_substituida(self, mock_groq):
+        persistir_questoes(self.criar_prova(), [], [
+            {'tipo': 'dissertativa', 'enunciado': 'Qual é a capital do Brasil?', 'resposta': 'Brasília'},
+        ])
+        mock_groq.side_effect = [
+            resposta_groq([{'tipo': 'dissertativa', 'enunciado': 'qual é a capital do brasil', 'resposta': 'DF'}]),
+            resposta_groq([{'tipo': 'dissertativa', 'enunciado': 'Qual é a capital do Chile?', 'resposta': 'Santiago'}]),
+        ]
+        antes = metricas.DUPLICATAS.valor(origem='banco')
+        prova = gerar_questoes(self.criar_prova(), usar_cache=False)
+        self.assertEqual([q.enunciado for q in prova.questoes.all()], ['Qual é a capital do Chile?'])
+        self.assertEqual(mock_groq.call_count, 2)
+        self.assertEqual(metricas.DUPLICATAS.valor(origem='banco'), antes + 1)
+
+    @patch('provas.llm.client.chat.completions.create')
+    def test_stream_descarta_repetidas_do_banco(self, mock_groq):
+        persistir_questoes(self.criar_prova(), [], [
+            {'tipo': 'dissertativa', 'enunciado': 'Qual é a capital do Brasil?', 'resposta': 'Brasília'},
+        ])
+        mock_groq.side_effect = [
+            chunks_stream(json.dumps({'questoes': [
+                {'tipo': 'dissertativa', 'enunciado': 'qual é a capital do brasil', 'resposta': 'DF'},
+                {'tipo': 'dissertativa', 'enunciado': 'Qual é a capital do Chile?', 'resposta': 'Santiago'},
+            ]})),
+            resposta_groq([{'tipo': 'dissertativa', 'enunciado': 'Qual é a capital do Peru?', 'resposta': 'Lima'}]),
+        ]
+        antes = metricas.DUPLICATAS.valor(origem='banco')
+        prova = self.criar_prova(2)
+        enunciados = [q.enunciado for q in gerar_questoes_em_fluxo(prova, usar_cache=False)]
+        self.assertEqual(enunciados, ['Qual é a capital do Chile?', 'Qual é a capital do Peru?'])
+        self.assertEqual(metricas.DUPLICATAS.valor(origem='banco'), antes + 1)
+        self.assertEqual(len(prova.gabarito.respostas), 2)
+
+    def test_indice_incremental(self):
+        persistir_questoes(self.criar_prova(), [], [
+            {'tipo': 'dissertativa', 'enunciado': f'Enunciado {i}', 'resposta': 'R'} for i in range(3)
+        ])
+        self.assertEqual(len(deduplicacao.indice_do_tema('geografia')), 3)
+        # Criada fora do bulk_create: o sinal grava a assinatura
+        Questao.objects.create(tema='geografia', tipo='dissertativa', enunciado='Relevo do Brasil', resposta='R')
+        with self.assertNumQueries(1):
+            indice = deduplicacao.indice_do_tema('geografia')  # Só as assinaturas novas
+        self.assertEqual(len(indice), 4)
+        call_command('reindexar_duplicatas', stdout=io.StringIO())
+        self.assertEqual(AssinaturaQuestao.objects.filter(tema='geografia').count(), 4)
+
+    def test_indice_limitado_mantem_as_mais_recentes(self):
+        matriz = deduplicacao.assinaturas([f'Questão sobre o assunto número {i}' for i in range(5)])
+        indice = deduplicacao.IndiceLSH(capacidade=3)
+        indice.adicionar(matriz[:2])
+        indice.adicionar(matriz[2:4])  # Encaixa nas faixas sem reordenar; a primeira sai
+        self.assertEqual(len(indice), 3)
+        self.assertLess(indice.similaridade_maxima(matriz[[0]])[0], 1.0)
+        self.assertEqual(indice.similaridade_maxima(matriz[1:4]).tolist(), [1.0, 1.0, 1.0])
+        indice.adicionar(matriz[4:])
+        self.assertEqual(indice.similaridade_maxima(matriz[2:5]).tolist(), [1.0, 1.0, 1.0])
+        self.assertTrue((indice.similaridade_maxima(matriz[:2]) < 1.0).all())
+
+    @override_settings(DEDUPLICACAO={'POR_TEMA': 2, 'TEMAS': 1})
+    def test_indice_do_tema_limitado(self):
+        persistir_questoes(self.criar_prova(), [], [
+            {'tipo': 'dissertativa', 'enunciado': f'Enunciado {i}', 'resposta': 'R'} for i in range(3)
+        ])
+        indice = deduplicacao.indice_do_tema('geografia')
+        self.assertEqual(len(indice), 2)  # Só as duas mais recentes
+        maxima = indice.similaridade_maxima(deduplicacao.assinaturas(['Enunciado 0', 'Enunciado 2']))
+        self.assertEqual(maxima[1], 1.0)
+        self.assertLess(maxima[0], 1.0)
+        deduplicacao.indice_do_tema('historia')  # Um tema só em memória: geografia sai
+        self.assertIsNot(deduplicacao.indice_do_tema('geografia'), indice)
+
+
+class ViewsAsyncTestCase(CachesLimposMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.dados = {
+            'tema': 'Teste',
+            'dificuldade': NivelDificuldade.LEMBRAR,
+            'quantidade_questoes': 1,
+            'tipos_questoes': TipoQuestao.VERDADEIRO_FALSO,
+        }
+
+    async def test_sem_token(self):
+        response = await self.async_client.get(reverse('async-detalhar-prova', kwargs={'id': 1}))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+
+    @patch('provas.llm.async_client.chat.completions.create', new_callable=AsyncMock)
+    async def test_gerar_e_detalhar(self, mock_groq):
+        mock_groq.return_value = resposta_groq([
+            {'tipo': 'verdadeiro_falso', 'enunciado': 'Enunciado', 'resposta': 'V', 'nivel_dificuldade': 'lembrar'},
+        ])
+        response = await self.async_client.post(
+            reverse('async-gerar-prova'), self.dados, content_type='application/json', headers=self.headers,
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        prova = response.json()
+        self.assertEqual(len(prova['questoes']), 1)
+        mock_groq.assert_awaited_once()
+
+        response = await self.async_client.get(
+            reverse('async-detalhar-prova', kwargs={'id': prova['id']}), headers=self.headers,
+        )
+        self.assertEqual(response.json()['questoes'][0]['enunciado'], 'Enunciado')
+
+        response = await self.async_client.get(
+            reverse('async-detalhar-gabarito', kwargs={'prova__id': prova['id']}), headers=self.headers,
+        )
+        self.assertEqual(list(response.json()['respostas'].values()), ['V'])
+
+    async def test_dados_invalidos(self):
+        response = await self.async_client.post(
+            reverse('async-gerar-prova'), {'tema': ''}, content_type='application/json', headers=self.headers,
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PersistenciaTestCase(TestCase):
+    def criterios(self):
+        return CriteriosProva(tema='Teste', quantidade_questoes=1, tipos_questoes=TipoQuestao.VERDADEIRO_FALSO)
+
+    def questoes(self, n):
+        return [{'tipo': 'verdadeiro_falso', 'enunciado': f'Enunciado {i}', 'resposta': 'V'} for i in range(n)]
+
+    def test_consultas_nao_dependem_do_tamanho(self):
+        contagens = []
+        for n in (3, 30):
+            with CaptureQueriesContext(connection) as consultas:
+                criterios = self.criterios()
+                persistir_questoes(criterios, [], self.questoes(n))
+                dados = CriteriosProvaSerializer(criterios).data
+            contagens.append(len(consultas))
+            self.assertEqual(len(dados['questoes']), n)
+            self.assertEqual(len(criterios.gabarito.respostas), n)
+        self.assertEqual(contagens[0], contagens[1])
+
+    def test_falha_no_gabarito_desfaz_tudo(self):
+        with patch('provas.geracao.Gabarito.objects.create', side_effect=RuntimeError('falha')):
+            with self.assertRaises(RuntimeError):
+                persistir_questoes(self.criterios(), [], self.questoes(3))
+        self.assertEqual(CriteriosProva.objects.count(), 0)
+        self.assertEqual(Questao.objects.count(), 0)
+
+    def test_perfil_sqlite(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("Perfil do SQLite")
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+class CacheLeituraTestCase(CachesLimposMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.prova = CriteriosProva(tema='Teste', quantidade_questoes=1, tipos_questoes=TipoQuestao.VERDADEIRO_FALSO)
+        persistir_questoes(self.prova, [], [{'tipo': 'verdadeiro_falso', 'enunciado': 'Enunciado', 'resposta': 'V'}])
+        self.url = reverse('detalhar-prova', kwargs={'id': self.prova.id})
+
+    def test_etag_e_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['questoes'][0]['enunciado'], 'Enunciado')
+        self.assertIn('max-age', response['Cache-Control'])
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_gabarito_nunca_publico(self):
+        url = reverse('detalhar-gabarito', kwargs={'prova__id': self.prova.id})
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'private, max-age=60')
+        self.assertIn('Authorization', response['Vary'])
+        with override_settings(PROVAS_CACHE_LEITURA={**settings.PROVAS_CACHE_LEITURA,
+                                                     'CACHE_CONTROL': 'public, max-age=60, s-maxage=300'}):
+            self.assertEqual(self.client.get(url)['Cache-Control'], 'private, max-age=60')
+            self.assertEqual(self.client.get(self.url)['Cache-Control'], 'public, max-age=60, s-maxage=300')
+            etag = self.client.get(url)['ETag']
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['Cache-Control'], 'private, max-age=60')
+
+    def test_escrita_invalida(self):
+        url = reverse('detalhar-gabarito', kwargs={'prova__id': self.prova.id})
+        etag = self.client.get(url)['ETag']
+        gabarito = self.prova.gabarito
+        gabarito.respostas = {'1': 'F'}
+        gabarito.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = self.client.get(self.url)['ETag']
+        questao = Questao.objects.get()
+        questao.enunciado = 'Corrigido'
+        questao.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['questoes'][0]['enunciado'], 'Corrigido')
+
+    def test_prova_inexistente(self):
+        response = self.client.get(reverse('detalhar-prova', kwargs={'id': 999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SnapshotProvaTestCase(CachesLimposMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.prova = CriteriosProva(tema='Teste', quantidade_questoes=1, tipos_questoes=TipoQuestao.VERDADEIRO_FALSO)
+        persistir_questoes(self.prova, [], [{'tipo': 'verdadeiro_falso', 'enunciado': 'Enunciado', 'resposta': 'V'}])
+
+    def test_snapshot_criado_com_a_prova(self):
+        snapshot = SnapshotProva.objects.get(prova=self.prova)
+        self.assertEqual(snapshot.versao, snapshots.VERSAO)
+        self.assertEqual(json.loads(bytes(snapshot.prova_json))['questoes'][0]['enunciado'], 'Enunciado')
+        self.assertEqual(json.loads(bytes(snapshot.gabarito_json))['prova'], self.prova.id)
+
+    def test_leitura_usa_snapshot_sem_serializer(self):
+        with patch('provas.views.CriteriosProvaSerializer.to_representation') as to_representation:
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse('detalhar-prova', kwargs={'id': self.prova.id}))
+        to_representation.assert_not_called()
+        self.assertEqual(response.content, bytes(SnapshotProva.objects.get().prova_json))
+
+    def test_reconstruir_snapshots(self):
+        SnapshotProva.objects.update(versao=0, prova_json=b'{}')
+        call_command('reconstruir_snapshots', stdout=io.StringIO())
+        snapshot = SnapshotProva.objects.get()
+        self.assertEqual(snapshot.versao, snapshots.VERSAO)
+        self.assertNotEqual(bytes(snapshot.prova_json), b'{}')
+
+
+class ConsultasLeituraTestCase(CachesLimposMixin, TestCase):
+    # O número de consultas das leituras não pode crescer com o tamanho da prova
+    TAMANHOS = (1, 50, 500)
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_superuser(username='admin', password='testpassword')
+        self.api = APIClient()
+        self.api.force_authenticate(user=self.user)
+        self.client.force_login(self.user)
+
+    def criar_prova(self, n):
+        prova = CriteriosProva(tema=f'Prova {n}', quantidade_questoes=n, tipos_questoes=TipoQuestao.MULTIPLA_ESCOLHA,
+                               criado_por=self.user)
+        persistir_questoes(prova, [], [
+            {'tipo': 'multipla_escolha', 'enunciado': f'Enunciado {i}', 'opcoes': ['A', 'B'], 'resposta': 'A'}
+            for i in range(n)
+        ])
+        # Força o caminho pelos serializers (sem cache nem snapshot)
+        SnapshotProva.objects.filter(prova=prova).delete()
+        caches[settings.PROVAS_CACHE_LEITURA['ALIAS']].clear()
+        return prova
+
+    def test_detalhar_prova(self):
+        for n in self.TAMANHOS:
+            prova = self.criar_prova(n)
+            # snapshot + prova + questões
+            with self.assertNumQueries(3):
+                response = self.api.get(reverse('detalhar-prova', kwargs={'id': prova.id}))
+            self.assertEqual(len(response.json()['questoes']), n)
+
+    def test_detalhar_gabarito(self):
+        for n in self.TAMANHOS:
+            prova = self.criar_prova(n)
+            # snapshot + gabarito com a prova
+            with self.assertNumQueries(2):
+                response = self.api.get(reverse('detalhar-gabarito', kwargs={'prova__id': prova.id}))
+            self.assertEqual(len(response.json()['respostas']), n)
+
+    def test_admin(self):
+        paginas = [
+            reverse('admin:provas_criteriosprova_changelist'),
+            reverse('admin:provas_questao_changelist'),
+            reverse('admin:provas_gabarito_changelist'),
+            reverse('admin:provas_jobgeracao_changelist'),
+            reverse('admin:provas_lotegeracao_changelist'),
+        ]
+        # Cada listagem com 1 e com 11 linhas (provas com job e lote): o número de consultas é o mesmo
+        provas, contagens = [], {url: [] for url in paginas}
+        for linhas in (1, 11):
+            while len(provas) < linhas:
+                prova = self.criar_prova(self.TAMANHOS[len(provas) % len(self.TAMANHOS)])
+                lote = LoteGeracao.objects.create(total=1, criado_por=self.user)
+                JobGeracao.objects.create(prova=prova, lote=lote)
+                provas.append(prova)
+            for url in paginas:
+                self.client.get(url)  # aquece caches do admin (content types etc.)
+                with CaptureQueriesContext(connection) as consultas:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+                contagens[url].append(len(consultas))
+        for url, contagem in contagens.items():
+            self.assertEqual(contagem[0], contagem[1], url)
+
+        contagens = []
+        for prova in provas:
+            url = reverse('admin:provas_criteriosprova_change', args=[prova.id])
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as consultas:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            contagens.append(len(consultas))
+        self.assertEqual(len(set(contagens)), 1, contagens)
+
+
+
+class BuscaTextualTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('buscar-questoes')
+        prova = CriteriosProva(tema='Biologia', quantidade_questoes=3, tipos_questoes=TipoQuestao.MULTIPLA_ESCOLHA)
+        persistir_questoes(prova, [], [
+            {'tipo': 'multipla_escolha', 'enunciado': 'Qual a função da mitocôndria na célula?', 'opcoes': ['A', 'B'],
+             'resposta': 'A', 'nivel_dificuldade': 'lembrar'},
+            {'tipo': 'verdadeiro_falso', 'enunciado': 'As células vegetais possuem parede celular.', 'resposta': 'V',
+             'nivel_dificuldade': 'entender'},
+            {'tipo': 'dissertativa', 'enunciado': 'Explique a fotossíntese.', 'resposta': 'Texto'},
+        ])
+
+    def buscar(self, **parametros):
+        response = self.client.get(self.url, parametros)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_ignora_acentos_e_flexoes(self):
+        enunciados = [q['enunciado'] for q in self.buscar(q='celulas')['results']]
+        self.assertEqual(len(enunciados), 2)
+        self.assertEqual(len(self.buscar(q='FOTOSSINTESE')['results']), 1)
+        self.assertEqual(self.buscar(q='mitocondrias')['results'][0]['tipo'], 'multipla_escolha')
+
+    def test_filtros(self):
+        resultados = self.buscar(q='célula', tipo='verdadeiro_falso')['results']
+        self.assertEqual([q['tipo'] for q in resultados], ['verdadeiro_falso'])
+        self.assertEqual(len(self.buscar(q='célula', nivel_dificuldade='avaliar')['results']), 0)
+        response = self.client.get(self.url, {'q': 'célula', 'tipo': 'outro'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_paginacao_por_cursor(self):
+        Questao.objects.bulk_create(
+            Questao(tema='biologia', tipo='dissertativa', enunciado=f'Célula número {i}', resposta='x')
+            for i in range(30)
+        )
+        call_command('reindexar_busca', stdout=io.StringIO())
+        vistos = []
+        pagina = self.buscar(q='celula')
+        while True:
+            vistos += [q['id'] for q in pagina['results']]
+            if not pagina['next']:
+                break
+            pagina = self.client.get(pagina['next']).json()
+        self.assertEqual(len(vistos), 32)
+        self.assertEqual(len(set(vistos)), 32)
+
+    def test_indice_acompanha_alteracoes(self):
+        questao = Questao.objects.get(tipo='dissertativa')
+        questao.enunciado = 'Descreva a respiração celular.'
+        questao.save()
+        self.assertEqual(len(self.buscar(q='fotossintese')['results']), 0)
+        self.assertEqual(len(self.buscar(q='respiracao')['results']), 1)
+        questao.delete()
+        self.assertEqual(len(self.buscar(q='respiracao')['results']), 0)
+
+    def test_banco_sem_indice_filtra_sem_relevancia(self):
+        with patch.object(connection, 'vendor', 'mysql'):
+            self.assertEqual([q['enunciado'] for q in self.buscar(q='Parede')['results']],
+                             ['As células vegetais possuem parede celular.'])
+            self.assertEqual(len(self.buscar(q='parede', tipo='dissertativa')['results']), 0)
+            self.assertEqual([erro.id for erro in busca.verificar_banco(None)], ['provas.W001'])
+        self.assertEqual(busca.verificar_banco(None), [])
+
+    def test_consulta_e_cursor_invalidos(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {'q': 'celula', 'cursor': 'xyz'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(busca.termos('de a o'), [])
+
+
+class ListagensTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        agora = timezone.now()
+        CriteriosProva.objects.bulk_create(
+            CriteriosProva(tema='Biologia' if i % 2 else 'História', dificuldade='lembrar', quantidade_questoes=1,
+                           tipos_questoes='dissertativa', criado_em=agora - timedelta(days=i))
+            for i in range(25)
+        )
+        Questao.objects.bulk_create(
+            Questao(tema='biologia', tipo='verdadeiro_falso' if i % 3 else 'dissertativa', enunciado=f'Enunciado {i}',
+                    resposta='V', criado_em=agora - timedelta(days=i))
+            for i in range(25)
+        )
+
+    def percorrer(self, url, parametros=None):
+        vistos = []
+        response = self.client.get(url, parametros)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            dados = response.json()
+            vistos += dados['results']
+            if not dados['next']:
+                return vistos
+            response = self.client.get(dados['next'])
+
+    def test_provas_paginadas_por_cursor(self):
+        provas = self.percorrer(reverse('listar-provas'))
+        self.assertEqual(len(provas), 25)
+        self.assertEqual(len({p['id'] for p in provas}), 25)
+        datas = [p['criado_em'] for p in provas]
+        self.assertEqual(datas, sorted(datas, reverse=True))
+        self.assertNotIn('questoes', provas[0])
+
+        # Páginas seguintes não fazem COUNT nem OFFSET
+        primeira = self.client.get(reverse('listar-provas'))
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(primeira.json()['next'])
+        sql = consultas.captured_queries[-1]['sql']
+        self.assertNotIn('COUNT', sql)
+        self.assertNotIn('OFFSET', sql)
+
+    def test_filtros_de_provas(self):
+        self.assertEqual(len(self.percorrer(reverse('listar-provas'), {'tema': 'Biologia'})), 12)
+        self.assertEqual(len(self.percorrer(reverse('listar-provas'), {'tipo': 'multipla_escolha'})), 0)
+        desde = (timezone.now() - timedelta(days=4, hours=12)).isoformat()
+        self.assertEqual(len(self.percorrer(reverse('listar-provas'), {'criado_apos': desde})), 5)
+        response = self.client.get(reverse('listar-provas'), {'criado_apos': '2024-13-45'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filtros_de_questoes(self):
+        questoes = self.percorrer(reverse('listar-questoes'), {'tema': ' Biologia ', 'tipo': 'dissertativa'})
+        self.assertEqual(len(questoes), 9)
+        self.assertIn('criado_em', questoes[0])
+        self.assertEqual(len(self.percorrer(reverse('listar-questoes'), {'dificuldade': 'criar'})), 0)
+
+
+class PdfTestCase(CachesLimposMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        configuracao = override_settings(PROVAS_PDF={'DIRETORIO': diretorio.name, 'PRE_RENDERIZAR': True, 'WORKERS': 1,
+                                                     'X_ACCEL_REDIRECT': ''})
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.prova = CriteriosProva(tema='Ciências', quantidade_questoes=2, tipos_questoes=TipoQuestao.MULTIPLA_ESCOLHA)
+        persistir_questoes(self.prova, [], [
+            {'tipo': 'multipla_escolha', 'enunciado': 'Qual é a fórmula da água? <H2O>', 'opcoes': ['H2O', 'CO2'],
+             'resposta': 'A'},
+            {'tipo': 'dissertativa', 'enunciado': 'Explique a fotossíntese.', 'resposta': 'Texto'},
+        ])
+
+    def baixar(self, nome_url):
+        response = self.client.get(reverse(nome_url, kwargs={'id': self.prova.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        return b''.join(response.streaming_content)
+
+    def test_renderiza_e_guarda_em_disco(self):
+        self.assertTrue(self.baixar('pdf-prova').startswith(b'%PDF'))
+        self.assertTrue(os.path.exists(pdf.caminho('prova', self.prova.id)))
+        with patch('provas.pdf.renderizar') as renderizar, self.assertNumQueries(0):
+            self.assertTrue(self.baixar('pdf-prova').startswith(b'%PDF'))
+        renderizar.assert_not_called()
+        self.assertTrue(self.baixar('pdf-gabarito').startswith(b'%PDF'))
+
+    def test_pre_renderiza_apos_o_commit(self):
+        executor = SimpleNamespace(submit=lambda funcao, *args: funcao(*args))
+        with patch('provas.pdf.get_executor', return_value=executor), \
+                patch('provas.pdf.close_old_connections'), \
+                self.captureOnCommitCallbacks(execute=True):
+            prova = CriteriosProva(tema='Outra', quantidade_questoes=1, tipos_questoes=TipoQuestao.VERDADEIRO_FALSO)
+            persistir_questoes(prova, [], [{'tipo': 'verdadeiro_falso', 'enunciado': 'Enunciado', 'resposta': 'V'}])
+        self.assertTrue(os.path.exists(pdf.caminho('prova', prova.id)))
+        self.assertTrue(os.path.exists(pdf.caminho('gabarito', prova.id)))
+
+    def test_pool_separado_dos_jobs(self):
+        # Com todos os workers de geração ocupados, o PDF continua sendo gerado
+        from . import jobs
+
+        liberar = threading.Event()
+        self.addCleanup(liberar.set)
+        for _ in range(settings.GERACAO_JOBS['WORKERS']):
+            jobs.get_executor().submit(liberar.wait, 5)
+        renderizado = threading.Event()
+        with patch('provas.pdf.pre_renderizar', side_effect=lambda prova_id: renderizado.set()), \
+                self.captureOnCommitCallbacks(execute=True):
+            pdf.agendar(self.prova.id)
+        self.assertTrue(renderizado.wait(2))
+        self.assertIsNot(pdf.get_executor(), jobs.get_executor())
+
+    def test_alteracao_invalida_o_pdf(self):
+        self.baixar('pdf-prova')
+        questao = Questao.objects.get(tipo='dissertativa')
+        questao.enunciado = 'Corrigido'
+        questao.save()
+        self.assertFalse(os.path.exists(pdf.caminho('prova', self.prova.id)))
+
+    def test_x_accel_redirect(self):
+        with override_settings(PROVAS_PDF={**settings.PROVAS_PDF, 'X_ACCEL_REDIRECT': '/pdf-interno/'}):
+            response = self.client.get(reverse('pdf-gabarito', kwargs={'id': self.prova.id}))
+        self.assertEqual(response['X-Accel-Redirect'], f'/pdf-interno/gabarito-{self.prova.id}-v{pdf.VERSAO_LAYOUT}.pdf')
+        self.assertEqual(response.content, b'')
+
+    def test_prova_inexistente(self):
+        response = self.client.get(reverse('pdf-prova', kwargs={'id': 999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class VariantesTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.prova = CriteriosProva(tema='Ciências', quantidade_questoes=7, tipos_questoes=TipoQuestao.MULTIPLA_ESCOLHA)
+        questoes = [
+            {'tipo': 'multipla_escolha', 'enunciado': f'Questão {i}', 'opcoes': [f'{i}-a', f'{i}-b', f'{i}-c', f'{i}-d'],
+             'resposta': 'ABCD'[i % 4]}
+            for i in range(6)
+        ]
+        questoes.append({'tipo': 'verdadeiro_falso', 'enunciado': 'A água ferve a 100 °C ao nível do mar.', 'resposta': 'V'})
+        persistir_questoes(self.prova, [], questoes)
+        self.originais = {q.id: q for q in self.prova.questoes.all()}
+
+    def variantes(self, **parametros):
+        response = self.client.get(reverse('variantes-prova', kwargs={'id': self.prova.id}), parametros)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()['variantes']
+
+    def test_variantes_com_gabarito_remapeado(self):
+        lista = self.variantes(n=8, seed=42)
+        self.assertEqual(len(lista), 8)
+        for variante in lista:
+            self.assertEqual(list(variante['gabarito']), [str(q['id']) for q in variante['questoes']])
+            for questao in variante['questoes']:
+                original = self.originais[questao['id']]
+                resposta = variante['gabarito'][str(questao['id'])]
+                if original.tipo == TipoQuestao.MULTIPLA_ESCOLHA:
+                    self.assertCountEqual(questao['opcoes'], original.opcoes)
+                    # A letra nova aponta para a mesma opção que a letra original
+                    self.assertEqual(questao['opcoes'][pdf.LETRAS.index(resposta)],
+                                     original.opcoes[pdf.LETRAS.index(original.resposta)])
+                    self.assertEqual(questao['resposta'], resposta)
+                else:
+                    self.assertEqual(resposta, 'V')
+        self.assertGreater(len({tuple(q['id'] for q in v['questoes']) for v in lista}), 1)
+
+    def test_mesma_seed_mesmas_variantes(self):
+        lista = self.variantes(n=5, seed=7)
+        self.assertEqual(self.variantes(n=5, seed=7), lista)
+        self.assertEqual(self.variantes(n=2, seed=7), lista[:2])  # Independe de n
+        self.assertNotEqual(self.variantes(n=5, seed=8), lista)
+        self.assertEqual(self.variantes(n=3), self.variantes(n=3, seed=self.prova.id))
+        snapshots.invalidar(self.prova.id)  # Sem snapshot, as questões vêm do banco
+        self.assertEqual(self.variantes(n=5, seed=7), lista)
+
+    def test_parametros_invalidos(self):
+        url = reverse('variantes-prova', kwargs={'id': self.prova.id})
+        for parametros in ({'n': 0}, {'n': 1001}, {'n': 'dez'}, {'seed': -1}):
+            self.assertEqual(self.client.get(url, parametros).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('variantes-prova', kwargs={'id': self.prova.id + 100}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_resposta_pela_letra_ou_pelo_texto(self):
+        opcoes = ['H2O', 'CO2', 'O2']
+        self.assertEqual(variantes.indice_correto(opcoes, 'b)'), 1)
+        self.assertEqual(variantes.indice_correto(opcoes, 'C - O2'), 2)
+        self.assertEqual(variantes.indice_correto(opcoes, ' h2o '), 0)
+        self.assertIsNone(variantes.indice_correto(opcoes, 'D'))
+        self.assertIsNone(variantes.indice_correto(opcoes, 'A fórmula da água'))
+
+
+class ExportacaoTestCase(CachesLimposMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+
+    def baixar(self, **parametros):
+        response = self.client.get(reverse('exportar-provas'), parametros)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_conteudo_do_zip(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        prova = CriteriosProva(tema='Biologia', quantidade_questoes=1, tipos_questoes=TipoQuestao.VERDADEIRO_FALSO)
+        persistir_questoes(prova, [], [{'tipo': 'verdadeiro_falso', 'enunciado': 'Enunciado', 'resposta': 'V'}])
+        outra = CriteriosProva.objects.create(tema='História', quantidade_questoes=0, tipos_questoes='dissertativa')
+
+        with override_settings(PROVAS_PDF={**settings.PROVAS_PDF, 'DIRETORIO': diretorio.name}):
+            arquivo_zip = self.baixar(tema='Biologia')
+        self.assertEqual(sorted(arquivo_zip.namelist()), [
+            f'prova-{prova.id}/gabarito.json', f'prova-{prova.id}/gabarito.pdf',
+            f'prova-{prova.id}/prova.json', f'prova-{prova.id}/prova.pdf',
+        ])
+        self.assertEqual(json.loads(arquivo_zip.read(f'prova-{prova.id}/prova.json'))['questoes'][0]['enunciado'],
+                         'Enunciado')
+        self.assertTrue(arquivo_zip.read(f'prova-{prova.id}/prova.pdf').startswith(b'%PDF'))
+
+        # Sem snapshot, o JSON é serializado na hora
+        arquivo_zip = self.baixar(formatos='json', tema='História')
+        self.assertEqual(arquivo_zip.namelist(), [f'prova-{outra.id}/prova.json'])
+
+        response = self.client.get(reverse('exportar-provas'), {'formatos': 'docx'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_memoria_constante(self):
+        # 1.000 provas com ~10 KB de JSON cada: o pico de memória durante a exportação
+        # fica bem abaixo do tamanho do ZIP, que nunca é montado inteiro
+        provas = CriteriosProva.objects.bulk_create(
+            CriteriosProva(tema='Lote', quantidade_questoes=1, tipos_questoes='dissertativa') for _ in range(1000)
+        )
+        SnapshotProva.objects.bulk_create(
+            SnapshotProva(prova=prova, versao=snapshots.VERSAO,
+                          prova_json=json.dumps({'conteudo': os.urandom(5 * 1024).hex()}).encode())
+            for prova in provas
+        )
+        response = self.client.get(reverse('exportar-provas'), {'formatos': 'json'})
+        tracemalloc.start()
+        try:
+            tamanho = sum(len(parte) for parte in response.streaming_content)
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(tamanho, 5 * 1024 * 1024)
+        self.assertLess(pico, 4 * 1024 * 1024)
+
+
+@override_settings(GERACAO_JOBS={'BACKEND': 'sincrono', 'WORKERS': 1, 'MAX_LINHAS_LOTE': 10})
+class GerarLoteTestCase(CachesLimposMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('gerar-lote') + '?cache=false'
+
+    def enviar(self, corpo, content_type):
+        return self.client.generic('POST', self.url, corpo.encode(), content_type=content_type)
+
+    def test_jsonl_com_linhas_identicas(self):
+        linhas = [
+            {'tema': 'Biologia', 'quantidade_questoes': 2, 'tipos_questoes': 'dissertativa', 'dificuldade': 'lembrar'},
+            {'tema': ' biologia ', 'quantidade_questoes': 2, 'tipos_questoes': 'dissertativa', 'dificuldade': 'lembrar'},
+            {'tema': 'Química', 'quantidade_questoes': 1, 'tipos_questoes': 'dissertativa', 'dificuldade': 'lembrar'},
+        ]
+        llm_falso = LLMFalso()
+        with patch('provas.llm.client.chat.completions.create', side_effect=llm_falso):
+            response = self.enviar('\n'.join(json.dumps(linha) for linha in linhas) + '\n', 'application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(llm_falso.chamadas, 2)  # As duas primeiras linhas compartilham a geração
+
+        lote = self.client.get(response['Location']).json()
+        self.assertEqual(lote['total'], 3)
+        self.assertTrue(lote['concluido'])
+        self.assertEqual(lote['progresso']['concluido'], 3)
+        self.assertEqual([linha['linha'] for linha in lote['linhas']], [1, 2, 3])
+        self.assertEqual(lote['linhas'][1]['compartilha_com'], lote['linhas'][0]['job'])
+        primeira, segunda = (CriteriosProva.objects.get(id=lote['linhas'][i]['prova']) for i in (0, 1))
+        self.assertEqual(list(primeira.questoes_ordenadas()), list(segunda.questoes_ordenadas()))
+        self.assertEqual(len(segunda.gabarito.respostas), 2)
+        self.assertEqual(segunda.criado_por, self.user)
+
+    def test_csv(self):
+        corpo = ('tema,quantidade_questoes,tipos_questoes,dificuldade,curriculo\n'
+                 'Física,1,dissertativa,aplicar,\n'
+                 'História,1,dissertativa,lembrar,Ensino médio\n')
+        with patch('provas.llm.client.chat.completions.create', side_effect=LLMFalso()):
+            response = self.enviar(corpo, 'text/csv')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['progresso']['concluido'], 2)
+        self.assertEqual(CriteriosProva.objects.get(tema='História').curriculo, 'Ensino médio')
+
+    def test_falha_do_lider_chega_aos_seguidores(self):
+        linha = json.dumps({'tema': 'Artes', 'quantidade_questoes': 1, 'tipos_questoes': 'dissertativa',
+                            'dificuldade': 'lembrar'})
+        with patch('provas.llm.client.chat.completions.create', side_effect=RuntimeError('indisponível')):
+            response = self.enviar(f'{linha}\n{linha}\n', 'application/jsonl')
+        self.assertEqual(response.data['progresso']['falhou'], 2)
+        self.assertEqual({linha['erro'] for linha in response.data['linhas']}, {'indisponível'})
+
+    @patch('provas.llm.client.chat.completions.create')
+    def test_linha_invalida_rejeita_o_lote(self, mock_groq):
+        corpo = ('{"tema": "Biologia", "quantidade_questoes": 1, "tipos_questoes": "dissertativa", "dificuldade": "criar"}\n'
+                 '{"tema": "Química", "quantidade_questoes": "muitas", "tipos_questoes": "dissertativa"}\n')
+        response = self.enviar(corpo, 'application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([erro['linha'] for erro in response.data['linhas']], [2])
+        self.assertIn('quantidade_questoes', response.data['linhas'][0]['erros'])
+        self.assertEqual(CriteriosProva.objects.count(), 0)
+        mock_groq.assert_not_called()
+
+        response = self.enviar('{"tema": \n', 'application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        linhas = '\n'.join(['{"tema": "X", "quantidade_questoes": 1, "tipos_questoes": "dissertativa"}'] * 11)
+        response = self.enviar(linhas, 'application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MetricasTestCase(CachesLimposMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+
+    def resposta_com_uso(self):
+        resposta = resposta_groq([{'tipo': 'dissertativa', 'enunciado': 'Enunciado', 'resposta': 'R'}])
+        resposta.usage = SimpleNamespace(prompt_tokens=120, completion_tokens=45)
+        return resposta
+
+    @patch('provas.llm.client.chat.completions.create')
+    def test_server_timing_e_metricas(self, mock_groq):
+        mock_groq.return_value = self.resposta_com_uso()
+        tokens_antes = metricas.TOKENS_LLM.valor(tipo='completion')
+        llm_antes = metricas.FASES.total(fase='llm')
+
+        response = self.client.post(reverse('gerar-prova'), {
+            'tema': 'Métricas', 'dificuldade': 'lembrar', 'quantidade_questoes': 1, 'tipos_questoes': 'dissertativa',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        fases = dict(parte.split(';dur=') for parte in response['Server-Timing'].split(', '))
+        self.assertEqual(set(fases), {'llm', 'parse', 'persistir', 'renderizar', 'total'})
+        self.assertGreaterEqual(float(fases['total']), float(fases['llm']))
+        self.assertEqual(metricas.TOKENS_LLM.valor(tipo='completion'), tokens_antes + 45)
+        self.assertEqual(metricas.FASES.total(fase='llm'), llm_antes + 1)
+
+        prova_id = response.json()['id']
+        self.client.get(reverse('detalhar-prova', kwargs={'id': prova_id}))
+        self.client.get(reverse('detalhar-prova', kwargs={'id': prova_id}))
+        with override_settings(METRICAS={'TOKEN': 'segredo'}):
+            texto = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer segredo').content.decode()
+        self.assertIn('# TYPE provas_fase_segundos histogram', texto)
+        self.assertRegex(texto, r'provas_fase_segundos_count\{fase="llm"\} \d+')
+        self.assertRegex(texto, r'provas_cache_total\{cache="leitura",resultado="acerto"\} \d+')
+        self.assertIn('provas_requisicao_segundos_bucket{view="gerar-prova",metodo="POST",status="201",le="+Inf"}',
+                      texto)
+
+    def test_token_das_metricas(self):
+        with override_settings(METRICAS={'TOKEN': 'segredo'}):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer segred').status_code,
+                             status.HTTP_403_FORBIDDEN)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    @override_settings(METRICAS={'TOKEN': ''})
+    def test_metricas_sem_token_so_com_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_200_OK)
+
+    def test_resposta_invalida_vai_para_o_log(self):
+        resposta = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='não é JSON'))])
+        with self.assertLogs('provas.geracao', level='WARNING') as logs:
+            self.assertEqual(processar_resposta_groq(resposta, None), [])
+        self.assertIn('Erro ao processar a resposta do Groq', logs.output[0])
+
+
+@override_settings(GERACAO_CURRICULO={'METODO': 'extrativo', 'ORCAMENTO_TOKENS': 60})
+class CurriculoTestCase(CachesLimposMixin, TestCase):
+    CURRICULO = "\n".join(
+        ["Unidade 1: Citologia"]
+        + [f"A célula {i} possui membrana plasmática, citoplasma e núcleo com material genético." for i in range(30)]
+        + ["Unidade 2: Genética", "Leis de Mendel, dominância e herança ligada ao sexo."]
+        + ["Observação administrativa: as aulas ocorrem às terças."] * 5
+    )
+
+    def setUp(self):
+        super().setUp()
+        curriculo._memoria.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+
+    def criar_prova(self, texto):
+        return CriteriosProva.objects.create(tema='Biologia', dificuldade='lembrar', quantidade_questoes=1,
+                                             tipos_questoes='dissertativa', curriculo=texto, criado_por=self.user)
+
+    def test_resumo_respeita_o_orcamento(self):
+        texto = curriculo.para_prompt(self.criar_prova(self.CURRICULO))
+        self.assertLessEqual(curriculo.estimar_tokens(texto), 60)
+        self.assertTrue(texto.startswith('- '))
+        self.assertIn('célula', texto)
+
+    def test_documento_reaproveitado(self):
+        primeiro = curriculo.para_prompt(self.criar_prova(self.CURRICULO))
+        curriculo._memoria.clear()
+        with patch('provas.curriculo.resumir') as mock_resumir:
+            # Mesmo conteúdo com espaços diferentes: mesmo documento, sem novo resumo
+            segundo = curriculo.para_prompt(self.criar_prova("  " + self.CURRICULO.replace(' ', '  ')))
+        mock_resumir.assert_not_called()
+        self.assertEqual(primeiro, segundo)
+        self.assertEqual(DocumentoCurriculo.objects.count(), 1)
+
+    def test_curriculo_curto_vai_inteiro(self):
+        antes = metricas.CURRICULO_TOKENS_ECONOMIZADOS.valor()
+        self.assertEqual(curriculo.para_prompt(self.criar_prova("Citologia e genética")), "Citologia e genética")
+        self.assertEqual(DocumentoCurriculo.objects.count(), 0)
+        self.assertEqual(metricas.CURRICULO_TOKENS_ECONOMIZADOS.valor(), antes)
+
+    @patch('provas.llm.client.chat.completions.create')
+    def test_prompt_usa_o_resumo_e_conta_a_economia(self, mock_groq):
+        mock_groq.return_value = resposta_groq([{'tipo': 'dissertativa', 'enunciado': 'Enunciado', 'resposta': 'R'}])
+        antes = metricas.CURRICULO_TOKENS_ECONOMIZADOS.valor()
+        gerar_questoes(self.criar_prova(self.CURRICULO), usar_cache=False)
+        prompt = mock_groq.call_args.kwargs['messages'][0]['content']
+        self.assertNotIn('administrativa', prompt)
+        self.assertIn('Unidade 1: Citologia', prompt)
+        documento = DocumentoCurriculo.objects.get()
+        self.assertEqual(metricas.CURRICULO_TOKENS_ECONOMIZADOS.valor(),
+                         antes + documento.tokens_texto - documento.tokens_resumo)
+
+    @patch('provas.llm.client.chat.completions.create', side_effect=Exception("indisponível"))
+    def test_resumo_por_llm_cai_no_extrativo(self, mock_groq):
+        with override_settings(GERACAO_CURRICULO={'METODO': 'llm', 'ORCAMENTO_TOKENS': 60}), \
+                self.assertLogs('provas.curriculo', level='WARNING'):
+            texto = curriculo.para_prompt(self.criar_prova(self.CURRICULO))
+        self.assertTrue(texto.startswith('- '))
+        self.assertEqual(DocumentoCurriculo.objects.get().metodo, 'extrativo')
+
+
+def limites_llm(**valores):
+    return override_settings(LLM_LIMITES={**settings.LLM_LIMITES, 'BACKEND': 'memoria', **valores})
+
+
+def completion_groq(conteudo, tokens=10):
+    from groq.types.chat import ChatCompletion
+
+    return ChatCompletion.model_validate({
+        'id': 'c', 'object': 'chat.completion', 'created': 0, 'model': 'm',
+        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': conteudo}}],
+        'usage': {'prompt_tokens': tokens, 'completion_tokens': tokens, 'total_tokens': 2 * tokens},
+    })
+
+
+class GovernadorTestCase(CachesLimposMixin, TestCase):
+    mensagens = [{'role': 'user', 'content': 'Gere 1 questões'}]
+
+    def chamar_em_paralelo(self, quantidade, funcao, mensagens=None):
+        resultados = [None] * quantidade
+
+        def chamar(i):
+            resultados[i] = governador.obter().chamar(
+                funcao, {'model': 'm', 'messages': mensagens(i) if mensagens else self.mensagens})
+
+        threads = [threading.Thread(target=chamar, args=(i,)) for i in range(quantidade)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return resultados
+
+    @limites_llm(REQUISICOES_POR_MINUTO=2, ESPERA_MAXIMA=1)
+    def test_balde_de_requisicoes(self):
+        for _ in range(2):
+            governador.obter().chamar(lambda **k: 'ok', {'model': 'm', 'messages': self.mensagens})
+        with self.assertRaises(governador.LimiteLLMExcedido) as erro:
+            governador.obter().chamar(lambda **k: 'ok', {'model': 'm', 'messages': self.mensagens})
+        self.assertEqual(erro.exception.wait, 30)  # Uma ficha a cada 30 s
+
+    @limites_llm(TOKENS_POR_MINUTO=1000, TOKENS_RESPOSTA_ESTIMADOS=400)
+    def test_balde_de_tokens_acertado_pelo_uso(self):
+        governador.obter().chamar(lambda **k: completion_groq('{}', tokens=50),
+                                  {'model': 'm', 'messages': self.mensagens})
+        with governador.obter().estado.transacao() as dados:
+            # 404 tokens estimados, 100 usados: a diferença volta ao balde
+            self.assertAlmostEqual(dados['baldes']['tokens']['nivel'], 900, delta=1)
+
+    @limites_llm(MAX_EM_VOO=2)
+    def test_limite_de_chamadas_em_andamento(self):
+        em_andamento, maximo = [0], [0]
+        lock = threading.Lock()
+        espera_antes = metricas.ESPERA_LLM.total()
+
+        def lenta(**kwargs):
+            with lock:
+                em_andamento[0] += 1
+                maximo[0] = max(maximo[0], em_andamento[0])
+            time.sleep(0.05)
+            with lock:
+                em_andamento[0] -= 1
+            return 'ok'
+
+        self.chamar_em_paralelo(6, lenta, mensagens=lambda i: [{'role': 'user', 'content': str(i)}])
+        self.assertEqual(maximo[0], 2)
+        self.assertEqual(metricas.ESPERA_LLM.total(), espera_antes + 6)
+
+    @limites_llm()
+    def test_chamadas_identicas_coalescidas(self):
+        chamadas = []
+
+        def lenta(**kwargs):
+            chamadas.append(kwargs)
+            time.sleep(0.2)
+            return object()
+
+        antes = metricas.LLM_COALESCIDAS.valor()
+        resultados = self.chamar_em_paralelo(4, lenta)
+        self.assertEqual(len(chamadas), 1)
+        self.assertEqual(len({id(r) for r in resultados}), 1)
+        self.assertEqual(metricas.LLM_COALESCIDAS.valor(), antes + 3)
+
+    def test_coalescencia_entre_workers(self):
+        # Dois governadores com o mesmo diretório fazem o papel de dois workers
+        with tempfile.TemporaryDirectory() as diretorio:
+            config = {**settings.LLM_LIMITES, 'BACKEND': 'arquivo', 'DIRETORIO': diretorio}
+            workers = [governador.Governador(config), governador.Governador(config)]
+            chamadas = []
+
+            def lenta(**kwargs):
+                chamadas.append(kwargs)
+                time.sleep(0.3)
+                return completion_groq('{"questoes": []}')
+
+            resultados = [None, None]
+
+            def chamar(i):
+                resultados[i] = workers[i].chamar(lenta, {'model': 'm', 'messages': self.mensagens})
+
+            threads = [threading.Thread(target=chamar, args=(i,)) for i in range(2)]
+            threads[0].start()
+            time.sleep(0.1)
+            threads[1].start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(chamadas), 1)
+        self.assertEqual(resultados[1].choices[0].message.content, '{"questoes": []}')
+
+    def test_estado_em_arquivo_nao_trava_o_event_loop(self):
+        with tempfile.TemporaryDirectory() as diretorio:
+            config = {**settings.LLM_LIMITES, 'BACKEND': 'arquivo', 'DIRETORIO': diretorio}
+            worker = governador.Governador(config)
+            travado = threading.Event()
+
+            def segurar_estado():
+                # Outro worker segura o estado por 0,3 s
+                with worker.estado.transacao():
+                    travado.set()
+                    time.sleep(0.3)
+
+            async def resposta(**kwargs):
+                return completion_groq('{}')
+
+            async def cenario():
+                ticks = 0
+
+                async def contar():
+                    nonlocal ticks
+                    while True:
+                        await asyncio.sleep(0.01)
+                        ticks += 1
+
+                contador = asyncio.create_task(contar())
+                resultado = await worker.achamar(resposta, {'model': 'm', 'messages': self.mensagens})
+                contador.cancel()
+                return resultado, ticks
+
+            thread = threading.Thread(target=segurar_estado)
+            thread.start()
+            travado.wait()
+            resultado, ticks = asyncio.run(cenario())
+            thread.join()
+            self.assertEqual(resultado.choices[0].message.content, '{}')
+            self.assertGreater(ticks, 10)  # O loop seguiu rodando enquanto a chamada esperava o lock
+            with worker.estado.transacao() as dados:
+                self.assertEqual(dados['em_voo'], {})
+                self.assertEqual(dados['voos'], {})
+
+    def test_cancelamento_devolve_a_vaga_reservada_na_thread(self):
+        with tempfile.TemporaryDirectory() as diretorio:
+            config = {**settings.LLM_LIMITES, 'BACKEND': 'arquivo', 'DIRETORIO': diretorio}
+            worker = governador.Governador(config)
+            travado = threading.Event()
+
+            def segurar_estado():
+                with worker.estado.transacao():
+                    travado.set()
+                    time.sleep(0.2)
+
+            async def cenario():
+                tarefa = asyncio.create_task(worker.aentrar(10))
+                await asyncio.sleep(0.05)
+                tarefa.cancel()  # Enquanto a thread ainda espera o lock
+                with self.assertRaises(asyncio.CancelledError):
+                    await tarefa
+                await asyncio.sleep(0.4)  # A thread entra e a vaga é devolvida
+
+            thread = threading.Thread(target=segurar_estado)
+            thread.start()
+            travado.wait()
+            asyncio.run(cenario())
+            thread.join()
+            with worker.estado.transacao() as dados:
+                self.assertEqual(dados['em_voo'], {})
+
+    @limites_llm()
+    def test_lotes_iguais_nao_sao_coalescidos(self):
+        # Dois lotes de 2 com o mesmo prompt: precisam de duas chamadas, não de uma coalescida
+        with patch('provas.llm.client.chat.completions.create', side_effect=LLMFalso()) as mock_groq, \
+                override_settings(GERACAO_LOTES={**settings.GERACAO_LOTES, 'TAMANHO': 2}):
+            criterios = CriteriosProva(tema='Lotes', dificuldade='lembrar', quantidade_questoes=4,
+                                       tipos_questoes='dissertativa',
+                                       criado_por=User.objects.create_user(username='u', password='p'))
+            gerar_questoes(criterios, usar_cache=False)
+        prompts = [chamada.kwargs['messages'][0]['content'] for chamada in mock_groq.call_args_list]
+        self.assertEqual(len(prompts), 2)
+        self.assertEqual(prompts[0], prompts[1])
+        self.assertEqual(criterios.questoes.count(), 4)
+
+    @limites_llm(REQUISICOES_POR_MINUTO=1, ESPERA_MAXIMA=0)
+    @patch('provas.llm.client.chat.completions.create')
+    def test_limite_vira_503(self, mock_groq):
+        mock_groq.return_value = resposta_groq([{'tipo': 'dissertativa', 'enunciado': 'E', 'resposta': 'R'}])
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='u', password='p'))
+        dados = {'tema': 'Limite', 'dificuldade': 'lembrar', 'quantidade_questoes': 1, 'tipos_questoes': 'dissertativa'}
+        self.assertEqual(client.post(reverse('gerar-prova') + '?cache=false', dados, format='json').status_code, 201)
+        response = client.post(reverse('gerar-prova') + '?cache=false', dados, format='json')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(CriteriosProva.objects.count(), 1)
+
+
+def transporte_llm(**valores):
+    return override_settings(LLM_TRANSPORTE={**settings.LLM_TRANSPORTE, 'RECUO_BASE': 0.01, **valores})
+
+
+class GroqFalsoMixin:
+    # Chamadas reais pelo SDK do Groq contra o Groq falso local (benchmarks.groq_falso)
+    def groq_falso(self, **opcoes):
+        configuracao = groq_falso.Configuracao(**{'latencia_ms': 0, 'tokens_por_segundo': 1e6, **opcoes})
+        servidor = groq_falso.iniciar_em_thread(configuracao)
+        self.addCleanup(servidor.server_close)
+        self.addCleanup(servidor.shutdown)
+        url = groq_falso.url_base(servidor)
+        cliente = transporte.criar_cliente(settings.LLM_TRANSPORTE, api_key='x', base_url=url)
+        self.addCleanup(cliente.close)
+        for nome, valor in (('client', cliente),
+                            ('async_client', transporte.criar_cliente_async(settings.LLM_TRANSPORTE, api_key='x',
+                                                                            base_url=url))):
+            patcher = patch.object(llm, nome, valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return configuracao
+
+
+@limites_llm()
+class TransporteTestCase(GroqFalsoMixin, CachesLimposMixin, TestCase):
+    # O Groq falso injeta erros e travamentos
+    mensagens = [{'role': 'user', 'content': "Gere 1 questões sobre o tema 'Transporte'"}]
+
+    def criar(self):
+        return llm.criar(model='m', messages=self.mensagens)
+
+    @transporte_llm()
+    def test_novas_tentativas_em_5xx_e_429(self):
+        configuracao = self.groq_falso(roteiro=[500, 429, 'ok'], retry_after=0)
+        antes = metricas.LLM_NOVAS_TENTATIVAS.valor(motivo='500')
+        with self.assertLogs('provas', level='INFO'):
+            self.assertIn('questoes', self.criar().choices[0].message.content)
+        self.assertEqual(configuracao.chamadas, 3)
+        self.assertEqual(configuracao.conexoes, 1)  # Keep-alive: as tentativas reusam a conexão
+        self.assertEqual(metricas.LLM_NOVAS_TENTATIVAS.valor(motivo='500'), antes + 1)
+
+    @transporte_llm()
+    def test_retry_after_respeitado(self):
+        configuracao = self.groq_falso(roteiro=[503], retry_after=1)
+        inicio = time.monotonic()
+        with self.assertLogs('provas.transporte', level='INFO'):
+            self.criar()
+        self.assertGreaterEqual(time.monotonic() - inicio, 1)
+        self.assertEqual(configuracao.chamadas, 2)
+
+    @transporte_llm(TIMEOUT_LEITURA=0.3)
+    def test_travamento_estoura_timeout_de_leitura(self):
+        configuracao = self.groq_falso(roteiro=['travar', 'ok'], travamento_ms=3000)
+        antes = metricas.LLM_NOVAS_TENTATIVAS.valor(motivo='timeout')
+        inicio = time.monotonic()
+        with self.assertLogs('provas.transporte', level='INFO'):
+            self.criar()
+        self.assertLess(time.monotonic() - inicio, 2)
+        self.assertEqual(configuracao.travamentos, 1)
+        self.assertEqual(metricas.LLM_NOVAS_TENTATIVAS.valor(motivo='timeout'), antes + 1)
+
+    @transporte_llm(TENTATIVAS=1, DISJUNTOR_FALHAS=2, DISJUNTOR_PAUSA=0.3)
+    def test_disjuntor_abre_falha_rapido_e_fecha(self):
+        import groq
+
+        configuracao = self.groq_falso(taxa_erro=1.0)
+        with self.assertRaises(transporte.LLMIndisponivel) as erro, self.assertLogs('provas.transporte', level='WARNING'):
+            self.criar()
+        self.assertIsInstance(erro.exception.__cause__, groq.InternalServerError)
+        with self.assertRaises(transporte.LLMIndisponivel), self.assertLogs('provas.transporte', level='WARNING'):
+            self.criar()  # Segunda falha seguida: abre
+        with self.assertRaises(transporte.LLMIndisponivel):
+            self.criar()  # Aberto: nem chega ao provedor
+        self.assertEqual(configuracao.chamadas, 2)
+
+        configuracao.taxa_erro = 0.0
+        time.sleep(0.35)
+        self.criar()  # Chamada de teste bem-sucedida fecha o disjuntor
+        self.assertFalse(transporte.obter().disjuntor.aberto)
+        self.assertEqual(configuracao.chamadas, 3)
+
+    @transporte_llm(TENTATIVAS=2)
+    def test_tentativas_esgotadas_viram_respostas_da_api(self):
+        import groq
+
+        self.groq_falso(roteiro=[429, 429], retry_after=0)
+        with self.assertRaises(governador.LimiteLLMExcedido) as erro, self.assertLogs('provas', level='INFO'):
+            self.criar()
+        self.assertIsInstance(erro.exception.__cause__, groq.RateLimitError)
+
+        self.groq_falso(taxa_erro=1.0, status_erro=400)
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='u', password='p'))
+        dados = {'tema': 'Recusado', 'dificuldade': 'lembrar', 'quantidade_questoes': 1,
+                 'tipos_questoes': 'dissertativa'}
+        with self.assertLogs('provas', level='WARNING'):
+            response = client.post(reverse('gerar-prova') + '?cache=false', dados, format='json')
+        self.assertEqual(response.status_code, status.HTTP_502_BAD_GATEWAY)
+        self.assertEqual(response.json()['detail'], transporte.LLMRecusou.default_detail)
+
+    @transporte_llm(DISJUNTOR_PAUSA=30)
+    def test_disjuntor_aberto_vira_503(self):
+        transporte.obter().disjuntor.aberto_ate = time.monotonic() + 30
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='u', password='p'))
+        dados = {'tema': 'Fora do ar', 'dificuldade': 'lembrar', 'quantidade_questoes': 1,
+                 'tipos_questoes': 'dissertativa'}
+        with patch('provas.llm.client.chat.completions.create') as mock_groq:
+            response = client.post(reverse('gerar-prova') + '?cache=false', dados, format='json')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '30')
+        mock_groq.assert_not_called()
+
+
+def roteamento_llm(modelos, **valores):
+    return override_settings(LLM_ROTEAMENTO={**settings.LLM_ROTEAMENTO, 'MODELOS': modelos, **valores})
+
+
+@limites_llm()
+class RoteamentoTestCase(GroqFalsoMixin, CachesLimposMixin, TestCase):
+    mensagens = [{'role': 'user', 'content': "Gere 2 questões sobre o tema 'Roteamento'"}]
+
+    @roteamento_llm([{'nome': 'pequeno', 'max_questoes': 5, 'tipos': ['multipla_escolha', 'verdadeiro_falso']},
+                     'grande', 'reserva'])
+    def test_candidatos_por_quantidade_tipos_e_latencia(self):
+        roteador = roteamento.obter()
+        self.assertEqual(roteador.candidatos(3, ['multipla_escolha']), ['pequeno', 'grande', 'reserva'])
+        self.assertEqual(roteador.candidatos(10, ['multipla_escolha']), ['grande', 'reserva'])
+        self.assertEqual(roteador.candidatos(3, ['dissertativa']), ['grande', 'reserva'])
+        roteador.registrar('grande', 10, 20.0)
+        roteador.registrar('reserva', 10, 5.0)
+        self.assertEqual(roteador.candidatos(10, ['dissertativa']), ['reserva', 'grande'])
+        roteador.registrar('reserva', 10, 100.0, erro=True)  # Falha pesa como lentidão
+        self.assertEqual(roteador.candidatos(10, ['dissertativa']), ['grande', 'reserva'])
+        self.assertEqual(roteador.chave_modelos(), 'pequeno,grande,reserva')
+
+    @roteamento_llm(['a', 'b'], HEDGE_INICIAL=2, HEDGE_MINIMO=0.3, PERCENTIL_HEDGE=90)
+    def test_limiar_do_hedge_adaptativo(self):
+        roteador = roteamento.obter()
+        self.assertEqual(roteador.limiar_hedge('a'), 2)
+        for i in range(1, roteamento.MIN_AMOSTRAS + 1):
+            roteador.registrar('a', 1, 1.0, primeiro_token=i / 10)
+        self.assertAlmostEqual(roteador.limiar_hedge('a'), 1.8)  # p90 de 0.1 a 2.0
+        for _ in range(roteamento.JANELA_AMOSTRAS):
+            roteador.registrar('a', 1, 1.0, primeiro_token=0.01)
+        self.assertEqual(roteador.limiar_hedge('a'), 0.3)  # Nunca abaixo do mínimo
+
+    @roteamento_llm(['lento', 'rapido'], HEDGE_INICIAL=0.2)
+    def test_hedge_no_secundario(self):
+        self.groq_falso(latencia_por_modelo={'lento': 1500})
+        antes = metricas.LLM_HEDGES.valor(vencedor='secundario')
+        inicio = time.monotonic()
+        with self.assertLogs('provas.roteamento', level='INFO'):
+            resposta = roteamento.criar(2, ['dissertativa'], messages=self.mensagens)
+        self.assertLess(time.monotonic() - inicio, 1)
+        self.assertEqual(resposta.model, 'rapido')
+        self.assertEqual(len(json.loads(resposta.choices[0].message.content)['questoes']), 2)
+        self.assertIsNotNone(resposta.usage)
+        self.assertEqual(metricas.LLM_HEDGES.valor(vencedor='secundario'), antes + 1)
+        # O perdedor cancelado antes do primeiro token só conta como piso da duração
+        lento = roteamento.obter().por_nome['lento']
+        self.assertEqual(list(lento.amostras_primeiro_token), [])
+        self.assertIsNone(lento.primeiro_token)
+        self.assertIsNotNone(lento.segundos_por_questao)
+        # O secundário mediu melhor e passa a ser o primário
+        self.assertEqual(roteamento.obter().candidatos(2, ['dissertativa']), ['rapido', 'lento'])
+
+    @roteamento_llm(['lento', 'rapido'], HEDGE_INICIAL=0.2)
+    def test_hedge_assincrono_cancela_o_perdedor(self):
+        self.groq_falso(latencia_por_modelo={'lento': 1500})
+        inicio = time.monotonic()
+        with self.assertLogs('provas.roteamento', level='INFO'):
+            resposta = asyncio.run(roteamento.acriar(2, ['dissertativa'], messages=self.mensagens))
+        self.assertLess(time.monotonic() - inicio, 1)
+        self.assertEqual(resposta.model, 'rapido')
+        with governador.obter().estado.transacao() as dados:
+            self.assertEqual(dados['em_voo'], {})  # O perdedor devolveu a vaga ao ser cancelado
+        self.assertEqual(list(roteamento.obter().por_nome['lento'].amostras_primeiro_token), [])
+
+    @roteamento_llm(['instavel', 'reserva'], HEDGE_INICIAL=5)
+    @transporte_llm(TENTATIVAS=1)
+    def test_falha_do_primario_vai_direto_ao_secundario(self):
+        self.groq_falso(roteiro=[500])
+        inicio = time.monotonic()
+        with self.assertLogs('provas', level='INFO'):
+            resposta = roteamento.criar(2, ['dissertativa'], messages=self.mensagens)
+        self.assertLess(time.monotonic() - inicio, 2)  # Sem esperar o limiar do hedge
+        self.assertEqual(resposta.model, 'reserva')
+
+    @roteamento_llm(['unico'])
+    @patch('provas.llm.client.chat.completions.create', side_effect=LLMFalso())
+    def test_modelo_unico_sem_streaming(self, mock_groq):
+        roteamento.criar(2, ['dissertativa'], messages=self.mensagens)
+        self.assertEqual(mock_groq.call_args.kwargs['model'], 'unico')
+        self.assertNotIn('stream', mock_groq.call_args.kwargs)
@@ -0,0 +1,303 @@
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import groq
+import httpx
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from . import metricas
+from .governador import ESPERA_429_PADRAO, LimiteLLMExcedido
+
+logger = logging.getLogger(__name__)
+
+# Transporte HTTP das chamadas à LLM (LLM_TRANSPORTE):
+#
+# *   os clientes do Groq usam um pool de conexões keep-alive próprio, com timeouts de
+#     conexão e de leitura: uma conexão travada no provedor não prende o worker para sempre;
+# *   429, 5xx, timeouts e falhas de conexão são repetidos com recuo exponencial e jitter,
+#     respeitando o Retry-After do provedor (as novas tentativas automáticas do SDK ficam desligadas);
+# *   um disjuntor, por processo, abre depois de DISJUNTOR_FALHAS falhas seguidas do provedor
+#     (5xx, timeout, conexão) e, por DISJUNTOR_PAUSA segundos, as chamadas falham na hora com 503.
+#     Passada a pausa, uma única chamada de teste decide se ele fecha ou abre de novo;
+# *   esgotadas as tentativas, 429 vira LimiteLLMExcedido, falhas do provedor LLMIndisponivel
+#     (ambos 503 com Retry-After) e as demais recusas LLMRecusou (502).
+#
+# As tentativas envolvem o governador: cada uma volta à fila e respeita os limites dele.
+
+STATUS_REPETIVEIS = {408, 409, 429, 500, 502, 503, 504}
+
+_abandono = contextvars.ContextVar('provas_llm_abandono', default=None)
+
+
+class LLMIndisponivel(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "O provedor da LLM está indisponível. Tente novamente em instantes."
+    default_code = 'llm_indisponivel'
+
+    def __init__(self, espera):
+        super().__init__()
+        self.wait = max(1, round(espera))
+
+
+class LLMRecusou(APIException):
+    status_code = status.HTTP_502_BAD_GATEWAY
+    default_detail = "O provedor da LLM recusou o pedido."
+    default_code = 'llm_recusou'
+
+
+@contextmanager
+def abandonavel(evento):
+    # Dentro do bloco, não há novas tentativas depois que `evento` for marcado
+    # (ex.: a chamada perdeu um hedge em provas.roteamento e o resultado não importa mais)
+    token = _abandono.set(evento)
+    try:
+        yield
+    finally:
+        _abandono.reset(token)
+
+
+# --- Clientes ---
+
+def limites_pool(config):
+    return httpx.Limits(
+        max_connections=config['MAX_CONEXOES'],
+        max_keepalive_connections=config['MAX_CONEXOES_OCIOSAS'],
+        keepalive_expiry=config['KEEPALIVE'],
+    )
+
+
+def timeout(config):
+    # Leitura: tempo máximo entre dois pedaços da resposta, não da resposta inteira
+    return httpx.Timeout(config['TIMEOUT_LEITURA'], connect=config['TIMEOUT_CONEXAO'])
+
+
+def criar_cliente(config, api_key=None, base_url=None):
+    return groq.Groq(
+        api_key=api_key, base_url=base_url, timeout=timeout(config), max_retries=0,
+        http_client=groq.DefaultHttpxClient(limits=limites_pool(config), timeout=timeout(config)),
+    )
+
+
+def criar_cliente_async(config, api_key=None, base_url=None):
+    return groq.AsyncGroq(
+        api_key=api_key, base_url=base_url, timeout=timeout(config), max_retries=0,
+        http_client=groq.DefaultAsyncHttpxClient(limits=limites_pool(config), timeout=timeout(config)),
+    )
+
+
+# --- Classificação dos erros ---
+
+def falha_do_provedor(erro):
+    # Conta para o disjuntor: o provedor não respondeu ou respondeu com erro dele
+    if isinstance(erro, groq.APIConnectionError):  # Inclui APITimeoutError
+        return True
+    return isinstance(erro, groq.APIStatusError) and erro.status_code >= 500
+
+
+def repetivel(erro):
+    if isinstance(erro, groq.APIConnectionError):
+        return True
+    return isinstance(erro, groq.APIStatusError) and erro.status_code in STATUS_REPETIVEIS
+
+
+def motivo(erro):
+    if isinstance(erro, groq.APITimeoutError):
+        return 'timeout'
+    if isinstance(erro, groq.APIConnectionError):
+        return 'conexao'
+    return str(erro.status_code)
+
+
+def retry_after(erro):
+    try:
+        return max(0.0, float(erro.response.headers.get('retry-after')))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+# --- Disjuntor ---
+
+class Disjuntor:
+    def __init__(self, falhas, pausa):
+        self.limite_falhas = falhas
+        self.pausa = pausa
+        self.lock = threading.Lock()
+        self.falhas = 0
+        self.aberto_ate = None  # None: fechado
+        self.testando = False
+
+    def permitir(self):
+        # True se esta chamada é a de teste; estoura LLMIndisponivel enquanto estiver aberto
+        if not self.limite_falhas:
+            return False
+        with self.lock:
+            if self.aberto_ate is None:
+                return False
+            restante = self.aberto_ate - time.monotonic()
+            if restante > 0 or self.testando:
+                raise LLMIndisponivel(max(restante, 1))
+            self.testando = True
+            return True
+
+    def fim_do_teste(self):
+        # A chamada de teste terminou sem chegar ao provedor (ex.: fila do governador)
+        with self.lock:
+            self.testando = False
+
+    def sucesso(self):
+        with self.lock:
+            self.falhas = 0
+            self.aberto_ate = None
+            self.testando = False
+
+    def falha(self):
+        if not self.limite_falhas:
+            return
+        with self.lock:
+            self.falhas += 1
+            if self.testando or self.falhas >= self.limite_falhas:
+                if self.aberto_ate is None:
+                    logger.warning("Disjuntor da LLM aberto após %s falhas seguidas", self.falhas)
+                    metricas.DISJUNTOR_ABERTURAS.inc()
+                self.aberto_ate = time.monotonic() + self.pausa
+                self.testando = False
+
+    @property
+    def aberto(self):
+        return self.aberto_ate is not None
+
+
+# --- Transporte ---
+
+class Transporte:
+    def __init__(self, config):
+        self.tentativas = max(1, config['TENTATIVAS'])
+        self.recuo_base = config['RECUO_BASE']
+        self.recuo_maximo = config['RECUO_MAXIMO']
+        self.disjuntor = Disjuntor(config['DISJUNTOR_FALHAS'], config['DISJUNTOR_PAUSA'])
+
+    # Uma chamada ao provedor (dentro do governador): alimenta o disjuntor
+
+    def enviar(self, funcao, kwargs):
+        try:
+            resultado = funcao(**kwargs)
+        except Exception as e:
+            self.registrar_erro(e)
+            raise
+        self.disjuntor.sucesso()
+        return resultado
+
+    async def aenviar(self, funcao, kwargs):
+        try:
+            resultado = await funcao(**kwargs)
+        except Exception as e:
+            self.registrar_erro(e)
+            raise
+        self.disjuntor.sucesso()
+        return resultado
+
+    def registrar_erro(self, erro):
+        if falha_do_provedor(erro):
+            self.disjuntor.falha()
+        elif isinstance(erro, groq.APIStatusError):
+            self.disjuntor.sucesso()  # 4xx: o provedor está de pé
+
+    # O pedido inteiro: novas tentativas com recuo
+
+    def espera(self, erro, tentativa):
+        # Segundos até a próxima tentativa, ou None se não vale repetir
+        if tentativa >= self.tentativas or not repetivel(erro) or self.disjuntor.aberto:
+            return None
+        abandono = _abandono.get()
+        if abandono is not None and abandono.is_set():
+            return None
+        pedida = retry_after(erro)
+        if pedida is not None:
+            # O provedor disse quanto esperar; acima do recuo máximo, desiste em vez de prender o worker
+            return pedida + random.uniform(0, self.recuo_base) if pedida <= self.recuo_maximo else None
+        # Jitter completo: tentativas simultâneas de vários workers não voltam juntas
+        return random.uniform(0, min(self.recuo_maximo, self.recuo_base * 2 ** (tentativa - 1)))
+
+    def chamar(self, tentativa):
+        # `tentativa()` faz o pedido (pelo governador, que chama `enviar`)
+        for numero in range(1, self.tentativas + 1):
+            teste = self.disjuntor.permitir()
+            try:
+                return tentativa()
+            except Exception as e:
+                espera = self.espera(e, numero)
+                if espera is None:
+                    self.desistir(e)
+                self.registrar_nova_tentativa(e, espera)
+            finally:
+                if teste:
+                    self.disjuntor.fim_do_teste()
+            time.sleep(espera)
+
+    async def achamar(self, tentativa):
+        for numero in range(1, self.tentativas + 1):
+            teste = self.disjuntor.permitir()
+            try:
+                return await tentativa()
+            except Exception as e:
+                espera = self.espera(e, numero)
+                if espera is None:
+                    self.desistir(e)
+                self.registrar_nova_tentativa(e, espera)
+            finally:
+                if teste:
+                    self.disjuntor.fim_do_teste()
+            await asyncio.sleep(espera)
+
+    def desistir(self, erro):
+        # Sem mais tentativas, o erro do provedor vira uma resposta da API: 429 é o limite do
+        # provedor (503 com o Retry-After dele), falha do provedor é 503 (com a pausa do
+        # disjuntor, se ele abriu) e qualquer outra recusa é 502. O texto do provedor fica no log.
+        if not isinstance(erro, (groq.APIStatusError, groq.APIConnectionError)):
+            raise erro
+        logger.warning("Chamada à LLM falhou sem mais tentativas (%s): %s", motivo(erro), erro)
+        if isinstance(erro, groq.APIStatusError) and erro.status_code == 429:
+            raise LimiteLLMExcedido(retry_after(erro) or ESPERA_429_PADRAO) from erro
+        if falha_do_provedor(erro):
+            espera = self.disjuntor.pausa if self.disjuntor.aberto else retry_after(erro) or self.recuo_maximo
+            raise LLMIndisponivel(espera) from erro
+        raise LLMRecusou() from erro
+
+    def registrar_nova_tentativa(self, erro, espera):
+        metricas.LLM_NOVAS_TENTATIVAS.inc(motivo=motivo(erro))
+        logger.info("Chamada à LLM falhou (%s); nova tentativa em %.2fs", motivo(erro), espera)
+
+
+_transporte = None
+_transporte_lock = threading.Lock()
+
+
+def obter():
+    global _transporte
+    with _transporte_lock:
+        if _transporte is None:
+            _transporte = Transporte(settings.LLM_TRANSPORTE)
+    return _transporte
+
+
+def reiniciar():
+    # Descarta o estado do disjuntor; a próxima chamada lê LLM_TRANSPORTE de novo
+    global _transporte
+    with _transporte_lock:
+        _transporte = None
+
+
+@receiver(setting_changed)
+def _recarregar(setting, **kwargs):
+    # Novas tentativas e disjuntor; os clientes de provas.llm são criados uma vez na importação
+    if setting == 'LLM_TRANSPORTE':
+        reiniciar()
@@ -1,8 +1,27 @@
 from django.urls import path
-from .views import GerarProvaView, DetalharProvaView, DetalharGabaritoView
+from .views import (GerarProvaView, GerarProvaStreamView, DetalharProvaView, DetalharGabaritoView, DetalharJobView, BuscarQuestoesView,
+                    ListarProvasView, ListarQuestoesView, PdfProvaView, PdfGabaritoView,
+                    ExportarProvasView, GerarLoteView, DetalharLoteView, VariantesProvaView)
+from .views_async import AsyncGerarProvaView, AsyncDetalharProvaView, AsyncDetalharGabaritoView
 
 urlpatterns = [
     path('gerar-prova/', GerarProvaView.as_view(), name='gerar-prova'),
+    path('gerar-prova/stream/', GerarProvaStreamView.as_view(), name='gerar-prova-stream'),
+    path('gerar-prova/lote/', GerarLoteView.as_view(), name='gerar-lote'),
+    path('provas/', ListarProvasView.as_view(), name='listar-provas'),
+    path('provas/exportar/', ExportarProvasView.as_view(), name='exportar-provas'),
     path('provas/<int:id>/', DetalharProvaView.as_view(), name='detalhar-prova'),
     path('gabarito/<int:prova__id>/', DetalharGabaritoView.as_view(), name='detalhar-gabarito'),
-]
\ No newline at end of file
+    path('provas/<int:id>/variantes/', VariantesProvaView.as_view(), name='variantes-prova'),
+    path('provas/<int:id>/pdf/', PdfProvaView.as_view(), name='pdf-prova'),
+    path('gabarito/<int:id>/pdf/', PdfGabaritoView.as_view(), name='pdf-gabarito'),
+    path('jobs/<int:id>/', DetalharJobView.as_view(), name='detalhar-job'),
+    path('lotes/<int:id>/', DetalharLoteView.as_view(), name='detalhar-lote'),
+    path('questoes/', ListarQuestoesView.as_view(), name='listar-questoes'),
+    path('questoes/search/', BuscarQuestoesView.as_view(), name='buscar-questoes'),
+
+    # Versões assíncronas (servidor ASGI)
+    path('async/gerar-prova/', AsyncGerarProvaView.as_view(), name='async-gerar-prova'),
+    path('async/provas/<int:id>/', AsyncDetalharProvaView.as_view(), name='async-detalhar-prova'),
+    path('async/gabarito/<int:prova__id>/', AsyncDetalharGabaritoView.as_view(), name='async-detalhar-gabarito'),
+]
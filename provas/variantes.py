@@ -0,0 +1,112 @@
+import json
+import re
+
+import numpy as np
+
+from . import snapshots
+from .models import CriteriosProva, SnapshotProva, TipoQuestao, prefetch_questoes
+from .pdf import LETRAS
+
+# Variantes de uma prova (contra cola): a ordem das questões e a das opções de múltipla
+# escolha são embaralhadas, e o gabarito é remapeado. Nada é gravado: cada variante é
+# calculada a partir da seed, com as permutações de todas as variantes sorteadas de uma vez
+# com NumPy (argsort de uma matriz de números aleatórios).
+#
+# Os sorteios são por linha, em fluxos separados da seed: a variante i de uma seed é a
+# mesma qualquer que seja o número de variantes pedido.
+
+LETRA_RESPOSTA = re.compile(r'^\(?([A-Za-z])\s*(?:[).:\-]|$)')
+
+
+def indice_correto(opcoes, resposta):
+    # Posição da opção certa, pela letra ("B", "b)", "B - texto") ou pelo texto da opção;
+    # None se a resposta não identifica uma opção (a questão fica sem embaralhar)
+    texto = str(resposta).strip()
+    normalizadas = [opcao.strip().casefold() for opcao in opcoes]
+    if texto.casefold() in normalizadas:
+        return normalizadas.index(texto.casefold())
+    letra = LETRA_RESPOSTA.match(texto)
+    if letra:
+        indice = ord(letra.group(1).upper()) - ord('A')
+        if indice < len(opcoes):
+            return indice
+    return None
+
+
+def sortear(n, alternativas, corretas, seed):
+    # alternativas[j]: opções a embaralhar na questão j (0: não embaralha); corretas[j]: posição da certa.
+    # Devolve a ordem das questões (n, q), as permutações das opções por questão ({j: (n, k)})
+    # e a nova posição da certa (n, q), -1 nas questões não embaralhadas
+    alternativas = np.asarray(alternativas, dtype=np.int64)
+    corretas = np.asarray(corretas, dtype=np.int64)
+    ordem = np.random.default_rng([seed, 0]).random((n, len(alternativas))).argsort(axis=1)
+    permutacoes = {}
+    novas_corretas = np.full((n, len(alternativas)), -1, dtype=np.int64)
+    # Questões com o mesmo número de opções são sorteadas juntas, em um bloco (n, questões, k)
+    for k in np.unique(alternativas[alternativas > 1]).tolist():
+        colunas = np.flatnonzero(alternativas == k)
+        bloco = np.random.default_rng([seed, 1, k]).random((n, len(colunas), k)).argsort(axis=2)
+        novas_corretas[:, colunas] = (bloco == corretas[colunas][None, :, None]).argmax(axis=2)
+        for posicao, coluna in enumerate(colunas.tolist()):
+            permutacoes[coluna] = bloco[:, posicao, :]
+    return ordem, permutacoes, novas_corretas
+
+
+def carregar(prova_id):
+    # Questões (como em GET /api/provas/{id}/) e respostas do gabarito, do snapshot da prova
+    # ou, se não houver snapshot na versão atual, do banco
+    linha = (
+        SnapshotProva.objects.filter(prova_id=prova_id, versao=snapshots.VERSAO)
+        .values_list('prova_json', 'gabarito_json')
+        .first()
+    )
+    if linha is None:
+        prova = CriteriosProva.objects.select_related('gabarito').prefetch_related(prefetch_questoes()).get(id=prova_id)
+        linha = snapshots.renderizar(prova)
+    prova_json, gabarito_json = linha
+    respostas = json.loads(bytes(gabarito_json))['respostas'] if gabarito_json is not None else {}
+    return json.loads(bytes(prova_json))['questoes'], respostas
+
+
+def gerar(questoes, respostas, n, seed):
+    # Lista de n variantes: questões na nova ordem (opções e resposta remapeadas) e gabarito
+    respostas = [respostas.get(str(questao['id']), questao['resposta']) for questao in questoes]
+    alternativas, corretas = [], []
+    for questao, resposta in zip(questoes, respostas):
+        opcoes = questao.get('opcoes') or []
+        indice = None
+        if questao['tipo'] == TipoQuestao.MULTIPLA_ESCOLHA and 1 < len(opcoes) <= len(LETRAS):
+            indice = indice_correto(opcoes, resposta)
+        alternativas.append(len(opcoes) if indice is not None else 0)
+        corretas.append(indice if indice is not None else -1)
+
+    ordem, permutacoes, novas_corretas = sortear(n, alternativas, corretas, seed)
+    # Uma questão de k opções tem no máximo k! arranjos: cada um é montado uma vez, e as
+    # variantes com o mesmo arranjo compartilham o dicionário
+    codigos = {j: (bloco * bloco.shape[1] ** np.arange(bloco.shape[1])).sum(axis=1).tolist() for j, bloco in permutacoes.items()}
+    arranjos = {}
+    ordem = ordem.tolist()
+    novas_corretas = novas_corretas.tolist()
+    ids = [str(questao['id']) for questao in questoes]
+
+    variantes = []
+    for i in range(n):
+        questoes_variante, gabarito = [], {}
+        for j in ordem[i]:
+            if j in codigos:
+                chave = (j, codigos[j][i])
+                questao = arranjos.get(chave)
+                if questao is None:
+                    opcoes = questoes[j]['opcoes']
+                    questao = arranjos[chave] = {
+                        **questoes[j],
+                        'opcoes': [opcoes[k] for k in permutacoes[j][i].tolist()],
+                        'resposta': LETRAS[novas_corretas[i][j]],
+                    }
+                questoes_variante.append(questao)
+                gabarito[ids[j]] = questao['resposta']
+            else:
+                questoes_variante.append(questoes[j])
+                gabarito[ids[j]] = respostas[j]
+        variantes.append({'numero': i + 1, 'questoes': questoes_variante, 'gabarito': gabarito})
+    return variantes
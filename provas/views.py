@@ -1,16 +1,29 @@
+import json
+import logging
+from datetime import datetime, time
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
 from rest_framework import generics, status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
-from .models import CriteriosProva, Questao, Gabarito
-from .serializers import CriteriosProvaSerializer, QuestaoSerializer, GabaritoSerializer
-from groq import Groq  # Importe a biblioteca do Groq
-import os
-import json #Já importe aqui
-from dotenv import load_dotenv
+from .models import (CriteriosProva, Gabarito, JobGeracao, LoteGeracao, NivelDificuldade, Questao, TipoQuestao,
+                     prefetch_questoes)
+from .serializers import (CriteriosProvaSerializer, QuestaoSerializer, GabaritoSerializer, JobGeracaoSerializer,
+                          ResumoProvaSerializer, QuestaoListagemSerializer, LoteGeracaoSerializer)
+from .geracao import gerar_questoes, gerar_questoes_em_fluxo
+from .cache_leitura import RespostaCacheadaMixin
+from .parsers import CSVParser, JSONLinesParser, JSONLParser
+from . import banco_questoes, busca, exportacao, jobs, metricas, pdf, variantes
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# Configure o cliente do Groq com a chave da API
-client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
 
 class GerarProvaView(generics.CreateAPIView):
     serializer_class = CriteriosProvaSerializer
@@ -18,108 +31,322 @@ class GerarProvaView(generics.CreateAPIView):
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        criterios = serializer.save()
+        usar_cache = usar_cache_geracao(request)
+        # ?banco=true: monta a prova com questões já existentes e só gera o que faltar
+        usar_banco = parametro_verdadeiro(request.query_params.get('banco'))
+
+        # Modo job: ?assincrono=true devolve 202 e a geração roda fora da requisição
+        if parametro_verdadeiro(request.query_params.get('assincrono')):
+            criterios = serializer.save(criado_por=request.user)
+            job = JobGeracao.objects.create(prova=criterios, usar_cache=usar_cache, usar_banco=usar_banco)
+            jobs.enfileirar(job)
+            job.refresh_from_db()
+            return Response(
+                JobGeracaoSerializer(job).data,
+                status=status.HTTP_202_ACCEPTED,
+                headers={'Location': reverse('detalhar-job', kwargs={'id': job.id})},
+            )
 
         # --- Lógica para gerar questões com o Groq ---
-        prompt = self.criar_prompt(criterios)
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
-            model="mixtral-8x7b-32768",  # Modelo da LLM
-            
-        
-        )
+        # Os critérios só são gravados depois da LLM, junto com questões e gabarito
+        criterios = CriteriosProva(criado_por=request.user, **serializer.validated_data)
+        gerar_questoes(criterios, usar_cache=usar_cache, usar_banco=usar_banco)
+
+        with metricas.fase('renderizar'):
+            dados = CriteriosProvaSerializer(criterios).data
+        return Response(dados, status=status.HTTP_201_CREATED)
 
-        # --- Processar a resposta do Groq ---
-        questoes_geradas = self.processar_resposta_groq(chat_completion, criterios)
+class GerarLoteView(generics.CreateAPIView):
+    # Várias provas de uma vez: corpo JSONL (uma linha por prova), CSV com cabeçalho ou lista JSON.
+    # Todas as linhas são validadas antes de gravar qualquer uma; a geração roda como jobs,
+    # limitada pelo pool de workers, e o andamento fica em GET /api/lotes/{id}/.
+    serializer_class = CriteriosProvaSerializer
+    parser_classes = [JSONLinesParser, JSONLParser, CSVParser, JSONParser]
 
-        # --- Criar as questões no banco de dados ---
-        for questao_data in questoes_geradas:
-            Questao.objects.create(prova=criterios, **questao_data)
+    def create(self, request, *args, **kwargs):
+        linhas = request.data
+        if not isinstance(linhas, list) or not linhas:
+            raise ValidationError({'detail': 'Envie ao menos uma linha de critérios.'})
+        maximo = settings.GERACAO_JOBS['MAX_LINHAS_LOTE']
+        if len(linhas) > maximo:
+            raise ValidationError({'detail': f"O lote tem {len(linhas)} linhas; o máximo é {maximo}."})
 
-        # --- Criar o gabarito ---
-        respostas = {str(questao.id): questao.resposta for questao in criterios.questoes.all()}
-        Gabarito.objects.create(prova=criterios, respostas=respostas)
+        serializer = self.get_serializer(data=linhas, many=True)
+        if not serializer.is_valid():
+            erros = [{'linha': linha, 'erros': erro} for linha, erro in enumerate(serializer.errors, start=1) if erro]
+            return Response({'linhas': erros}, status=status.HTTP_400_BAD_REQUEST)
 
+        lote, lideres = jobs.criar_lote(
+            request.user, serializer.validated_data,
+            usar_cache=usar_cache_geracao(request),
+            usar_banco=parametro_verdadeiro(request.query_params.get('banco')),
+        )
+        for job in lideres:
+            jobs.enfileirar(job)
+        lote = DetalharLoteView.queryset.get(id=lote.id)
         return Response(
-            CriteriosProvaSerializer(criterios).data,
-            status=status.HTTP_201_CREATED
+            LoteGeracaoSerializer(lote).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': reverse('detalhar-lote', kwargs={'id': lote.id})},
         )
 
-    def criar_prompt(self, criterios):
-        # Constrói o prompt para o Groq
-        prompt = f"""
-        Gere {criterios.quantidade_questoes} questões sobre o tema '{criterios.tema}',
-        com nível de dificuldade '{criterios.get_dificuldade_display()}'
-        e com os seguintes tipos: {criterios.get_tipos_questoes_display()}.
-        """
-        if criterios.curriculo:
-            prompt += f" Considere o seguinte currículo: {criterios.curriculo}."
-
-        prompt += """
-        Retorne as questões e respostas no seguinte formato JSON:
-        {
-          "questoes": [
-            {
-              "tipo": "multipla_escolha",
-              "enunciado": "...",
-              "opcoes": ["...", "..."],
-              "resposta": "...",
-              "nivel_dificuldade": "..."
-            },
-            {
-              "tipo": "dissertativa",
-              "enunciado": "...",
-              "resposta": "...",
-              "nivel_dificuldade": "..."
-            }
-          ]
-        }
-        """
-        return prompt
+class GerarProvaStreamView(generics.CreateAPIView):
+    # Mesma entrada de GerarProvaView, mas devolve as questões via Server-Sent Events
+    serializer_class = CriteriosProvaSerializer
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        criterios = serializer.save(criado_por=request.user)
+
+        response = StreamingHttpResponse(
+            self.eventos(criterios, usar_cache_geracao(request)),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Evita que o nginx acumule o stream
+        return response
 
-    def processar_resposta_groq(self, chat_completion, criterios):
-      # Extrai as questões e respostas do JSON retornado pelo Groq
+    def eventos(self, criterios, usar_cache):
+        yield evento_sse('prova', {'id': criterios.id})
+        total = 0
         try:
-            resposta_json = chat_completion.choices[0].message.content
-            resposta = json.loads(resposta_json)
-            questoes = resposta.get("questoes", [])
-
-            # Valida e formata os dados das questões
-            questoes_formatadas = []
-            for questao in questoes:
-                tipo = questao.get("tipo")
-                enunciado = questao.get("enunciado")
-                resposta_questao = questao.get("resposta")
-                nivel = questao.get("nivel_dificuldade")
-                opcoes = questao.get("opcoes", None)
-
-                if not all([tipo, enunciado, resposta_questao]):
-                    continue
-
-                questao_formatada = {
-                    "tipo": tipo,
-                    "enunciado": enunciado,
-                    "resposta": resposta_questao,
-                    "nivel_dificuldade": nivel,
-                    "opcoes": opcoes
-                }
-                questoes_formatadas.append(questao_formatada)
-            return questoes_formatadas
-
-        except (json.JSONDecodeError, AttributeError) as e:
-            print(f"Erro ao processar a resposta do Groq: {e}")
-            return []
-class DetalharProvaView(generics.RetrieveAPIView):
-    queryset = CriteriosProva.objects.all()
+            for questao in gerar_questoes_em_fluxo(criterios, usar_cache=usar_cache):
+                total += 1
+                yield evento_sse('questao', QuestaoSerializer(questao).data)
+        except APIException as e:
+            # Erros da própria API (limite, LLM indisponível): o texto é nosso, não do provedor
+            yield evento_sse('erro', {'detail': str(e.detail), 'code': e.default_code})
+        except Exception:
+            logger.exception("Falha no stream da prova %s", criterios.id)
+            yield evento_sse('erro', {'detail': "Falha ao gerar a prova.", 'code': 'erro'})
+        yield evento_sse('fim', {'id': criterios.id, 'quantidade_questoes': total})
+
+
+def parametro_verdadeiro(valor):
+    return (valor or '').lower() in ('1', 'true', 'sim')
+
+
+def usar_cache_geracao(request):
+    # ?cache=false ou "Cache-Control: no-cache" força uma nova chamada à LLM
+    if request.GET.get('cache', '').lower() in ('0', 'false', 'nao'):
+        return False
+    return 'no-cache' not in request.headers.get('Cache-Control', '')
+
+
+def evento_sse(evento, dados):
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+
+class DetalharProvaView(RespostaCacheadaMixin, generics.RetrieveAPIView):
+    queryset = CriteriosProva.objects.prefetch_related(prefetch_questoes())
     serializer_class = CriteriosProvaSerializer
     lookup_field = 'id'
+    tipo_cache = 'prova'
 
-class DetalharGabaritoView(generics.RetrieveAPIView):
-    queryset = Gabarito.objects.all()
+class DetalharGabaritoView(RespostaCacheadaMixin, generics.RetrieveAPIView):
+    queryset = Gabarito.objects.select_related('prova')
     serializer_class = GabaritoSerializer
-    lookup_field = 'prova__id'
\ No newline at end of file
+    lookup_field = 'prova__id'
+    tipo_cache = 'gabarito'
+    compartilhavel = False
+
+class DetalharJobView(generics.RetrieveAPIView):
+    queryset = JobGeracao.objects.all()
+    serializer_class = JobGeracaoSerializer
+    lookup_field = 'id'
+
+class DetalharLoteView(generics.RetrieveAPIView):
+    queryset = LoteGeracao.objects.prefetch_related(Prefetch('jobs', queryset=JobGeracao.objects.order_by('linha')))
+    serializer_class = LoteGeracaoSerializer
+    lookup_field = 'id'
+
+class VariantesProvaView(generics.GenericAPIView):
+    # ?n=30&seed=123: n versões da prova com questões e opções embaralhadas, cada uma com o
+    # gabarito remapeado, calculadas na hora sem chamar a LLM. A mesma seed dá sempre as mesmas
+    # variantes; sem seed, usa o id da prova.
+    max_variantes = 1000
+
+    def get(self, request, id):
+        n = inteiro_do_parametro(request, 'n', 4, 1, self.max_variantes)
+        seed = inteiro_do_parametro(request, 'seed', id, 0, None)
+        try:
+            questoes, respostas = variantes.carregar(id)
+        except CriteriosProva.DoesNotExist:
+            raise Http404
+        with metricas.fase('variantes'):
+            lista = variantes.gerar(questoes, respostas, n, seed)
+        return Response({'prova': id, 'seed': seed, 'variantes': lista})
+
+
+def inteiro_do_parametro(request, parametro, padrao, minimo, maximo):
+    valor = request.GET.get(parametro)
+    if valor in (None, ''):
+        return padrao
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise ValidationError({parametro: f"Valor inválido: {valor}."})
+    if numero < minimo or (maximo is not None and numero > maximo):
+        limites = f"entre {minimo} e {maximo}" if maximo is not None else f"maior ou igual a {minimo}"
+        raise ValidationError({parametro: f"Use um número {limites}."})
+    return numero
+
+class PdfView(generics.GenericAPIView):
+    # PDF pronto em disco (pré-renderizado na criação da prova) ou renderizado agora
+    tipo_pdf = None
+
+    def get(self, request, id):
+        try:
+            caminho = pdf.obter(self.tipo_pdf, id)
+        except CriteriosProva.DoesNotExist:
+            raise Http404
+        nome = f"{self.tipo_pdf}-{id}.pdf"
+        prefixo = settings.PROVAS_PDF['X_ACCEL_REDIRECT']
+        if prefixo:
+            # O nginx entrega o arquivo (location interna apontando para PROVAS_PDF['DIRETORIO'])
+            response = HttpResponse(content_type='application/pdf')
+            response['X-Accel-Redirect'] = prefixo.rstrip('/') + '/' + pdf.nome_arquivo(self.tipo_pdf, id)
+            response['Content-Disposition'] = f'inline; filename="{nome}"'
+            return response
+        return FileResponse(open(caminho, 'rb'), content_type='application/pdf', filename=nome)
+
+class PdfProvaView(PdfView):
+    tipo_pdf = 'prova'
+
+class PdfGabaritoView(PdfView):
+    tipo_pdf = 'gabarito'
+
+
+class PaginacaoPorCursor(CursorPagination):
+    # Keyset em (-criado_em, -id), coberto pelos índices *_criado_idx: sem OFFSET,
+    # o custo de uma página funda é o mesmo da primeira
+    ordering = ('-criado_em', '-id')
+    page_size_query_param = 'tamanho'
+    max_page_size = 100
+
+
+def data_do_filtro(request, parametro):
+    # Aceita data (AAAA-MM-DD) ou data e hora ISO 8601
+    valor = request.GET.get(parametro)
+    if not valor:
+        return None
+    try:
+        data_hora = parse_datetime(valor)
+        if data_hora is None:
+            data = parse_date(valor)
+            data_hora = datetime.combine(data, time.min) if data else None
+    except ValueError:
+        data_hora = None
+    if data_hora is None:
+        raise ValidationError({parametro: f"Data inválida: {valor}."})
+    if timezone.is_naive(data_hora):
+        data_hora = timezone.make_aware(data_hora)
+    return data_hora
+
+
+def filtrar_por_criacao(queryset, request):
+    criado_apos = data_do_filtro(request, 'criado_apos')
+    criado_antes = data_do_filtro(request, 'criado_antes')
+    if criado_apos:
+        queryset = queryset.filter(criado_em__gte=criado_apos)
+    if criado_antes:
+        queryset = queryset.filter(criado_em__lt=criado_antes)
+    return queryset
+
+
+def filtrar_provas(queryset, request):
+    filtros = {
+        'tema': request.GET.get('tema'),
+        'dificuldade': request.GET.get('dificuldade'),
+        'tipos_questoes': request.GET.get('tipo'),
+    }
+    queryset = queryset.filter(**{campo: valor for campo, valor in filtros.items() if valor})
+    return filtrar_por_criacao(queryset, request)
+
+
+class ListarProvasView(generics.ListAPIView):
+    # Filtros: tema, dificuldade, tipo, criado_apos, criado_antes
+    serializer_class = ResumoProvaSerializer
+    pagination_class = PaginacaoPorCursor
+
+    def get_queryset(self):
+        return filtrar_provas(CriteriosProva.objects.all(), self.request)
+
+
+class ExportarProvasView(generics.GenericAPIView):
+    # ZIP com prova e gabarito (JSON e/ou PDF) de todas as provas do filtro, gerado em fluxo.
+    # Filtros iguais aos de ListarProvasView; ?formatos=json,pdf escolhe o conteúdo.
+    tamanho_lote = 100
+
+    def get(self, request):
+        formatos = [f.strip() for f in request.GET.get('formatos', ','.join(exportacao.FORMATOS)).split(',') if f.strip()]
+        invalidos = [f for f in formatos if f not in exportacao.FORMATOS]
+        if invalidos or not formatos:
+            raise ValidationError({'formatos': f"Use um ou mais de: {', '.join(exportacao.FORMATOS)}."})
+        provas = filtrar_provas(CriteriosProva.objects.all(), request)
+        response = StreamingHttpResponse(
+            exportacao.gerar_zip(provas, formatos, self.tamanho_lote),
+            content_type='application/zip',
+        )
+        nome = f"provas-{timezone.now():%Y%m%d-%H%M%S}.zip"
+        response['Content-Disposition'] = f'attachment; filename="{nome}"'
+        return response
+
+
+class ListarQuestoesView(generics.ListAPIView):
+    # Filtros: tema, dificuldade, tipo, criado_apos, criado_antes
+    serializer_class = QuestaoListagemSerializer
+    pagination_class = PaginacaoPorCursor
+
+    def get_queryset(self):
+        queryset = Questao.objects.all()
+        tema = self.request.GET.get('tema')
+        filtros = {
+            'tema': banco_questoes.normalizar_tema(tema) if tema else None,  # O banco guarda o tema normalizado
+            'nivel_dificuldade': self.request.GET.get('dificuldade'),
+            'tipo': self.request.GET.get('tipo'),
+        }
+        queryset = queryset.filter(**{campo: valor for campo, valor in filtros.items() if valor})
+        return filtrar_por_criacao(queryset, self.request)
+
+
+class BuscarQuestoesView(generics.GenericAPIView):
+    # Busca textual no banco de questões, ordenada por relevância e paginada por cursor
+    # (posição rank/id da última questão): não usa OFFSET nem COUNT.
+    serializer_class = QuestaoSerializer
+    tamanho_pagina = 20
+
+    def get(self, request):
+        consulta = request.GET.get('q', '').strip()
+        if not consulta:
+            raise ValidationError({'q': 'Informe o texto a buscar.'})
+        tipo = request.GET.get('tipo')
+        if tipo and tipo not in TipoQuestao.values:
+            raise ValidationError({'tipo': f"Valor inválido: {tipo}."})
+        nivel = request.GET.get('nivel_dificuldade')
+        if nivel and nivel not in NivelDificuldade.values:
+            raise ValidationError({'nivel_dificuldade': f"Valor inválido: {nivel}."})
+        depois = None
+        if request.GET.get('cursor'):
+            try:
+                depois = busca.decodificar_cursor(request.GET['cursor'])
+            except ValueError as e:
+                raise ValidationError({'cursor': str(e)})
+
+        # Um a mais para saber se existe próxima página
+        encontrados = busca.buscar(consulta, tipo, nivel, depois, limite=self.tamanho_pagina + 1)
+        pagina = encontrados[:self.tamanho_pagina]
+        questoes = Questao.objects.in_bulk([questao_id for questao_id, _ in pagina])
+
+        proxima = None
+        if len(encontrados) > self.tamanho_pagina:
+            parametros = request.GET.copy()
+            parametros['cursor'] = busca.codificar_cursor([pagina[-1][1], pagina[-1][0]])
+            proxima = request.build_absolute_uri(f"{request.path}?{parametros.urlencode()}")
+
+        resultados = []
+        for questao_id, rank in pagina:
+            if questao_id in questoes:  # Pode ter sido apagada entre as consultas
+                resultados.append({**self.get_serializer(questoes[questao_id]).data, 'rank': rank})
+        return Response({'next': proxima, 'results': resultados})
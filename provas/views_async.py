@@ -0,0 +1,106 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import metricas
+from .geracao import agerar_questoes
+from .models import CriteriosProva, Gabarito, prefetch_questoes
+from .serializers import CriteriosProvaSerializer, GabaritoSerializer
+from .views import parametro_verdadeiro, usar_cache_geracao
+
+
+# Versões assíncronas das views de provas, para rodar sob ASGI (uvicorn).
+# Enquanto a LLM responde, a requisição não prende nenhuma thread do servidor.
+
+class AsyncAPIView(View):
+    # Base: autenticação JWT (como no DRF) e respostas de erro no mesmo formato
+    autenticacao = JWTAuthentication()
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # Autenticação por token, sem sessão: CSRF não se aplica (igual ao APIView do DRF)
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            resultado = await sync_to_async(self.autenticacao.authenticate)(request)
+        except exceptions.AuthenticationFailed as e:
+            return self.nao_autenticado(e)
+        if resultado is None:
+            return self.nao_autenticado(exceptions.NotAuthenticated())
+        request.user, request.auth = resultado
+        return await super().dispatch(request, *args, **kwargs)
+
+    def nao_autenticado(self, erro):
+        response = JsonResponse({'detail': erro.detail}, status=status.HTTP_401_UNAUTHORIZED)
+        response['WWW-Authenticate'] = self.autenticacao.authenticate_header(self.request)
+        return response
+
+    def erro_da_api(self, erro):
+        # Mesmo formato do exception handler do DRF (ex.: 503 do governador da LLM)
+        response = JsonResponse({'detail': erro.detail}, status=erro.status_code)
+        if getattr(erro, 'wait', None):
+            response['Retry-After'] = str(erro.wait)
+        return response
+
+    def nao_encontrado(self):
+        return JsonResponse({'detail': str(exceptions.NotFound().detail)}, status=status.HTTP_404_NOT_FOUND)
+
+    async def obter_prova(self, id):
+        try:
+            return await CriteriosProva.objects.prefetch_related(prefetch_questoes()).aget(id=id)
+        except CriteriosProva.DoesNotExist:
+            return None
+
+
+class AsyncGerarProvaView(AsyncAPIView):
+    async def post(self, request, *args, **kwargs):
+        try:
+            dados = json.loads(request.body or b'{}')
+        except json.JSONDecodeError as e:
+            return JsonResponse({'detail': f'JSON inválido: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = CriteriosProvaSerializer(data=dados)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        # Gravado por agerar_questoes, na mesma transação das questões
+        criterios = CriteriosProva(criado_por=request.user, **serializer.validated_data)
+
+        try:
+            await agerar_questoes(
+                criterios,
+                usar_cache=usar_cache_geracao(request),
+                usar_banco=parametro_verdadeiro(request.GET.get('banco')),
+            )
+        except exceptions.APIException as e:
+            return self.erro_da_api(e)
+
+        with metricas.fase('renderizar'):
+            dados = CriteriosProvaSerializer(criterios).data
+        response = JsonResponse(dados, status=status.HTTP_201_CREATED)
+        response['Location'] = reverse('detalhar-prova', kwargs={'id': criterios.id})
+        return response
+
+
+class AsyncDetalharProvaView(AsyncAPIView):
+    async def get(self, request, id):
+        criterios = await self.obter_prova(id)
+        if criterios is None:
+            return self.nao_encontrado()
+        return JsonResponse(CriteriosProvaSerializer(criterios).data)
+
+
+class AsyncDetalharGabaritoView(AsyncAPIView):
+    async def get(self, request, prova__id):
+        try:
+            gabarito = await Gabarito.objects.aget(prova__id=prova__id)
+        except Gabarito.DoesNotExist:
+            return self.nao_encontrado()
+        return JsonResponse(GabaritoSerializer(gabarito).data)